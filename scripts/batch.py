@@ -0,0 +1,317 @@
+"""Render decision calendars for many basins in parallel.
+
+Each basin is rendered in its own worker process (matplotlib is not thread
+safe), so a crash, timeout or out-of-memory kill only fails that basin.
+
+Usage:
+    python batch.py ../config/manifest.yaml --jobs 4 --memory-limit 4096
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import traceback
+from multiprocessing.connection import wait
+
+import yaml
+
+from output_cache import MANIFEST_NAME
+
+REPORT_NAME = 'batch_report.json'
+
+
+def load_manifest(path):
+    """Load a manifest and resolve each basin's paths relative to the manifest file.
+
+    Returns a list of job dicts with keys basin, config, streamflow_csv, swe_csv,
+    center_image, output and dpi.
+    """
+    with open(path, 'r') as file:
+        manifest = yaml.safe_load(file)
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    defaults = manifest.get('defaults', {})
+    output_dir = os.path.join(base_dir, defaults.get('output_dir', '.'))
+
+    def resolve(value):
+        return os.path.normpath(os.path.join(base_dir, value)) if value else None
+
+    jobs = []
+    for basin, spec in manifest['basins'].items():
+        if 'config' not in spec:
+            raise ValueError(f"Basin '{basin}' in manifest has no config.")
+        output = spec.get('output', f"{basin}_decision_calendars.png")
+        jobs.append({
+            'basin': basin,
+            'config': resolve(spec['config']),
+            'streamflow_csv': resolve(spec.get('streamflow_csv')),
+            'swe_csv': resolve(spec.get('swe_csv')),
+            'center_image': resolve(spec.get('center_image')),
+            'output': os.path.normpath(os.path.join(output_dir, output)),
+            'dpi': spec.get('dpi', defaults.get('dpi', 300)),
+        })
+    return jobs
+
+
+def compile_snapshots(jobs, snapshot_dir):
+    """Validate each distinct config once and point the jobs at its compiled snapshot.
+
+    Workers then load the snapshot instead of parsing the YAML. Returns the
+    jobs that can run and report entries for those whose config is invalid.
+    """
+    from compiled_config import compile_file, write_snapshot, SNAPSHOT_SUFFIX
+
+    snapshots = {}
+    runnable, invalid = [], []
+    for job in jobs:
+        config = job['config']
+        if config not in snapshots:
+            try:
+                compiled = compile_file(config)
+                name = f"{len(snapshots)}_{os.path.splitext(os.path.basename(config))[0]}{SNAPSHOT_SUFFIX}"
+                snapshots[config] = write_snapshot(compiled, os.path.join(snapshot_dir, name))
+            except (OSError, ValueError) as exc:
+                snapshots[config] = exc
+        if isinstance(snapshots[config], Exception):
+            exc = snapshots[config]
+            invalid.append({'status': 'failed', 'error': f"{type(exc).__name__}: {exc}", 'basin': job['basin'],
+                            'output': job['output'], 'seconds': 0.0, 'exitcode': None})
+            print(f"[failed] {job['basin']}: invalid config {config}")
+        else:
+            runnable.append(dict(job, config=snapshots[config]))
+    return runnable, invalid
+
+
+def _limit_memory(memory_limit_mb):
+    """Cap the address space of the current process (Unix only)."""
+    try:
+        import resource
+    except ImportError:
+        print("Memory limits are not supported on this platform.", file=sys.stderr)
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def render_job(job, cache_dir=None, profile=False, manifest_path=None, force=False):
+    """Render a single basin and return its stage timings in seconds.
+
+    With manifest_path, a basin whose inputs match an output recorded in
+    that manifest (see output_cache.OutputManifest) is not rendered, and
+    the result holds the manifest entry for the parent to record. With
+    profile=True the result also holds the calendar's per-stage profile
+    (see profiling.RenderProfiler), including peak memory.
+    """
+    from plotting import HEADLESS_ENV, pyplot
+    # Workers only write files; select Agg even when a display is available
+    os.environ[HEADLESS_ENV] = '1'
+    from decision_calendars import DecisionCalendar
+
+    cache = None
+    if cache_dir is not None:
+        from cache import ClimatologyCache
+        cache = ClimatologyCache(cache_dir)
+
+    profiler = None
+    if profile:
+        from profiling import RenderProfiler
+        profiler = RenderProfiler(memory=True, label=job['config'])
+
+    timings = {}
+    start = time.perf_counter()
+    calendar = DecisionCalendar(config_path=job['config'],
+                                streamflow_csv=job['streamflow_csv'],
+                                swe_csv=job['swe_csv'],
+                                cache=cache,
+                                profiler=profiler)
+    timings['load'] = time.perf_counter() - start
+
+    os.makedirs(os.path.dirname(job['output']), exist_ok=True)
+    result = {'timings': timings}
+    if manifest_path is not None:
+        from output_cache import OutputManifest
+        manifest = OutputManifest(manifest_path, read_only=True)
+        entry = calendar.render_file(job['output'], center_image=job['center_image'], dpi=job['dpi'],
+                                     manifest=manifest, force=force)
+        result['cached'] = entry.pop('cached')
+        if not result['cached']:
+            timings.update(entry['timings'])
+        result['artifact'] = {'entry': entry, 'files': manifest.input_hashes(entry)}
+    else:
+        start = time.perf_counter()
+        fig = calendar.create_plot(center_image=job['center_image'])
+        timings['plot'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        calendar.save_plot(fig, job['output'], dpi=job['dpi'])
+        pyplot().close(fig)
+        timings['save'] = time.perf_counter() - start
+
+    if cache is not None:
+        result['cache'] = cache.stats()
+    if profiler is not None:
+        profiler.stop()
+        result['profile'] = profiler.to_dict()
+    return result
+
+
+def _worker(conn, job, cache_dir, memory_limit_mb, profile=False, manifest_path=None, force=False):
+    """Worker process entry point: render a job and send the outcome back."""
+    if memory_limit_mb:
+        _limit_memory(memory_limit_mb)
+    try:
+        result = render_job(job, cache_dir, profile, manifest_path, force)
+        result['status'] = 'ok'
+    except MemoryError:
+        result = {'status': 'failed', 'error': 'MemoryError: memory limit exceeded'}
+    except Exception as exc:
+        result = {'status': 'failed', 'error': f"{type(exc).__name__}: {exc}",
+                  'traceback': traceback.format_exc()}
+    conn.send(result)
+    conn.close()
+
+
+def run_batch(jobs, workers=None, memory_limit_mb=None, timeout=None, cache_dir=None, profile=False,
+              manifest_path=None, force=False):
+    """Render jobs with at most `workers` concurrent processes.
+
+    Returns one report entry per job (in input order) with its status, wall
+    time and either stage timings or the error that stopped it. With
+    manifest_path, jobs whose output is up to date are skipped and every
+    output is recorded in that manifest.
+    """
+    workers = workers or os.cpu_count() or 1
+    pending = list(enumerate(jobs))
+    running = {}
+    reports = [None] * len(jobs)
+
+    def finish(sentinel, error=None):
+        index, job, conn, started, proc = running.pop(sentinel)
+        result = None
+        # Read before joining: a worker blocked sending a large result only
+        # exits once the pipe is drained
+        if error is None and conn.poll():
+            try:
+                result = conn.recv()
+            except EOFError:
+                result = None
+        proc.join()
+        if result is None:
+            result = {'status': 'failed', 'error': error or f"worker exited with code {proc.exitcode}"}
+        conn.close()
+        result.update({
+            'basin': job['basin'],
+            'output': job['output'],
+            'seconds': round(time.perf_counter() - started, 3),
+            'exitcode': proc.exitcode,
+        })
+        reports[index] = result
+        message = f"[{'cached' if result.get('cached') else result['status']}] {job['basin']} ({result['seconds']} s)"
+        if result['status'] != 'ok':
+            message += f": {result['error']}"
+        print(message)
+
+    while pending or running:
+        while pending and len(running) < workers:
+            index, job = pending.pop(0)
+            parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+            proc = multiprocessing.Process(target=_worker,
+                                           args=(child_conn, job, cache_dir, memory_limit_mb, profile,
+                                                 manifest_path, force),
+                                           name=f"render-{job['basin']}")
+            proc.start()
+            child_conn.close()
+            running[proc.sentinel] = (index, job, parent_conn, time.perf_counter(), proc)
+
+        # A worker is done once it has sent its result or exited without one
+        conns = {entry[2]: sentinel for sentinel, entry in running.items()}
+        for ready in wait(list(running) + list(conns), timeout=1.0):
+            sentinel = conns.get(ready, ready)
+            if sentinel in running:
+                finish(sentinel)
+
+        # Kill workers that have run past the timeout
+        if timeout is not None:
+            now = time.perf_counter()
+            for sentinel, (_, _, _, started, proc) in list(running.items()):
+                if now - started > timeout:
+                    proc.kill()
+                    finish(sentinel, error=f"timed out after {timeout} s")
+
+    if manifest_path is not None:
+        # Workers only read the manifest; their outputs are recorded here in one write
+        from output_cache import OutputManifest
+        manifest = OutputManifest(manifest_path)
+        for job, report in zip(jobs, reports):
+            artifact = report.pop('artifact', None)
+            if artifact is not None:
+                manifest.add(job['output'], artifact['entry'], artifact['files'])
+        manifest.save()
+    return reports
+
+
+def write_report(reports, path):
+    """Write the per-job report as JSON."""
+    summary = {
+        'total': len(reports),
+        'ok': sum(1 for r in reports if r['status'] == 'ok'),
+        'failed': sum(1 for r in reports if r['status'] != 'ok'),
+        'cached': sum(1 for r in reports if r.get('cached')),
+        'seconds': round(sum(r['seconds'] for r in reports), 3),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump({'summary': summary, 'jobs': reports}, file, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render decision calendars for every basin in a manifest.")
+    parser.add_argument('manifest', help="YAML manifest mapping basin names to config, data and image paths")
+    parser.add_argument('--basins', nargs='+', help="only render these basins")
+    parser.add_argument('--jobs', '-j', type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument('--memory-limit', type=int, default=None, help="per-worker memory limit in MB")
+    parser.add_argument('--timeout', type=float, default=None, help="per-basin timeout in seconds")
+    parser.add_argument('--cache-dir', default=None, help="share a climatology cache between workers")
+    parser.add_argument('--profile', action='store_true',
+                        help="record per-stage wall time and peak memory of every render in the report")
+    parser.add_argument('--output-manifest', default=None,
+                        help=f"output manifest used to skip unchanged basins (default: <output_dir>/{MANIFEST_NAME})")
+    parser.add_argument('--force', action='store_true', help="render every basin even if its output is up to date")
+    parser.add_argument('--report', default=None, help=f"report path (default: <output_dir>/{REPORT_NAME})")
+    args = parser.parse_args(argv)
+
+    jobs = load_manifest(args.manifest)
+    if args.basins:
+        unknown = set(args.basins) - {job['basin'] for job in jobs}
+        if unknown:
+            parser.error(f"unknown basins: {', '.join(sorted(unknown))}")
+        jobs = [job for job in jobs if job['basin'] in args.basins]
+
+    manifest_path = args.output_manifest
+    if manifest_path is None:
+        manifest_path = os.path.join(os.path.dirname(jobs[0]['output']) if jobs else '.', MANIFEST_NAME)
+
+    with tempfile.TemporaryDirectory(prefix='calendar_snapshots_') as snapshot_dir:
+        runnable, invalid = compile_snapshots(jobs, snapshot_dir)
+        reports = run_batch(runnable, workers=args.jobs, memory_limit_mb=args.memory_limit,
+                            timeout=args.timeout, cache_dir=args.cache_dir, profile=args.profile,
+                            manifest_path=manifest_path, force=args.force)
+    order = {job['basin']: i for i, job in enumerate(jobs)}
+    reports = sorted(reports + invalid, key=lambda report: order[report['basin']])
+
+    report_path = args.report
+    if report_path is None:
+        output_dir = os.path.dirname(jobs[0]['output']) if jobs else '.'
+        report_path = os.path.join(output_dir, REPORT_NAME)
+    summary = write_report(reports, report_path)
+    print(f"{summary['ok']}/{summary['total']} calendars up to date ({summary['cached']} unchanged), "
+          f"report written to {report_path}")
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
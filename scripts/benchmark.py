@@ -0,0 +1,313 @@
+"""Benchmark the rendering pipeline on synthetic fixtures.
+
+Each scenario generates an hourly record, a config with a given number of
+tracks and sectors, and then times DecisionCalendar.__init__, create_plot
+and save_plot, with a per-stage breakdown from RenderProfiler. Results can
+be stored as a baseline and later runs compared against it. Everything runs
+offline from generated fixtures and the bundled data/ directory.
+
+Usage:
+    python benchmark.py --quick
+    python benchmark.py --save-baseline ../benchmarks/baseline.json
+    python benchmark.py --baseline ../benchmarks/baseline.json --tolerance 1.25
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+import yaml
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(REPO_DIR, 'benchmarks', 'baseline.json')
+
+BASELINE_VERSION = 1
+
+# name: (years of hourly record, tracks, sectors); None years draws the bundled data
+SCENARIOS = {
+    'bundled_chena': (None, None, 12),
+    'records_1y': (1, 10, 12),
+    'records_10y': (10, 10, 12),
+    'records_100y': (100, 10, 12),
+    'tracks_10': (1, 10, 12),
+    'tracks_100': (1, 100, 12),
+    'tracks_500': (1, 500, 12),
+    'sectors_52': (1, 50, 52),
+    'sectors_365': (1, 50, 365),
+}
+
+QUICK_SCENARIOS = ('bundled_chena', 'records_10y', 'tracks_100', 'sectors_52')
+
+STATIC_TYPES = ('infill', 'line', 'arrow', 'marker')
+
+# Radial band shared by the generated tracks, inside the 0-100 plot range
+R_MIN, R_MAX = 30, 100
+
+
+def record_rows(years):
+    """Number of hourly observations in a synthetic record of `years` years."""
+    return int(years * 365.25 * 24)
+
+
+def count_rows(path):
+    """Number of data rows of a CSV, counted without parsing it."""
+    with open(path, 'rb') as file:
+        lines = sum(chunk.count(b'\n') for chunk in iter(lambda: file.read(1 << 20), b''))
+        file.seek(-1, os.SEEK_END)
+        # A last line without a newline still counts; the header does not
+        return lines - (file.read(1) == b'\n')
+
+
+def make_record_csv(path, years, seed=0):
+    """Write a synthetic hourly streamflow record of `years` years to path.
+
+    The series is a seasonal cycle with a random-walk anomaly and noise, in
+    the datetime/discharge layout of the bundled streamflow file.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('1920-01-01', periods=record_rows(years), freq='h')
+    day = dates.dayofyear.to_numpy()
+    seasonal = 50 + 45 * np.sin(2 * np.pi * (day - 100) / 365.25)
+    anomaly = np.cumsum(rng.normal(0, 0.05, len(dates)))
+    anomaly -= np.linspace(anomaly[0], anomaly[-1], len(dates))
+    values = np.maximum(seasonal + anomaly + rng.normal(0, 3, len(dates)), 0)
+    pd.DataFrame({'datetime': dates, 'discharge': values.round(3)}).to_csv(path, index=False)
+    return len(dates)
+
+
+def split_sectors(n_sectors):
+    """Split the 366 calendar slots into n_sectors contiguous sectors."""
+    edges = np.linspace(0, 366, n_sectors + 1).round().astype(int)
+    return {f"S{i + 1:03d}": [int(edges[i]) + 1, int(edges[i + 1])] for i in range(n_sectors)}
+
+
+def make_config(n_tracks, n_sectors, seed=0):
+    """Return a config with n_tracks tracks spread over random runs of n_sectors sectors.
+
+    12 sectors are the months; any other number splits the calendar into
+    equal runs of days through calendar.sectors. Two tracks are data_plot
+    tracks of the 'streamflow' source; the rest cycle through the static
+    track types.
+    """
+    from calendar_index import CalendarIndex
+
+    rng = np.random.default_rng(seed)
+    calendar = {'year_start': 'Jan'}
+    if n_sectors == 12:
+        sector_names = list(CalendarIndex().months)
+    else:
+        calendar['sectors'] = split_sectors(n_sectors)
+        sector_names = list(calendar['sectors'])
+    band = (R_MAX - R_MIN) / max(n_tracks, 1)
+
+    tracks = {}
+    for i in range(n_tracks):
+        r_start = round(R_MIN + i * band, 3)
+        r_end = round(r_start + max(band * 0.8, 0.1), 3)
+        first = int(rng.integers(0, n_sectors))
+        length = int(rng.integers(1, n_sectors + 1))
+        months = [sector_names[(first + k) % n_sectors] for k in range(length)]
+        if i < 2:
+            tracks[f"track_{i:03d}"] = {
+                'type': 'data_plot', 'source': 'streamflow',
+                'color_mean': 'bench.mean', 'color_envelope': 'bench.envelope',
+                'r_start': r_start, 'r_end': r_end, 'months': list(sector_names),
+            }
+            continue
+        ttype = STATIC_TYPES[i % len(STATIC_TYPES)]
+        track = {'type': ttype, 'color': f"bench.c{i % 4}", 'months': months}
+        if ttype == 'marker':
+            track.update({'r_points': {m: r_end for m in months}, 'marker': 'v', 's': 50})
+        else:
+            track.update({'r_start': r_start, 'r_end': r_end if ttype != 'line' else r_start,
+                          'linestyle': '--' if i % 3 else '-', 'linewidth': 1})
+        tracks[f"track_{i:03d}"] = track
+
+    return {
+        'colors': {'bench': {'mean': '#1f77b4', 'envelope': '#aec7e8', 'c0': '#2ca02c', 'c1': '#d62728',
+                             'c2': '#9467bd', 'c3': '#8c564b'}},
+        'calendar': calendar,
+        'track_configs': tracks,
+        'legend_groups': {
+            'Benchmark': {'color': 'bench.c0', 'elements': [
+                {'type': 'patch', 'label': 'Infill', 'color': 'bench.c0'},
+                {'type': 'line', 'label': 'Line', 'color': 'bench.c1', 'linestyle': '--'},
+                {'type': 'marker', 'label': 'Marker', 'color': 'bench.c2', 'marker': 'v'},
+            ]},
+        },
+        'plot_settings': {
+            'figsize': {'plot': [15, 8]},
+            'legend': {'facecolor': 'white', 'edgecolor': 'black', 'fontsize': 10, 'title_fontsize': 10},
+        },
+    }
+
+
+def prepare_fixtures(name, fixtures_dir):
+    """Generate (or reuse) the record and config of a scenario.
+
+    Returns the DecisionCalendar arguments and the number of observations
+    the scenario's records hold.
+    """
+    years, n_tracks, n_sectors = SCENARIOS[name]
+    os.makedirs(fixtures_dir, exist_ok=True)
+    if years is None:
+        kwargs = {
+            'config_path': os.path.join(REPO_DIR, 'config', 'chena.yaml'),
+            'streamflow_csv': os.path.join(REPO_DIR, 'data', 'Ross_streamflow.csv'),
+            'swe_csv': os.path.join(REPO_DIR, 'data', 'Chena_Monument_Creek.csv'),
+        }
+        return kwargs, count_rows(kwargs['streamflow_csv']) + count_rows(kwargs['swe_csv'])
+
+    record = os.path.join(fixtures_dir, f"hourly_{years}y.csv")
+    if not os.path.exists(record):
+        make_record_csv(record + '.tmp', years)
+        os.replace(record + '.tmp', record)
+
+    config_path = os.path.join(fixtures_dir, f"config_{n_tracks}t_{n_sectors}s.yaml")
+    with open(config_path, 'w') as file:
+        yaml.safe_dump(make_config(n_tracks, n_sectors), file, sort_keys=False)
+
+    return {'config_path': config_path, 'streamflow_csv': record}, record_rows(years)
+
+
+def run_scenario(name, fixtures_dir, repeat=1, dpi=50, memory=False):
+    """Render a scenario `repeat` times and return its fastest timings.
+
+    Phases are init, create_plot and save; stages are the RenderProfiler
+    breakdown of the fastest run. With memory=True one extra traced run adds
+    the peak memory of every stage.
+    """
+    import matplotlib.pyplot as plt
+    from decision_calendars import DecisionCalendar
+    from profiling import RenderProfiler
+
+    kwargs, rows = prepare_fixtures(name, fixtures_dir)
+    output = os.path.join(fixtures_dir, f"{name}.png")
+
+    def render(profiler):
+        phases = {}
+        start = time.perf_counter()
+        calendar = DecisionCalendar(profiler=profiler, **kwargs)
+        phases['init'] = time.perf_counter() - start
+        start = time.perf_counter()
+        fig = calendar.create_plot()
+        phases['create_plot'] = time.perf_counter() - start
+        start = time.perf_counter()
+        calendar.save_plot(fig, output, dpi=dpi)
+        phases['save'] = time.perf_counter() - start
+        plt.close(fig)
+        profiler.stop()
+        return calendar, phases, profiler.to_dict()['stages']
+
+    best = None
+    for _ in range(repeat):
+        calendar, phases, stages = render(RenderProfiler())
+        if best is None or sum(phases.values()) < sum(best[0].values()):
+            best = (phases, stages)
+    phases, stages = best
+
+    load_seconds = stages.get('load_data', {}).get('seconds', 0)
+    result = {
+        'tracks': len(calendar.ops),
+        'sectors': len(calendar.sectors),
+        'rows': rows,
+        'phases': {key: round(value, 4) for key, value in phases.items()},
+        'seconds': round(sum(phases.values()), 4),
+        'stages': stages,
+        'throughput': {
+            'rows_per_s': round(rows / load_seconds) if load_seconds else None,
+            'tracks_per_s': round(len(calendar.ops) / phases['create_plot'], 1),
+        },
+    }
+
+    if memory:
+        _, _, traced = render(RenderProfiler(memory=True))
+        result['peak_mb'] = {stage: record['peak_mb'] for stage, record in traced.items()}
+    return result
+
+
+def compare(results, baseline, tolerance=1.25):
+    """Compare phase timings against a baseline.
+
+    Returns a list of (scenario, phase, baseline seconds, seconds, ratio)
+    for every phase slower than tolerance times its baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get('scenarios', {}).get(name)
+        if reference is None:
+            continue
+        for phase, seconds in result['phases'].items():
+            before = reference['phases'].get(phase)
+            # Ignore phases too short to time reliably
+            if not before or max(before, seconds) < 0.05:
+                continue
+            ratio = seconds / before
+            if ratio > tolerance:
+                regressions.append((name, phase, before, seconds, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark DecisionCalendar on synthetic fixtures.")
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), help="scenarios to run")
+    parser.add_argument('--quick', action='store_true', help=f"only run {', '.join(QUICK_SCENARIOS)}")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per scenario, the fastest is kept")
+    parser.add_argument('--dpi', type=int, default=50, help="save_plot dpi")
+    parser.add_argument('--memory', action='store_true', help="add a traced run for per-stage peak memory")
+    parser.add_argument('--fixtures-dir', default=os.path.join(tempfile.gettempdir(), 'decision_calendar_bench'),
+                        help="where generated records, configs and outputs are written")
+    parser.add_argument('--baseline', default=None, help=f"compare against this baseline (e.g. {DEFAULT_BASELINE})")
+    parser.add_argument('--tolerance', type=float, default=1.25, help="allowed slowdown ratio before failing")
+    parser.add_argument('--save-baseline', default=None, help="write the results as a new baseline")
+    parser.add_argument('--output', default=None, help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    import matplotlib
+    matplotlib.use('Agg')
+    warnings.filterwarnings('ignore')
+
+    names = args.scenarios or (QUICK_SCENARIOS if args.quick else list(SCENARIOS))
+    results = {}
+    for name in names:
+        result = run_scenario(name, args.fixtures_dir, args.repeat, args.dpi, args.memory)
+        results[name] = result
+        phases = ', '.join(f"{phase} {seconds:.2f} s" for phase, seconds in result['phases'].items())
+        print(f"{name}: {result['tracks']} tracks, {result['sectors']} sectors, {result['rows']} rows: {phases}")
+
+    report = {
+        'version': BASELINE_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                    'cpus': os.cpu_count()},
+        'settings': {'dpi': args.dpi, 'repeat': args.repeat},
+        'scenarios': results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'w') as file:
+                json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        if baseline.get('settings', {}).get('dpi') != args.dpi:
+            print(f"Warning: baseline was saved at dpi {baseline['settings'].get('dpi')}, this run uses {args.dpi}.")
+        regressions = compare(results, baseline, args.tolerance)
+        for name, phase, before, seconds, ratio in regressions:
+            print(f"REGRESSION {name}.{phase}: {before:.2f} s -> {seconds:.2f} s ({ratio:.2f}x)")
+        if regressions:
+            return 1
+        print(f"No phase slower than {args.tolerance}x the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# Bump when the layout of cached climatologies changes
+CACHE_VERSION = 2
+
+
+def file_fingerprint(path, content_hash=False):
+    """Identify the current contents of a file.
+
+    By default the fingerprint is the file's size and modification time, which
+    is cheap to compute. With content_hash=True the file is hashed instead, so
+    touched-but-unchanged files still hit the cache.
+    """
+    stat = os.stat(path)
+    if not content_hash:
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ClimatologyCache:
+    """On-disk cache of processed daily climatologies.
+
+    Entries are keyed on the source file fingerprint and every processing
+    parameter, and stored as compressed .npz files of the 366-row result.
+    The cache is pruned to max_bytes (least recently used first) and entries
+    older than max_age seconds are discarded.
+    """
+
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024, max_age=None, content_hash=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.content_hash = content_hash
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, csv_file, **params):
+        """Build the cache key for a source file and its processing parameters."""
+        payload = {
+            'version': CACHE_VERSION,
+            'fingerprint': file_fingerprint(csv_file, self.content_hash),
+            'params': params,
+        }
+        if not self.content_hash:
+            # Size and mtime alone are not unique across files
+            payload['file'] = os.path.abspath(csv_file)
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """Return the cached DataFrame for key, or None on a miss."""
+        path = self._path(key)
+        if os.path.exists(path) and not self._expired(os.path.getmtime(path)):
+            try:
+                with np.load(path, allow_pickle=False) as archive:
+                    columns = [str(c) for c in archive['__columns__']]
+                    index = pd.Index(archive['__index__'], name=str(archive['__index_name__']))
+                    frame = pd.DataFrame({col: archive[col] for col in columns}, index=index)
+            except (OSError, ValueError, KeyError):
+                # Corrupt or partially written entry, recompute it
+                self._remove(path)
+            else:
+                os.utime(path)
+                self._stats['hits'] += 1
+                return frame
+        self._stats['misses'] += 1
+        return None
+
+    def put(self, key, frame):
+        """Store a DataFrame under key and prune the cache."""
+        arrays = {col: frame[col].to_numpy() for col in frame.columns}
+        arrays['__columns__'] = np.array(frame.columns, dtype=str)
+        arrays['__index__'] = frame.index.to_numpy()
+        arrays['__index_name__'] = np.array(frame.index.name or '')
+
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            np.savez_compressed(file, **arrays)
+        os.replace(tmp_path, self._path(key))
+        self._stats['stores'] += 1
+        self.prune()
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, calling compute() and storing it on a miss."""
+        frame = self.get(key)
+        if frame is None:
+            frame = compute()
+            self.put(key, frame)
+        return frame
+
+    def _expired(self, mtime):
+        return self.max_age is not None and time.time() - mtime > self.max_age
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # Removed by another process sharing the cache
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def prune(self):
+        """Evict expired entries, then the least recently used until under max_bytes."""
+        entries = []
+        for mtime, size, path in self._entries():
+            if self._expired(mtime):
+                self._remove(path)
+                self._stats['evictions'] += 1
+            else:
+                entries.append((mtime, size, path))
+
+        if self.max_bytes is None:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            self._stats['evictions'] += 1
+            total -= size
+
+    def clear(self):
+        """Remove every cached entry."""
+        for _, _, path in self._entries():
+            self._remove(path)
+
+    def stats(self):
+        """Return hit/miss counters and the current size of the cache."""
+        entries = self._entries()
+        stats = dict(self._stats)
+        stats['entries'] = len(entries)
+        stats['bytes'] = sum(size for _, size, _ in entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
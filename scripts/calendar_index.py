@@ -0,0 +1,159 @@
+"""Leap-year-safe day-of-year slots and the month sectors built from them.
+
+Every (month, day) pair, Feb 29 included, has its own slot in a 366-slot
+calendar, so Mar 1 is always the same slot whether or not the year is a leap
+year. The calendar can start on the first day of any month, e.g. Oct 1 for
+the hydrological (water) year. The month sectors can be replaced by any
+contiguous runs of slots.
+"""
+import numpy as np
+
+MONTH_NAMES = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+# Days per month in the slot calendar (Feb always has its leap day slot)
+DAYS_IN_MONTH = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+N_SLOTS = sum(DAYS_IN_MONTH)
+
+
+def parse_year_start(value):
+    """Return the 1-based month a calendar starts in, from 'Oct', '10-01', 10 or (10, 1)."""
+    if isinstance(value, str):
+        parts = value.split()
+        if parts and parts[0][:3].title() in MONTH_NAMES:
+            month = MONTH_NAMES.index(parts[0][:3].title()) + 1
+            day = int(parts[1]) if len(parts) > 1 else 1
+        else:
+            month, day = (int(part) for part in value.split('-'))
+    elif isinstance(value, (tuple, list)):
+        month, day = value
+    else:
+        month, day = int(value), 1
+    if not 1 <= month <= 12:
+        raise ValueError(f"Invalid year start '{value}'.")
+    if day != 1:
+        raise ValueError(f"Year start '{value}' must be the first day of a month.")
+    return month
+
+
+def parse_day(value):
+    """Return (month name, day) of a calendar day given as 'Apr 15', '04-15' or a day of year.
+
+    A day of year counts Feb 29 (1..366, Mar 1 is always day 61), like the
+    calendar slots of a January calendar.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid day '{value}'.")
+    if isinstance(value, int):
+        if not 1 <= value <= N_SLOTS:
+            raise ValueError(f"Day of year {value} is not between 1 and {N_SLOTS}.")
+        month = 0
+        while value > DAYS_IN_MONTH[month]:
+            value -= DAYS_IN_MONTH[month]
+            month += 1
+        return MONTH_NAMES[month], value
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid day '{value}', expected e.g. 'Apr 15', '04-15' or a day of year.")
+    parts = value.replace('-', ' ').split()
+    try:
+        if len(parts) != 2:
+            raise ValueError
+        if parts[0][:3].title() in MONTH_NAMES:
+            month = MONTH_NAMES.index(parts[0][:3].title()) + 1
+        else:
+            month = int(parts[0])
+        day = int(parts[1])
+    except ValueError:
+        raise ValueError(f"Invalid day '{value}', expected e.g. 'Apr 15', '04-15' or a day of year.") from None
+    if not 1 <= month <= 12 or not 1 <= day <= DAYS_IN_MONTH[month - 1]:
+        raise ValueError(f"Invalid day '{value}'.")
+    return MONTH_NAMES[month - 1], day
+
+
+def parse_sectors(sectors):
+    """Validate custom sectors {name: [first, last]}: runs of slots covering 1..366 in order."""
+    if not isinstance(sectors, dict) or not sectors:
+        raise ValueError("calendar.sectors must map sector names to [first, last] slots.")
+    ranges = {}
+    next_slot = 1
+    for name, bounds in sectors.items():
+        if not (isinstance(bounds, (list, tuple)) and len(bounds) == 2
+                and all(isinstance(bound, int) and not isinstance(bound, bool) for bound in bounds)):
+            raise ValueError(f"Sector '{name}' must be [first, last] slots, not {bounds!r}.")
+        first, last = bounds
+        if first != next_slot or not first <= last <= N_SLOTS:
+            raise ValueError(f"Sector '{name}' {list(bounds)} must start at slot {next_slot} "
+                             f"and end by slot {N_SLOTS}.")
+        ranges[str(name)] = [first, last]
+        next_slot = last + 1
+    if next_slot != N_SLOTS + 1:
+        raise ValueError(f"calendar.sectors end at slot {next_slot - 1}, not {N_SLOTS}.")
+    return ranges
+
+
+class CalendarIndex:
+    """Map timestamps to calendar slots 1..366 starting at year_start.
+
+    The slot of every (month, day) is precomputed in a 13 x 32 lookup table,
+    so indexing a series is a single vectorized table lookup. sectors, as
+    parse_sectors() takes them, replace the month sectors of month_ranges;
+    slots stay days counted from year_start.
+    """
+
+    def __init__(self, year_start='01-01', sectors=None):
+        self.start_month = parse_year_start(year_start)
+        self.months = MONTH_NAMES[self.start_month - 1:] + MONTH_NAMES[:self.start_month - 1]
+
+        # Slot of the first day of each month, in calendar order from year_start
+        self.month_ranges = {}
+        self._table = np.zeros((13, 32), dtype=np.int64)
+        slot = 1
+        for name in self.months:
+            month = MONTH_NAMES.index(name) + 1
+            days = DAYS_IN_MONTH[month - 1]
+            self.month_ranges[name] = [slot, slot + days - 1]
+            self._table[month, 1:days + 1] = np.arange(slot, slot + days)
+            slot += days
+        if sectors is not None:
+            self.month_ranges = parse_sectors(sectors)
+
+    @classmethod
+    def from_config(cls, calendar_config, year_start=None):
+        """Index of a config's calendar section; year_start overrides calendar.year_start."""
+        calendar_config = calendar_config or {}
+        return cls(year_start or calendar_config.get('year_start', 'Jan'), calendar_config.get('sectors'))
+
+    @property
+    def leap_slot(self):
+        """Slot of Feb 29."""
+        return int(self._table[2, 29])
+
+    @property
+    def sectors(self):
+        """Number of days of each month sector."""
+        return {name: end - start + 1 for name, (start, end) in self.month_ranges.items()}
+
+    def slots(self, dates):
+        """Return the calendar slot (1..366) of each timestamp in a datetime Series.
+
+        Missing timestamps (NaT, e.g. from a blank CSV cell) get slot 0, which
+        no calendar day uses.
+        """
+        valid = dates.notna().to_numpy()
+        slots = np.zeros(len(valid), dtype=np.int64)
+        slots[valid] = self._table[dates.dt.month.to_numpy()[valid].astype(np.int64),
+                                   dates.dt.day.to_numpy()[valid].astype(np.int64)]
+        return slots
+
+    def years(self, dates):
+        """Return the year each timestamp's calendar year is named by.
+
+        A calendar starting in October follows the water-year convention: Oct
+        2023 to Sep 2024 is year 2024. Missing timestamps get year 0.
+        """
+        valid = dates.notna().to_numpy()
+        years = np.zeros(len(valid), dtype=np.int64)
+        years[valid] = dates.dt.year.to_numpy()[valid]
+        if self.start_month != 1:
+            years[valid] += dates.dt.month.to_numpy()[valid] >= self.start_month
+        return years
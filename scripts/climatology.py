@@ -0,0 +1,466 @@
+import numpy as np
+import pandas as pd
+
+from calendar_index import CalendarIndex
+from series_store import iter_series
+
+# Calendar slots covered by a climatology (1..366, leap day included)
+N_DAYS = 366
+
+DEFAULT_QUANTILES = (10, 90)
+
+
+def quantile_column(q):
+    """Column name used for a percentile, e.g. 10 -> 'p10', 2.5 -> 'p2.5'."""
+    return f"p{q:g}"
+
+
+def compute_daily_climatology(day_of_year, values, quantiles=DEFAULT_QUANTILES):
+    """Compute the mean and percentiles of values for every day of year in one pass.
+
+    day_of_year and values are equal-length array-likes. Observations are sorted
+    once by (day, value); each day's percentiles are then read out of its slice
+    of the sorted array with numpy's default linear interpolation, for all days
+    at once. Returns a DataFrame indexed by day_of_year (1..366) with a 'count'
+    column, a 'mean' column and one 'pXX' column per quantile. Days without
+    observations are NaN.
+    """
+    days = np.asarray(day_of_year, dtype=np.int64)
+    vals = np.asarray(values, dtype=np.float64)
+
+    # Slot 0 marks a missing timestamp (see CalendarIndex.slots)
+    valid = ~np.isnan(vals) & (days > 0)
+    days = days[valid]
+    vals = vals[valid]
+
+    counts = np.bincount(days, minlength=N_DAYS + 1)[1:N_DAYS + 1]
+    sums = np.bincount(days, weights=vals, minlength=N_DAYS + 1)[1:N_DAYS + 1]
+
+    stats = {'count': counts}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats['mean'] = np.where(counts > 0, sums / counts, np.nan)
+
+    # Sort by day first, then by value within each day
+    order = np.lexsort((vals, days))
+    sorted_vals = vals[order]
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    has_data = counts > 0
+
+    for q in quantiles:
+        result = np.full(N_DAYS, np.nan)
+        n = counts[has_data]
+        pos = (q / 100.0) * (n - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, n - 1)
+        frac = pos - lo
+        base = offsets[has_data]
+        lo_vals = sorted_vals[base + lo]
+        hi_vals = sorted_vals[base + hi]
+        result[has_data] = lo_vals + (hi_vals - lo_vals) * frac
+        stats[quantile_column(q)] = result
+
+    index = pd.RangeIndex(1, N_DAYS + 1, name='day_of_year')
+    return pd.DataFrame(stats, index=index)
+
+
+def scale_factor(daily_stats, quantiles=DEFAULT_QUANTILES):
+    """The value scale_climatology() divides by: the largest upper percentile (1 if it is 0)."""
+    max_val = daily_stats[quantile_column(max(quantiles))].max()
+    if not max_val or np.isnan(max_val):
+        return 1.0
+    return max_val
+
+
+def scale_climatology(daily_stats, quantiles=DEFAULT_QUANTILES):
+    """Add '<col>_scaled' columns normalized to 0-1.
+
+    Values are divided by the largest upper percentile so the envelope fits
+    inside a track's radial range. Empty days stay NaN; daily_arrays()
+    fills or masks them according to a track's missing-data mode.
+    """
+    columns = ['mean'] + [quantile_column(q) for q in quantiles]
+    max_val = scale_factor(daily_stats, quantiles)
+
+    for col in columns:
+        daily_stats[f"{col}_scaled"] = daily_stats[col] / max_val
+    return daily_stats
+
+
+class DailyRecord:
+    """Observations indexed by calendar slot and year, parsed once.
+
+    The climatology, the daily means of individual years and their
+    percentile ranks are all computed from the same arrays. Observations are
+    kept grouped by year, so one year's daily means cost a slice and two
+    bincounts. The per-slot sorted distribution used for percentile ranks is
+    built on first use.
+    """
+
+    def __init__(self, slots, years, values):
+        values = np.asarray(values, dtype=np.float64)
+        slots = np.asarray(slots, dtype=np.int64)
+        valid = ~np.isnan(values) & (slots > 0)
+        years = np.asarray(years, dtype=np.int64)[valid]
+        order = np.argsort(years, kind='stable')
+        self.slots = slots[valid][order]
+        self.values = values[valid][order]
+        self.years, starts = np.unique(years[order], return_index=True)
+        stops = np.append(starts[1:], len(self.values))
+        self._bounds = {int(year): (start, stop) for year, start, stop in zip(self.years, starts, stops)}
+        self._ranking = None
+
+    @classmethod
+    def from_dates(cls, dates, values, calendar_index):
+        """Build a record from a datetime Series and its values, slotted by calendar_index."""
+        return cls(calendar_index.slots(dates), calendar_index.years(dates), values)
+
+    def climatology(self, quantiles=DEFAULT_QUANTILES):
+        """The daily climatology, as compute_daily_climatology() returns it."""
+        return compute_daily_climatology(self.slots, self.values, quantiles)
+
+    def year_means(self, years):
+        """Return a (len(years), N_DAYS + 1) array of each year's daily means.
+
+        Rows are indexed by slot like daily_arrays() (index 0 unused); days a
+        year has no observations for, and years not in the record, are NaN.
+        """
+        means = np.full((len(years), N_DAYS + 1), np.nan)
+        for row, year in enumerate(years):
+            start, stop = self._bounds.get(int(year), (0, 0))
+            slots = self.slots[start:stop]
+            counts = np.bincount(slots, minlength=N_DAYS + 1)
+            sums = np.bincount(slots, weights=self.values[start:stop], minlength=N_DAYS + 1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means[row] = np.where(counts > 0, sums / counts, np.nan)
+        means[:, 0] = np.nan
+        return means
+
+    def percentile_rank(self, daily_values):
+        """Percentile rank (0-100) of slot-indexed values among all observations of their slot.
+
+        daily_values has N_DAYS + 1 entries along its last axis, e.g. the
+        rows of year_means(). Ties count half. Observations are sorted once
+        by (slot, value) and encoded as integer keys slot * width + value
+        rank, so every day of every row is ranked with two searchsorted
+        calls. Missing values and slots without observations are NaN.
+        """
+        if self._ranking is None:
+            order = np.lexsort((self.values, self.slots))
+            distinct = np.unique(self.values)
+            width = len(distinct) + 1
+            keys = self.slots[order] * width + np.searchsorted(distinct, self.values[order])
+            counts = np.bincount(self.slots, minlength=N_DAYS + 1)
+            offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            self._ranking = (distinct, width, keys, counts, offsets)
+        distinct, width, keys, counts, offsets = self._ranking
+
+        values = np.asarray(daily_values, dtype=np.float64)
+        slots = np.broadcast_to(np.arange(N_DAYS + 1), values.shape)
+        base = slots * width
+        below = np.searchsorted(keys, base + np.searchsorted(distinct, values, 'left')) - offsets[slots]
+        not_above = np.searchsorted(keys, base + np.searchsorted(distinct, values, 'right')) - offsets[slots]
+        n = counts[slots]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ranks = 100.0 * (below + 0.5 * (not_above - below)) / n
+        ranks[np.isnan(values) | (n == 0)] = np.nan
+        return ranks
+
+
+# Reductions of sub-daily observations to one value per day ('none' keeps every observation)
+DAILY_AGGREGATIONS = ('mean', 'max', 'min', 'none')
+
+# Fraction of a day's expected observations it needs to be kept
+DEFAULT_COMPLETENESS = 0.75
+
+_DAY = np.timedelta64(1, 'D')
+
+
+def samples_per_day(dates):
+    """Expected observations per day, from the median step between timestamps (1 for daily or coarser data)."""
+    steps = np.diff(np.asarray(dates, dtype='datetime64[s]').astype(np.int64))
+    steps = steps[steps > 0]
+    if not len(steps):
+        return 1
+    return max(1, int(round(86400 / np.median(steps))))
+
+
+class DailyResampler:
+    """Reduce sub-daily observations to one value per day before the climatology.
+
+    Each day becomes the mean, max or min of its valid observations, so an
+    hourly record counts each day once instead of 24 times. A day with less
+    than min_completeness of the expected observations (samples_per_day,
+    inferred from the first chunk when not given) is dropped. Chunks must
+    come in time order; the last day of a chunk is held back until the next
+    chunk or flush(). Rows without a timestamp are skipped. gaps() lists the
+    dropped days and the days without any observation.
+    """
+
+    def __init__(self, how='mean', min_completeness=DEFAULT_COMPLETENESS, samples_per_day=None):
+        if how not in DAILY_AGGREGATIONS[:-1]:
+            raise ValueError(f"Unknown daily aggregation '{how}'; use one of {list(DAILY_AGGREGATIONS)}.")
+        if not 0 <= min_completeness <= 1:
+            raise ValueError(f"min_completeness must be between 0 and 1, not {min_completeness}.")
+        self.how = how
+        self.min_completeness = min_completeness
+        self.samples_per_day = samples_per_day
+        self._held = (np.empty(0, dtype='datetime64[s]'), np.empty(0))
+        self._last_day = None
+        self._dropped = []
+        self._missing = []
+
+    def add(self, dates, values):
+        """Add a chunk of observations; return (dates, values) of the days it completes."""
+        times = np.asarray(dates, dtype='datetime64[s]')
+        values = np.asarray(values, dtype=np.float64)
+        known = ~np.isnat(times)
+        times = np.concatenate((self._held[0], times[known]))
+        values = np.concatenate((self._held[1], values[known]))
+        if len(times) and (times[1:] < times[:-1]).any():
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+        if self.samples_per_day is None and len(times) > 1:
+            self.samples_per_day = samples_per_day(times)
+        days = times.astype('datetime64[D]')
+        cut = np.searchsorted(days, days[-1]) if len(days) else 0
+        self._held = (times[cut:], values[cut:])
+        return self._reduce(days[:cut], values[:cut])
+
+    def flush(self):
+        """Return (dates, values) of the held-back last day."""
+        times, values = self._held
+        self._held = (times[:0], values[:0])
+        return self._reduce(times.astype('datetime64[D]'), values)
+
+    def resample(self, dates, values):
+        """Reduce a whole series at once; returns (dates, values) of the days kept."""
+        first, last = self.add(dates, values), self.flush()
+        return pd.concat((first[0], last[0]), ignore_index=True), np.concatenate((first[1], last[1]))
+
+    def _reduce(self, days, values):
+        if not len(days):
+            return pd.Series(days.astype('datetime64[s]')), values
+        starts = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1])))
+        day = days[starts]
+        valid = ~np.isnan(values)
+        counts = np.add.reduceat(valid.astype(np.int64), starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if self.how == 'mean':
+                reduced = np.add.reduceat(np.where(valid, values, 0.0), starts) / counts
+            elif self.how == 'max':
+                reduced = np.fmax.reduceat(values, starts)
+            else:
+                reduced = np.fmin.reduceat(values, starts)
+        completeness = np.minimum(counts / (self.samples_per_day or 1), 1.0)
+        keep = (counts > 0) & (completeness >= self.min_completeness)
+        if not keep.all():
+            self._dropped.append((day[~keep], counts[~keep], completeness[~keep]))
+
+        # Runs of days between consecutive observed days
+        previous = np.concatenate(([day[0] - _DAY if self._last_day is None else self._last_day], day[:-1]))
+        after_gap = day - previous > _DAY
+        self._missing.extend(zip(previous[after_gap] + _DAY, day[after_gap]))
+        self._last_day = day[-1]
+        return pd.Series(day[keep].astype('datetime64[s]')), reduced[keep]
+
+    def gaps(self):
+        """DataFrame of the dropped and missing days with their valid samples and completeness (0-1)."""
+        days = [dropped[0] for dropped in self._dropped]
+        samples = [dropped[1] for dropped in self._dropped]
+        completeness = [dropped[2] for dropped in self._dropped]
+        for start, stop in self._missing:
+            missing = np.arange(start, stop, _DAY)
+            days.append(missing)
+            samples.append(np.zeros(len(missing), dtype=np.int64))
+            completeness.append(np.zeros(len(missing)))
+        if not days:
+            return pd.DataFrame({'samples': [], 'completeness': []}, index=pd.DatetimeIndex([], name='date'))
+        gaps = pd.DataFrame({'samples': np.concatenate(samples), 'completeness': np.concatenate(completeness)},
+                            index=pd.DatetimeIndex(np.concatenate(days).astype('datetime64[s]'), name='date'))
+        return gaps.sort_index()
+
+    def summary(self):
+        """(dropped incomplete days, days without observations)."""
+        dropped = sum(len(days) for days, _, _ in self._dropped)
+        missing = sum(int((stop - start) / _DAY) for start, stop in self._missing)
+        return dropped, missing
+
+
+class DailyAccumulator:
+    """Fold chunks of observations into running per-day-of-year statistics.
+
+    Counts and sums give the exact mean. Percentiles come from a per-day
+    histogram whose range doubles (merging adjacent bins) whenever a chunk
+    falls outside it, so memory is fixed at 366 x bins regardless of how many
+    rows are added, and percentiles are accurate to one bin width.
+    """
+
+    def __init__(self, bins=2048):
+        if bins < 2 or bins % 2:
+            raise ValueError("bins must be an even number of at least 2.")
+        self.bins = bins
+        self.counts = np.zeros(N_DAYS, dtype=np.int64)
+        self.sums = np.zeros(N_DAYS)
+        self.hist = np.zeros((N_DAYS, bins), dtype=np.int64)
+        self.lo = None
+        self.width = None
+
+    @property
+    def hi(self):
+        return self.lo + self.width * self.bins
+
+    def _expand(self, vmin, vmax):
+        """Grow the histogram range until it covers [vmin, vmax]."""
+        if self.lo is None:
+            self.lo = vmin
+            self.width = (vmax - vmin) / self.bins or max(abs(vmin), 1.0) * 1e-9
+        half = self.bins // 2
+        while vmin < self.lo or vmax >= self.hi:
+            merged = self.hist.reshape(N_DAYS, half, 2).sum(axis=2)
+            self.hist = np.zeros_like(self.hist)
+            if vmin < self.lo:
+                # Old range becomes the upper half of the doubled range
+                self.hist[:, half:] = merged
+                self.lo -= self.width * self.bins
+            else:
+                self.hist[:, :half] = merged
+            self.width *= 2
+
+    def add(self, day_of_year, values):
+        """Add a chunk of observations."""
+        days = np.asarray(day_of_year, dtype=np.int64)
+        vals = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(vals) & (days > 0)
+        days = days[valid]
+        vals = vals[valid]
+        if len(vals) == 0:
+            return
+
+        self.counts += np.bincount(days, minlength=N_DAYS + 1)[1:N_DAYS + 1]
+        self.sums += np.bincount(days, weights=vals, minlength=N_DAYS + 1)[1:N_DAYS + 1]
+
+        self._expand(vals.min(), vals.max())
+        bin_index = np.minimum(((vals - self.lo) / self.width).astype(np.int64), self.bins - 1)
+        np.add.at(self.hist, (days - 1, bin_index), 1)
+
+    def merge(self, other):
+        """Fold another accumulator (e.g. from a parallel reader) into this one.
+
+        The other histogram's occupied bins are re-binned at their centres, which
+        adds at most one bin width of error.
+        """
+        self.counts += other.counts
+        self.sums += other.sums
+        if other.lo is None:
+            return
+        days, bins = np.nonzero(other.hist)
+        centres = other.lo + other.width * (bins + 0.5)
+        self._expand(centres.min(), centres.max())
+        bin_index = np.minimum(((centres - self.lo) / self.width).astype(np.int64), self.bins - 1)
+        np.add.at(self.hist, (days, bin_index), other.hist[days, bins])
+
+    def _order_statistic(self, cumulative, hist, k):
+        """Estimate the k-th smallest value (0-based) of each day from its histogram."""
+        rows = np.arange(len(k))
+        bin_index = np.minimum((cumulative <= k[:, None]).sum(axis=1), self.bins - 1)
+        before = np.where(bin_index > 0, cumulative[rows, bin_index - 1], 0)
+        in_bin = np.maximum(hist[rows, bin_index], 1)
+        # Spread the observations of a bin evenly across its width
+        return self.lo + self.width * (bin_index + (k - before + 0.5) / in_bin)
+
+    def result(self, quantiles=DEFAULT_QUANTILES):
+        """Return the climatology in the same layout as compute_daily_climatology()."""
+        stats = {'count': self.counts.copy()}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stats['mean'] = np.where(self.counts > 0, self.sums / self.counts, np.nan)
+
+        has_data = (self.counts > 0) & (self.lo is not None)
+        hist = self.hist[has_data]
+        cumulative = np.cumsum(hist, axis=1)
+        n = self.counts[has_data]
+        for q in quantiles:
+            result = np.full(N_DAYS, np.nan)
+            if has_data.any():
+                # Interpolate between order statistics like numpy's default percentile
+                pos = (q / 100.0) * (n - 1)
+                lo = np.floor(pos).astype(np.int64)
+                hi = np.minimum(lo + 1, n - 1)
+                lo_vals = self._order_statistic(cumulative, hist, lo)
+                hi_vals = self._order_statistic(cumulative, hist, hi)
+                result[has_data] = lo_vals + (hi_vals - lo_vals) * (pos - lo)
+            stats[quantile_column(q)] = result
+
+        index = pd.RangeIndex(1, N_DAYS + 1, name='day_of_year')
+        return pd.DataFrame(stats, index=index)
+
+
+def compute_daily_climatology_chunked(csv_file, value_col, date_col='datetime',
+                                      quantiles=DEFAULT_QUANTILES, chunksize=1_000_000, bins=2048,
+                                      calendar_index=None, date_format=None, epoch_unit=None, resampler=None):
+    """Stream a CSV (or its series store) in chunks into a DailyAccumulator and return its climatology.
+
+    Only date_col and value_col are parsed, so peak memory is one chunk plus
+    the fixed-size accumulator. Timestamps are mapped to calendar slots with
+    calendar_index (a Jan 1 CalendarIndex by default). With a DailyResampler,
+    chunks are reduced to daily values first.
+    """
+    calendar_index = calendar_index or CalendarIndex()
+    accumulator = DailyAccumulator(bins)
+    for chunk in iter_series(csv_file, date_col, [value_col], chunksize, date_format, epoch_unit):
+        dates, values = chunk[date_col], chunk[value_col]
+        if resampler is not None:
+            dates, values = resampler.add(dates, values)
+        accumulator.add(calendar_index.slots(dates), values)
+    if resampler is not None:
+        dates, values = resampler.flush()
+        accumulator.add(calendar_index.slots(dates), values)
+    return accumulator.result(quantiles)
+
+
+MISSING_MODES = ('zero', 'interpolate', 'gap')
+
+# How data_plot tracks draw days without observations unless a track sets 'missing'
+DEFAULT_MISSING = 'interpolate'
+
+
+def daily_arrays(daily_stats, columns, missing=DEFAULT_MISSING, leap_slot=None):
+    """Return contiguous float arrays of columns, indexed directly by day of year.
+
+    Each array has N_DAYS + 1 entries with index 0 unused, so the values for
+    days a..b are the zero-copy slice arr[a:b + 1]. Days without observations
+    (count == 0) are handled explicitly: 'interpolate' (the default) fills
+    them linearly from the neighbouring days (wrapping across the year end),
+    'gap' leaves them NaN so lines and envelopes break there and 'zero' sets
+    them to 0.
+    Whatever the mode, the Feb 29 slot (leap_slot, see CalendarIndex) takes
+    the mean of the days either side when it has no observations, as most
+    records have few leap days. A boolean 'missing' mask is returned
+    alongside the columns.
+    """
+    if missing not in MISSING_MODES:
+        raise ValueError(f"Unknown missing-data mode '{missing}', expected one of {MISSING_MODES}.")
+
+    days = np.arange(1, N_DAYS + 1)
+    mask = daily_stats['count'].reindex(days, fill_value=0).to_numpy() == 0
+    # Index of Feb 29 and of its neighbours in the 0-based per-day arrays
+    leap = leap_slot - 1 if leap_slot is not None and mask[leap_slot - 1] else None
+    neighbours = (leap - 1, (leap + 1) % N_DAYS) if leap is not None else ()
+
+    arrays = {}
+    for col in columns:
+        values = daily_stats[col].reindex(days).to_numpy(dtype=np.float64, copy=True)
+        if missing == 'zero':
+            values[mask] = 0.0
+        elif missing == 'gap':
+            values[mask] = np.nan
+        elif mask.any() and not mask.all():
+            values[mask] = np.interp(days[mask], days[~mask], values[~mask], period=N_DAYS)
+        elif mask.all():
+            values[:] = 0.0
+        if leap is not None:
+            values[leap] = values[list(neighbours)].mean()
+        arrays[col] = np.ascontiguousarray(np.concatenate(([np.nan], values)))
+    if leap is not None and not mask[list(neighbours)].any():
+        mask[leap] = False
+    arrays['missing'] = np.concatenate(([True], mask))
+    return arrays
@@ -0,0 +1,307 @@
+"""Validate a calendar config once and keep the result as a binary snapshot.
+
+compile_config() checks the whole config in one pass, normalizes it and
+compiles its tracks into draw operations. The result can be written as a
+versioned pickle snapshot, which worker processes load instead of parsing
+and re-validating the YAML:
+
+    python compiled_config.py ../config/chena.yaml ../config/ross.yaml
+
+writes chena.calendar.pkl and ross.calendar.pkl next to the YAML files.
+DecisionCalendar accepts a snapshot path wherever it accepts a config path;
+a snapshot whose YAML has changed since it was written is recompiled.
+"""
+import argparse
+import copy
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+import warnings
+
+import yaml
+
+from calendar_index import CalendarIndex
+from layout import compile_ops, interval_slots, iter_track_configs
+from palette import COLOR_KEY_PROPERTIES, load_palette
+
+SNAPSHOT_VERSION = 3
+SNAPSHOT_SUFFIX = '.calendar.pkl'
+
+REQUIRED_SECTIONS = ('colors', 'track_configs', 'legend_groups', 'plot_settings')
+LEGEND_ELEMENT_TYPES = ('patch', 'line', 'arrow', 'marker', 'space')
+LEGEND_SETTINGS = ('facecolor', 'edgecolor', 'fontsize', 'title_fontsize')
+
+# Long linestyle names and their matplotlib shorthands
+LINESTYLE_ALIASES = {'solid': '-', 'dashed': '--', 'dotted': ':', 'dashdot': '-.'}
+
+# Track types drawn as filled radial bands
+BAND_TYPES = ('infill', 'arrow')
+
+
+def normalize_linestyle(linestyle):
+    """Return the shorthand of a named linestyle ('dashed' -> '--'); other values unchanged."""
+    if isinstance(linestyle, str):
+        return LINESTYLE_ALIASES.get(linestyle, linestyle)
+    return linestyle
+
+
+def normalize_config(config):
+    """Return a copy of config with linestyles of styles, tracks and legend elements normalized."""
+    config = copy.deepcopy(config)
+    entries = list((config.get('styles') or {}).values())
+    entries.extend(cfg for _, cfg in iter_track_configs(config.get('track_configs') or {}))
+    for group in (config.get('legend_groups') or {}).values():
+        entries.extend(group.get('elements') or [])
+    for entry in entries:
+        if isinstance(entry, dict) and 'linestyle' in entry:
+            entry['linestyle'] = normalize_linestyle(entry['linestyle'])
+    return config
+
+
+def _check_sections(config, errors):
+    for section in REQUIRED_SECTIONS:
+        if not isinstance(config.get(section), dict):
+            errors.append(f"missing '{section}' section")
+    plot_settings = config.get('plot_settings')
+    if isinstance(plot_settings, dict):
+        figsize = (plot_settings.get('figsize') or {}).get('plot')
+        if not (isinstance(figsize, list) and len(figsize) == 2):
+            errors.append("plot_settings.figsize.plot must be [width, height]")
+        legend = plot_settings.get('legend') or {}
+        missing = [key for key in LEGEND_SETTINGS if key not in legend]
+        if missing:
+            errors.append(f"plot_settings.legend is missing {missing}")
+
+
+def _check_legend(config, errors):
+    for group_name, group in (config.get('legend_groups') or {}).items():
+        if not isinstance(group, dict):
+            errors.append(f"legend group '{group_name}' must be a mapping")
+            continue
+        for i, element in enumerate(group.get('elements') or []):
+            elem_type = element.get('type')
+            if elem_type not in LEGEND_ELEMENT_TYPES:
+                errors.append(f"legend group '{group_name}' element {i}: unknown type '{elem_type}'")
+            elif elem_type != 'space' and 'label' not in element:
+                errors.append(f"legend group '{group_name}' element {i}: missing 'label'")
+
+
+def _overlap_warnings(ops, month_ranges):
+    """Warn about band tracks that partly overlap on shared days.
+
+    Bands with identical radii are layered on purpose (e.g. a critical
+    period drawn over a total period) and are not reported.
+    """
+    messages = []
+    n_slots = max(end for _, end in month_ranges.values())
+    bands = [op for op in ops.values() if op['type'] in BAND_TYPES]
+    slots = {op['name']: interval_slots(op['intervals'], n_slots) for op in bands}
+    for i, a in enumerate(bands):
+        for b in bands[i + 1:]:
+            if (a['r_start'], a['r_end']) == (b['r_start'], b['r_end']):
+                continue
+            days = slots[a['name']] & slots[b['name']]
+            shared = [month for month in a['months'] if month in b['months']
+                      and not days.isdisjoint(range(month_ranges[month][0], month_ranges[month][1] + 1))]
+            if shared and a['r_start'] < b['r_end'] and b['r_start'] < a['r_end']:
+                messages.append(f"tracks '{a['name']}' ({a['r_start']}-{a['r_end']}) and '{b['name']}' "
+                                f"({b['r_start']}-{b['r_end']}) partly overlap in {shared}")
+    return messages
+
+
+def _legend_warnings(config, ops, palette):
+    """Warn about legend elements whose color no track draws."""
+    drawn = {op.get(prop) for op in ops.values() for prop in COLOR_KEY_PROPERTIES}
+    drawn.update(color for op in ops.values() if op.get('years') for color in op['year_colors'])
+    messages = []
+    for group_name, group in config['legend_groups'].items():
+        for element in group.get('elements') or []:
+            if element.get('type') == 'space' or 'color' not in element:
+                continue
+            color = palette.resolve_config(element).get('color')
+            if color not in drawn:
+                messages.append(f"legend '{group_name}' element '{element.get('label')}' "
+                                f"has color {color} that no track draws")
+    return messages
+
+
+class CompiledConfig:
+    """A validated, normalized config with its tracks compiled into draw operations.
+
+    ops is compiled against month_ranges (the config's calendar.year_start);
+    source is the fingerprint of the YAML it was compiled from.
+    """
+
+    def __init__(self, config, month_ranges, ops, source=None, warnings=()):
+        self.config = config
+        self.month_ranges = month_ranges
+        self.ops = ops
+        self.source = source or {}
+        self.warnings = list(warnings)
+
+    @property
+    def config_dir(self):
+        """Directory relative paths in the config (e.g. data_sources) are resolved against."""
+        path = self.source.get('path')
+        return os.path.dirname(path) if path else os.getcwd()
+
+
+def _fingerprint(path):
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    with open(path, 'rb') as file:
+        digest = hashlib.sha256(file.read()).hexdigest()
+    return {'path': path, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': digest}
+
+
+def compile_config(config, source=None, month_ranges=None):
+    """Validate and compile a config dict, raising one ValueError listing every problem.
+
+    Tracks are compiled against month_ranges, by default those generated
+    from the config's calendar section (year_start and sectors). Partly overlapping bands and
+    legend entries that match no track are reported as warnings on the
+    result rather than errors.
+    """
+    errors = []
+    _check_sections(config, errors)
+    if errors:
+        raise ValueError("Invalid configuration:\n  " + "\n  ".join(errors))
+
+    config = normalize_config(config)
+    _check_legend(config, errors)
+    for name, track_config in iter_track_configs(config['track_configs']):
+        if not isinstance(track_config, dict):
+            errors.append(f"track '{name}' must be a mapping")
+
+    if month_ranges is None:
+        try:
+            month_ranges = CalendarIndex.from_config(config.get('calendar')).month_ranges
+        except ValueError as exc:
+            raise ValueError(f"Invalid configuration:\n  {exc}") from None
+    ops = {}
+    try:
+        palette = load_palette(config['colors'], config.get('styles'))
+    except ValueError as exc:
+        errors.append(str(exc))
+        palette = None
+    if palette is not None:
+        legend_configs = []
+        for group in config['legend_groups'].values():
+            if isinstance(group, dict):
+                legend_configs.append(group)
+                legend_configs.extend(group.get('elements') or [])
+        try:
+            palette.check([cfg[prop] for cfg in legend_configs for prop in COLOR_KEY_PROPERTIES if prop in cfg],
+                          [cfg['style'] for cfg in legend_configs if 'style' in cfg])
+        except ValueError as exc:
+            errors.append(f"legend_groups: {exc}")
+        if all(isinstance(cfg, dict) for _, cfg in iter_track_configs(config['track_configs'])):
+            try:
+                ops = compile_ops(config['track_configs'], month_ranges, palette)
+            except ValueError as exc:
+                errors.append(str(exc))
+    if errors:
+        raise ValueError("Invalid configuration:\n  " + "\n  ".join(errors))
+
+    messages = _overlap_warnings(ops, month_ranges) + _legend_warnings(config, ops, palette)
+    return CompiledConfig(config, month_ranges, ops, source, messages)
+
+
+def compile_file(path):
+    """Read and compile a YAML config file."""
+    with open(path, 'r') as file:
+        config = yaml.safe_load(file)
+    return compile_config(config, source=_fingerprint(path))
+
+
+def is_snapshot(path):
+    return os.fspath(path).endswith(SNAPSHOT_SUFFIX)
+
+
+def snapshot_path(config_path):
+    """Default snapshot path of a YAML config: chena.yaml -> chena.calendar.pkl."""
+    return os.path.splitext(config_path)[0] + SNAPSHOT_SUFFIX
+
+
+def write_snapshot(compiled, path):
+    """Write a compiled config as a versioned pickle snapshot (atomically)."""
+    payload = {
+        'version': SNAPSHOT_VERSION,
+        'created': time.time(),
+        'source': compiled.source,
+        'config': compiled.config,
+        'month_ranges': compiled.month_ranges,
+        'ops': compiled.ops,
+        'warnings': compiled.warnings,
+    }
+    # Per process and thread, so concurrent writers never share a temporary file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        pickle.dump(payload, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_snapshot(path):
+    """Read a snapshot written by write_snapshot()."""
+    with open(path, 'rb') as file:
+        payload = pickle.load(file)
+    if not isinstance(payload, dict) or payload.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"'{path}' is not a version {SNAPSHOT_VERSION} config snapshot; recompile it.")
+    return CompiledConfig(payload['config'], payload['month_ranges'], payload['ops'],
+                          payload['source'], payload['warnings'])
+
+
+def _is_stale(compiled):
+    """True if the YAML a snapshot was compiled from has changed since."""
+    path = compiled.source.get('path')
+    if not path or not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    if (stat.st_mtime_ns, stat.st_size) == (compiled.source['mtime_ns'], compiled.source['size']):
+        return False
+    return _fingerprint(path)['sha256'] != compiled.source['sha256']
+
+
+def load_compiled(path):
+    """Load a compiled config from a YAML file or a snapshot.
+
+    A snapshot whose source YAML has changed is recompiled from the YAML.
+    """
+    if not is_snapshot(path):
+        return compile_file(path)
+    compiled = read_snapshot(path)
+    if _is_stale(compiled):
+        warnings.warn(f"Config snapshot '{path}' is older than {compiled.source['path']}; recompiling.")
+        compiled = compile_file(compiled.source['path'])
+    return compiled
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate calendar configs and write binary snapshots.")
+    parser.add_argument('configs', nargs='+', help="YAML config files")
+    parser.add_argument('--check', action='store_true', help="only validate, do not write snapshots")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for path in args.configs:
+        try:
+            compiled = compile_file(path)
+        except ValueError as exc:
+            print(f"{path}: {exc}")
+            failed += 1
+            continue
+        for message in compiled.warnings:
+            print(f"{path}: warning: {message}")
+        if args.check:
+            print(f"{path}: ok ({len(compiled.ops)} tracks)")
+        else:
+            print(f"{path}: wrote {write_snapshot(compiled, snapshot_path(path))} ({len(compiled.ops)} tracks)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
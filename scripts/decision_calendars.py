@@ -1,52 +1,343 @@
-import yaml
-from pycirclize import Circos
-from IPython.display import Image, display
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.patches import Patch
-from matplotlib.lines import Line2D
+import copy
+import functools
 import os
+import time
+import warnings
+from contextlib import contextmanager, nullcontext
 import numpy as np
 
+from climatology import (DEFAULT_COMPLETENESS, DEFAULT_QUANTILES, N_DAYS, DailyRecord, DailyResampler,
+                         compute_daily_climatology, compute_daily_climatology_chunked, daily_arrays,
+                         scale_climatology, scale_factor, quantile_column)
+from layout import STATIC_TRACK_TYPES, compile_ops, index_by_month, iter_track_configs
+from palette import load_palette
+from export import export_resolutions, save_figure
+from sources import DataSourceRegistry, load_options
+from series_store import read_series
+from calendar_index import CalendarIndex
+from profiling import RenderProfiler
+from plotting import circos_class, pyplot
+from compiled_config import compile_config, load_compiled
+
+# Decoded center images kept in memory, least recently used evicted first
+CENTER_IMAGE_CACHE_SIZE = 8
+
+
+@functools.lru_cache(maxsize=CENTER_IMAGE_CACHE_SIZE)
+def _decode_image(path, mtime_ns, size):
+    """Decode an image file to RGBA; mtime_ns and size make an edited file a new entry."""
+    from PIL import Image as PILImage
+
+    with PILImage.open(path) as im:
+        return np.asarray(im.convert('RGBA'))
+
+
+def load_center_image(image):
+    """Return a center image as an RGBA array, decoding each file only once.
+
+    image may be a file path, a PIL image or an already loaded array. The
+    last CENTER_IMAGE_CACHE_SIZE decoded files are shared by every calendar.
+    """
+    from PIL import Image as PILImage
+
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, PILImage.Image):
+        return np.asarray(image.convert('RGBA'))
+
+    path = os.path.abspath(image)
+    stat = os.stat(path)
+    return _decode_image(path, stat.st_mtime_ns, stat.st_size)
+
+
 class DecisionCalendar:
     def __init__(self, config_path='ross.yaml', 
                  streamflow_csv=None, 
-                 swe_csv=None):
+                 swe_csv=None,
+                 quantiles=DEFAULT_QUANTILES,
+                 cache=None,
+                 chunksize=None,
+                 histogram_bins=2048,
+                 data_sources=None,
+                 year_start=None,
+                 profiler=None):
+        # Optional RenderProfiler recording the time spent in each render stage
+        self.profiler = profiler
+
+        # Calendar start (e.g. 'Oct' for the water year), overrides the config's calendar.year_start
+        self._year_start = year_start
+
         # Load configuration
-        self.config = self._load_config(config_path)
+        self.config_path = config_path
+        with self._stage('config'):
+            self._apply_config(self._load_compiled(config_path))
+
+        # Percentiles computed for data plots, plus any envelope requested by a track
+        self.quantiles = self._collect_quantiles(quantiles)
+
+        # Optional ClimatologyCache shared across calendars
+        self.cache = cache
+
+        # Stream CSVs in chunks of this many rows instead of loading them whole
+        self.chunksize = chunksize
+        self.histogram_bins = histogram_bins
+
+        # Named series for data_plot tracks, loaded on first use
+        self._source_args = (streamflow_csv, swe_csv, data_sources)
+        self.sources = self._build_sources(*self._source_args)
+        # Day-of-year arrays derived from each series, shared by every sector
+        self._daily_arrays = {}
+        # Parsed records of the series whose individual years are overlaid
+        self._records = {}
+
+    def with_data(self, streamflow_csv=None, swe_csv=None, data_sources=None):
+        """Return a calendar with the same config drawing other data files.
+
+        The parsed config, palette and compiled tracks are shared with this
+        calendar, so one calendar per basin-year (e.g. for small multiples)
+        does not re-read the YAML.
+        """
+        other = copy.copy(self)
+        other._source_args = (streamflow_csv, swe_csv, data_sources)
+        other.sources = other._build_sources(*other._source_args)
+        # Files both calendars draw are not read again
+        other.sources.adopt(self.sources)
+        other._daily_arrays = {}
+        other.__dict__.pop('_render_state', None)
+        return other
+
+    def with_config(self, overrides):
+        """Return a calendar with some config sections replaced, drawing this calendar's data.
+
+        overrides maps top-level sections (e.g. 'track_configs',
+        'plot_settings') to their new content. The result is validated like
+        a loaded config, and series this calendar already loaded are reused.
+        """
+        config = dict(self.config)
+        config.update(overrides)
+        other = copy.copy(self)
+        other._apply_config(compile_config(config, source=self.compiled.source))
+        other._refresh_sources()
+        other.__dict__.pop('_render_state', None)
+        return other
+
+    def _stage(self, name):
+        """Context manager timing a render stage when a profiler is attached."""
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.stage(name)
+
+    @contextmanager
+    def profile(self, path=None, memory=False):
+        """Profile the renders inside the block and optionally write the result as JSON.
+
+        Yields the RenderProfiler; call to_dict() on it for the per-stage
+        calls, wall time and (with memory=True) peak memory.
+
+            with calendar.profile('../output/chena_profile.json'):
+                fig = calendar.create_plot(center_image=center_image)
+                calendar.save_plot(fig, output)
+        """
+        previous = self.profiler
+        self.profiler = RenderProfiler(memory=memory, label=self.config_path)
+        self.profiler.start()
+        try:
+            yield self.profiler
+        finally:
+            profiler, self.profiler = self.profiler, previous
+            profiler.stop()
+            if path is not None:
+                profiler.write(path)
+
+    def _load_compiled(self, path):
+        """Load a validated config from a YAML file or a compiled snapshot."""
+        compiled = load_compiled(path)
+        for message in compiled.warnings:
+            warnings.warn(f"{path}: {message}")
+        return compiled
+
+    def _apply_config(self, compiled):
+        """Set colors, sectors, tracks, legend groups and plot settings from a compiled config."""
+        self.compiled = compiled
+        self.config = compiled.config
 
         # Define colors from config
         self.colors = self._parse_colors(self.config['colors'])
 
-        # Define month ranges and sectors
-        self.month_ranges = self.config['month_ranges']
+        # Colors and styles flattened into lookup tables, shared between calendars
+        self.palette = load_palette(self.colors, self.config.get('styles'))
+
+        # Leap-year-safe calendar slots; month ranges and sectors are generated from it
+        self.calendar_index = CalendarIndex.from_config(self.config.get('calendar'), self._year_start)
+        self.month_ranges = self.calendar_index.month_ranges
+        if 'month_ranges' in self.config and self.config['month_ranges'] != self.month_ranges:
+            warnings.warn("month_ranges in the config are ignored; they are generated from calendar.year_start.")
         # Update sectors to match number of days per month
         self.sectors = self._generate_sectors(self.month_ranges)
 
         # Define track configurations
         self.track_configs = self.config['track_configs']
 
+        # Compiled with the config unless year_start moved the sectors, then compiled on first render
+        self._ops = compiled.ops if compiled.month_ranges == self.month_ranges else None
+        self._layout = None
+
         # Define legend groups
         self.legend_groups = self.config['legend_groups']
 
         # Define plot settings
         self.plot_settings = self.config['plot_settings']
 
-        if streamflow_csv is not None:
-            self.streamflow_data = self._load_and_process_data(streamflow_csv, value_col='discharge', date_col='datetime')
-        else:
-            self.streamflow_data = None
+    def _build_sources(self, streamflow_csv, swe_csv, data_sources):
+        """Register data sources from the config, then from the constructor arguments.
 
+        Paths in the config's data_sources section are relative to the YAML file.
+        """
+        sources = DataSourceRegistry(self._load_and_process_data)
+        for name, source in (self.config.get('data_sources') or {}).items():
+            sources.register(name, source, base_dir=self.compiled.config_dir)
+        for name, source in (data_sources or {}).items():
+            sources.register(name, source)
+        if streamflow_csv is not None:
+            sources.register('streamflow', streamflow_csv)
         if swe_csv is not None:
-            self.swe_data = self._load_and_process_data(swe_csv, value_col='swe', date_col='datetime')
+            sources.register('swe', swe_csv)
+        return sources
+
+    def _refresh_sources(self):
+        """Re-register data sources after a config change, keeping loaded series when possible."""
+        old_sources, old_quantiles = self.sources, self.quantiles
+        self.quantiles = self._collect_quantiles(self.quantiles)
+        self.sources = self._build_sources(*self._source_args)
+        if self.quantiles == old_quantiles:
+            self.sources.adopt(old_sources)
         else:
-            self.swe_data = None
-
-    def _load_config(self, path):
-        """Load YAML configuration file."""
-        with open(path, 'r') as file:
-            config = yaml.safe_load(file)
-        return config
+            # New envelope percentiles, every series has to be recomputed
+            self._daily_arrays = {}
+
+    def _get_series(self, op):
+        """Return the processed series drawn by a data_plot operation, or None if it has no source."""
+        spec = self._resolve_spec(op)
+        if spec is None:
+            return None
+        return self.sources.get(spec)
+
+    def _resolve_spec(self, op):
+        """Spec of the source a data_plot operation draws, with the track's overrides (None if unknown)."""
+        return self.sources.resolve(op['source'], date_col=op['date_col'], value_col=op['value_col'],
+                                    daily=op['daily'], min_completeness=op['min_completeness'])
+
+    def _overlay_files(self):
+        """Files of the series data_plot tracks overlay individual years of."""
+        files = set()
+        for op in self.ops.values():
+            if op['type'] == 'data_plot' and op.get('years'):
+                spec = self._resolve_spec(op)
+                if spec is not None:
+                    files.add(spec['file'])
+        return files
+
+    def _resampler(self, daily='mean', min_completeness=DEFAULT_COMPLETENESS):
+        """The DailyResampler of a series, or None when it keeps every observation."""
+        return None if daily == 'none' else DailyResampler(daily, min_completeness)
+
+    def _report_gaps(self, csv_file, resampler):
+        """Warn about sub-daily days dropped as incomplete."""
+        dropped, missing = resampler.summary()
+        if dropped and resampler.samples_per_day > 1:
+            warnings.warn(f"{os.path.basename(csv_file)}: dropped {dropped} days with less than "
+                          f"{resampler.min_completeness:.0%} of {resampler.samples_per_day} observations "
+                          f"({missing} more days have none); daily_gaps() lists them.")
+
+    def _read_daily(self, csv_file, value_col, date_col='datetime', date_format=None, epoch_unit=None,
+                    daily='mean', min_completeness=DEFAULT_COMPLETENESS):
+        """Read a series and reduce it to daily values; returns (dates, values, resampler)."""
+        df = read_series(csv_file, date_col, [value_col], date_format, epoch_unit)
+        resampler = self._resampler(daily, min_completeness)
+        if resampler is None:
+            return df[date_col], df[value_col], None
+        with self._stage('resample'):
+            dates, values = resampler.resample(df[date_col], df[value_col])
+        return dates, values, resampler
+
+    def _get_record(self, csv_file, value_col, date_col='datetime', date_format=None, epoch_unit=None,
+                    daily='mean', min_completeness=DEFAULT_COMPLETENESS):
+        """Return the DailyRecord of a series, reading its CSV or series store on first use."""
+        key = (os.path.abspath(csv_file), value_col, date_col, date_format, epoch_unit, daily, min_completeness,
+               self.calendar_index.start_month)
+        if key not in self._records:
+            dates, values, resampler = self._read_daily(csv_file, value_col, date_col, date_format, epoch_unit,
+                                                        daily, min_completeness)
+            if resampler is not None:
+                self._report_gaps(csv_file, resampler)
+            self._records[key] = DailyRecord.from_dates(dates, values, self.calendar_index)
+        return self._records[key]
+
+    def _resolve_years(self, years, record):
+        """Replace 'current' by the latest year of the record and drop years it does not cover."""
+        available = set(record.years.tolist())
+        resolved = []
+        for year in years:
+            if year == 'current':
+                if not available:
+                    continue
+                year = max(available)
+            if int(year) in available:
+                resolved.append(int(year))
+            else:
+                warnings.warn(f"Year {year} is not in the record, it is not drawn.")
+        return list(dict.fromkeys(resolved))
+
+    def year_ranks(self, source, years, date_col=None, value_col=None, daily=None, min_completeness=None):
+        """Daily means of individual years of a source and their percentile rank against its climatology.
+
+        years may include 'current' (the latest year of the record). Returns
+        a DataFrame indexed by calendar slot (1..366) with a '<year>' column
+        of daily means and a '<year>_rank' column of percentile ranks (0-100)
+        for every year in the record.
+        """
+        spec = self.sources.resolve(source, date_col=date_col, value_col=value_col, daily=daily,
+                                    min_completeness=min_completeness)
+        if spec is None:
+            raise ValueError(f"Unknown data source '{source}'.")
+        with self._stage('load_data'):
+            record = self._get_record(spec['file'], spec['value_col'], spec['date_col'], **load_options(spec))
+        years = self._resolve_years(years, record)
+        means = record.year_means(years)
+        ranks = record.percentile_rank(means)
+        columns = {}
+        for row, year in enumerate(years):
+            columns[str(year)] = means[row, 1:]
+            columns[f"{year}_rank"] = ranks[row, 1:]
+        return pd.DataFrame(columns, index=pd.RangeIndex(1, N_DAYS + 1, name='day_of_year'))
+
+    def daily_gaps(self, source, date_col=None, value_col=None, daily=None, min_completeness=None):
+        """Days of a source the daily resample stage drops or finds no observations for.
+
+        Returns a DataFrame indexed by date with the number of valid
+        observations and the completeness (0-1) of each such day.
+        """
+        spec = self.sources.resolve(source, date_col=date_col, value_col=value_col, daily=daily,
+                                    min_completeness=min_completeness)
+        if spec is None:
+            raise ValueError(f"Unknown data source '{source}'.")
+        options = load_options(spec)
+        options['daily'] = 'mean' if options['daily'] == 'none' else options['daily']
+        with self._stage('load_data'):
+            return self._read_daily(spec['file'], spec['value_col'], spec['date_col'], **options)[2].gaps()
+
+    @property
+    def streamflow_data(self):
+        """Processed 'streamflow' source with its default columns (None if not configured)."""
+        spec = self.sources.resolve('streamflow')
+        return self.sources.get(spec) if spec is not None else None
+
+    @property
+    def swe_data(self):
+        """Processed 'swe' source with its default columns (None if not configured)."""
+        spec = self.sources.resolve('swe')
+        return self.sources.get(spec) if spec is not None else None
 
     def _parse_colors(self, colors_config):
         """Parse colors from configuration."""
@@ -55,17 +346,7 @@ class DecisionCalendar:
 
     def _get_color(self, color_key):
         """Retrieve color from parsed colors using the full key."""
-        keys = color_key.split('.')
-        color = self.colors
-        for key in keys:
-            if isinstance(color, dict) and key in color:
-                color = color[key]
-            else:
-                raise ValueError(f"Color key '{color_key}' not found in configuration.")
-        if isinstance(color, str):
-            return color
-        else:
-            raise ValueError(f"Color key '{color_key}' does not resolve to a color string.")
+        return self.palette.color(color_key)
 
     def _generate_sectors(self, month_ranges):
         # month_ranges is a dict {Month: [start_day, end_day]}
@@ -77,33 +358,67 @@ class DecisionCalendar:
             sectors[month] = num_days
         return sectors
     
-    def _load_and_process_data(self, csv_file, value_col, date_col='datetime'):
-        df = pd.read_csv(csv_file, parse_dates=[date_col])
-        df['day_of_year'] = df[date_col].dt.dayofyear
-
-        def percentile_func(x, q):
-            x_clean = x.dropna()
-            return np.percentile(x_clean, q) if len(x_clean) > 0 else np.nan
-
-        grouped = df.groupby('day_of_year')[value_col]
-        daily_stats = grouped.agg(
-            mean='mean',
-            p10=lambda x: percentile_func(x, 10),
-            p90=lambda x: percentile_func(x, 90)
+    def _collect_quantiles(self, quantiles):
+        """Merge requested quantiles with the envelope bounds of every data_plot track."""
+        collected = set(quantiles)
+        for _, track_config in iter_track_configs(self.track_configs):
+            if track_config.get('type') == 'data_plot':
+                collected.update(track_config.get('envelope', [10, 90]))
+        return tuple(sorted(collected))
+
+    def _load_and_process_data(self, csv_file, value_col, date_col='datetime', date_format=None, epoch_unit=None,
+                               daily='mean', min_completeness=DEFAULT_COMPLETENESS):
+        """Load a time series and compute its scaled daily climatology.
+
+        The series is read from its CSV, timestamps parsed with date_format
+        or epoch_unit when given, or from a series store (see series_store.py).
+        Sub-daily observations are first reduced to one daily value (see
+        DailyResampler) unless daily is 'none'. Timestamps are grouped by calendar slot (see CalendarIndex), so every
+        calendar day keeps its own slot in leap years. Returns a DataFrame
+        indexed by slot (1..366) with mean, percentile
+        and '<col>_scaled' columns. When a cache is configured, unchanged inputs
+        are read back from it instead of being re-parsed. With a chunksize the
+        file is streamed and percentiles come from fixed-size histograms.
+        """
+        def compute():
+            if self.chunksize:
+                resampler = self._resampler(daily, min_completeness)
+                daily_stats = compute_daily_climatology_chunked(csv_file, value_col, date_col, self.quantiles,
+                                                                self.chunksize, self.histogram_bins,
+                                                                self.calendar_index, date_format, epoch_unit,
+                                                                resampler)
+            elif os.path.abspath(csv_file) in self._overlay_files():
+                # Keep the parsed record, the overlaid years are sliced from it
+                record = self._get_record(csv_file, value_col, date_col, date_format, epoch_unit, daily,
+                                          min_completeness)
+                daily_stats = record.climatology(self.quantiles)
+                resampler = None
+            else:
+                dates, values, resampler = self._read_daily(csv_file, value_col, date_col, date_format,
+                                                            epoch_unit, daily, min_completeness)
+                daily_stats = compute_daily_climatology(self.calendar_index.slots(dates), values, self.quantiles)
+            if resampler is not None:
+                self._report_gaps(csv_file, resampler)
+            return scale_climatology(daily_stats, self.quantiles)
+
+        if self.cache is None:
+            with self._stage('load_data'):
+                return compute()
+        key = self.cache.make_key(
+            csv_file,
+            value_col=value_col,
+            date_col=date_col,
+            date_format=date_format,
+            epoch_unit=epoch_unit,
+            daily=daily,
+            min_completeness=min_completeness,
+            quantiles=self.quantiles,
+            aggregation='calendar_slot',
+            year_start=self.calendar_index.start_month,
+            streaming_bins=self.histogram_bins if self.chunksize else None,
         )
-
-        daily_stats = daily_stats.fillna(0)
-
-        max_val = daily_stats['p90'].max()
-        if max_val == 0:
-            max_val = 1.0
-
-        daily_stats['mean_scaled'] = daily_stats['mean'] / max_val
-        daily_stats['p10_scaled'] = daily_stats['p10'] / max_val
-        daily_stats['p90_scaled'] = daily_stats['p90'] / max_val
-
-        data_dict = daily_stats.to_dict('index')
-        return data_dict
+        with self._stage('load_data'):
+            return self.cache.get_or_compute(key, compute)
 
     def _scale_data(self, series, max_val):
         # Scale data to fit into a predefined radial range later
@@ -111,87 +426,87 @@ class DecisionCalendar:
         # Here we just normalize from 0 to 1
         return series / max_val if max_val != 0 else series
 
-    def _add_track(self, sector, track_config):
-        """Add tracks to sectors based on configuration."""
-        sector_month = sector.name
-        if sector_month in track_config.get('months', []):
-            ttype = track_config.get('type')
-
-            if ttype in ["infill", "arrow", "line", "marker"]:
-                self._add_static_track(sector, track_config)
-            elif ttype == "data_plot":
-                if track_config['data_type'] == 'streamflow' and self.streamflow_data is not None:
-                    self._add_data_plot(sector, track_config)
-                elif track_config['data_type'] == 'swe' and self.swe_data is not None:
-                    self._add_data_plot(sector, track_config)
-                else:
-                    print(f"No data available for {track_config['data_type']}.")
-    
-    def _add_static_track(self, sector, track_config):
-        """Add static (existing) track types: infill, arrow, line, marker."""
-        ttype = track_config.get('type')
-        sector_month = sector.name
-        if ttype == "infill":
-            track = sector.add_track((track_config['r_start'], track_config['r_end']))
-            track.axis()
-            track.rect(
-                0, sector.size,
-                r_lim=(track_config['r_start'], track_config['r_end']),
-                facecolor=self._get_color(track_config['color']),
-                edgecolor='none',
-                alpha=track_config.get('alpha', 1.0),
-                zorder=1
-            )
-        elif ttype == "arrow":
-            track = sector.add_track((track_config['r_start'], track_config['r_end']))
-            track.arrow(
-                start=0,
-                end=sector.size,
-                shaft_ratio=0.3,
-                head_length=0,
-                fc=self._get_color(track_config['color']),
-                ec=self._get_color(track_config['color']),
-                alpha=0.7,
-                linestyle=track_config.get('linestyle', '-'),
-                linewidth=track_config.get('linewidth', 1),
-                zorder=1
-            )
-        elif ttype == "line":
-            track = sector.add_track((track_config['r_start'], track_config['r_end']))
-            track.line(
-                x=[0, sector.size],
-                y=[track_config['r_start'], track_config['r_start']],
-                vmin=track_config['r_start'],
-                vmax=track_config['r_end'],
-                color=self._get_color(track_config['color']),
-                linestyle=track_config.get('linestyle', '-'),
-                linewidth=track_config.get('linewidth', 1),
-                zorder=1
-            )
-        elif ttype == "marker":
-            # Marker at a specific radial point defined in config
-            point = track_config['r_points'][sector_month]
-            track = sector.add_track((point-2, point))
-            track.scatter(
-                [track_config['position']],
-                [point],
-                vmin=point-2,
-                vmax=point,
-                s=track_config.get('s', 200),
-                color=self._get_color(track_config['color']),
-                marker=track_config['marker'],
-                linewidth=track_config.get('linewidth', 1),
-                zorder=5
-            )
-
-    def _add_data_plot(self, sector, track_config):
-        data_type = track_config['data_type']
-        data = self.streamflow_data if data_type == 'streamflow' else self.swe_data
-
-        r_start = track_config['r_start']
-        r_end = track_config['r_end']
-        color_mean = self._get_color(track_config['color_mean'])
-        color_env = self._get_color(track_config['color_envelope'])
+    @property
+    def ops(self):
+        """Track configs compiled into {track name: draw operation}."""
+        if self._ops is None:
+            self._ops = compile_ops(self.track_configs, self.month_ranges, self.palette)
+        return self._ops
+
+    @property
+    def layout(self):
+        """Track configs compiled into {month: [draw operation, ...]}."""
+        if self._layout is None:
+            self._layout = index_by_month(self.ops, self.month_ranges)
+        return self._layout
+
+    def _add_tracks(self, circos, ops=None):
+        """Add the data plots of compiled ops (all by default) to a Circos, in every month they list."""
+        layout = self.layout if ops is None else index_by_month(ops, self.month_ranges)
+        for sector in circos.sectors:
+            for op in layout[sector.name]:
+                if op['type'] == "data_plot":
+                    self._add_track(sector, op)
+
+    def _add_static_tracks(self, ax, ops=None):
+        """Draw the infill, arrow, line and marker ops (all by default) onto the plot axes as collections."""
+        from track_artists import add_static_tracks
+
+        ops = self.ops if ops is None else ops
+        with self._stage('track.static'):
+            return add_static_tracks(ax, [op for op in ops.values() if op['type'] in STATIC_TRACK_TYPES],
+                                     self.month_ranges)
+
+    def _add_track(self, sector, op):
+        """Add a compiled data_plot operation to a sector."""
+        with self._stage(f"track.{op['type']}"):
+            data = self._get_series(op)
+            if data is not None:
+                self._add_data_plot(sector, op, data)
+            else:
+                warnings.warn(f"No data available for {op['source']}, track '{op['name']}' is not drawn.")
+
+    def _get_daily_arrays(self, data, op):
+        """Return day-of-year arrays (mean and envelope) for a series, built once per track setting."""
+        low_q, high_q = op['envelope']
+        columns = ('mean_scaled', f"{quantile_column(low_q)}_scaled", f"{quantile_column(high_q)}_scaled")
+        key = (id(data), columns, op['missing'])
+        if key not in self._daily_arrays:
+            arrays = daily_arrays(data, columns, op['missing'], self.calendar_index.leap_slot)
+            self._daily_arrays[key] = [arrays[col] for col in columns] + [arrays['missing']]
+        return self._daily_arrays[key]
+
+    def _get_year_arrays(self, op, data):
+        """Return (scale, [(year, color, array)]) for the years a data_plot overlays.
+
+        Year arrays are slot-indexed daily means scaled like the climatology.
+        scale is above 1 when a year exceeds the envelope's upper bound; the
+        whole track is then divided by it so every line stays inside the track.
+        """
+        spec = self._resolve_spec(op)
+        key = ('years', spec['file'], spec['value_col'], spec['date_col'], tuple(op['years']), id(data))
+        if key not in self._daily_arrays:
+            with self._stage('load_data'):
+                record = self._get_record(spec['file'], spec['value_col'], spec['date_col'],
+                                          **load_options(spec))
+            years = self._resolve_years(op['years'], record)
+            means = record.year_means(years) / scale_factor(data, self.quantiles)
+            scale = max(1.0, np.nanmax(means)) if np.isfinite(means).any() else 1.0
+            colors = [op['year_colors'][i % len(op['year_colors'])] for i in range(len(years))]
+            self._daily_arrays[key] = (scale, list(zip(years, colors, means)))
+        return self._daily_arrays[key]
+
+    @staticmethod
+    def _runs(present):
+        """Slices of the runs of True in a boolean array."""
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], present, [False])).astype(np.int8)))
+        return [slice(a, b) for a, b in zip(edges[::2], edges[1::2])]
+
+    def _add_data_plot(self, sector, op, data):
+        r_start = op['r_start']
+        r_end = op['r_end']
+        color_mean = op['color_mean']
+        color_env = op['color_envelope']
 
         start_day, end_day = self.month_ranges[sector.name]
         num_days = end_day - start_day + 1
@@ -199,68 +514,183 @@ class DecisionCalendar:
         track = sector.add_track((r_start, r_end))
         track.axis()
 
+        # Zero-copy slices of the day-of-year arrays for this month
+        mean, low, high, missing = self._get_daily_arrays(data, op)
+        days = slice(start_day, end_day + 1)
         xs = np.arange(num_days)
-        mean_vals, p10_vals, p90_vals = [], [], []
-
-        for day_of_year in range(start_day, end_day+1):
-            if day_of_year in data:
-                mean_scaled = data[day_of_year]['mean_scaled']
-                p10_scaled = data[day_of_year]['p10_scaled']
-                p90_scaled = data[day_of_year]['p90_scaled']
-            else:
-                # If no data, default to zero
-                mean_scaled = p10_scaled = p90_scaled = 0.0
-
-            mean_vals.append(mean_scaled)
-            p10_vals.append(p10_scaled)
-            p90_vals.append(p90_scaled)
 
-        mean_vals = np.array(mean_vals)
-        p10_vals = np.array(p10_vals)
-        p90_vals = np.array(p90_vals)
+        scale, years = self._get_year_arrays(op, data) if op.get('years') else (1.0, [])
+        if scale != 1.0:
+            mean, low, high = mean / scale, low / scale, high / scale
 
-        track.fill_between(xs, p10_vals, p90_vals, fc=color_env, alpha=0.6, edgecolor='none', zorder=2, vmin=0, vmax=1)
-        track.line(xs, mean_vals, color=color_mean, linewidth=2, zorder=3, vmin=0, vmax=1)
-
-    def create_plot(self, center_image=None):
-        """Create the circular decision calendar plot."""
-        figsize = self.plot_settings['figsize']['plot']
-
-        # Initialize Circos plot
-        circos = Circos(
+        if op['missing'] == 'gap':
+            # Draw each run of days with data separately, leaving gaps between them
+            runs = self._runs(~missing[days])
+        else:
+            runs = [slice(0, num_days)]
+
+        for run in runs:
+            run_xs = xs[run]
+            run_days = slice(start_day + run.start, start_day + run.stop)
+            track.fill_between(run_xs, low[run_days], high[run_days], fc=color_env, alpha=0.6, edgecolor='none', zorder=2, vmin=0, vmax=1)
+            track.line(run_xs, mean[run_days], color=color_mean, linewidth=2, zorder=3, vmin=0, vmax=1)
+
+        for _, color, values in years:
+            values = values[days] / scale
+            for run in self._runs(~np.isnan(values)):
+                track.line(xs[run], values[run], color=color, linewidth=op['year_linewidth'], zorder=4,
+                           vmin=0, vmax=1)
+
+    def _new_circos(self):
+        """Create an empty Circos with one sector per month."""
+        Circos = circos_class()
+        return Circos(
             sectors=self.sectors,
             space=0,
             start=0,
             end=360
         )
 
+    def create_plot(self, center_image=None, center_image_size=0.15, incremental=False):
+        """Create the circular decision calendar plot.
+
+        center_image may be a file path, a PIL image or an RGBA array; it is
+        drawn once in the middle of the calendar at center_image_size (fraction
+        of the plot axes). With incremental=True each track is drawn as its own
+        group of artists so that update_plot() can later redraw only the tracks
+        whose configuration changed.
+        """
+        figsize = self.plot_settings['figsize']['plot']
+
+        # Initialize Circos plot
+        circos = self._new_circos()
+
         # Plot sectors
         for sector in circos.sectors:
             # Setup sector
             sector.axis(fc="none", alpha=0.5, zorder=0)
             sector.text(sector.name, size=15, r=20, zorder=6)  # Ensure text is on top
 
-            # Add tracks based on configurations
-            for config_name, track_config in self.track_configs.items():
-                if isinstance(track_config, list):
-                    for cfg in track_config:
-                        self._add_track(sector, cfg)
-                else:
-                    self._add_track(sector, track_config)
+        if not incremental:
+            self._add_tracks(circos)
 
-            if center_image is not None:
-                sector.raster(center_image, r=0, size=0.15)
+        # Create figure
+        with self._stage('plotfig'):
+            fig = circos.plotfig(figsize=figsize)
+        ax = fig.axes[0]
 
-        # Create figurex
-        fig = circos.plotfig(figsize=figsize)
+        track_artists = {}
+        if not incremental:
+            self._add_static_tracks(ax)
+        else:
+            for name, op in self.ops.items():
+                track_artists[name] = self._draw_op(ax, op)
+
+        if center_image is not None:
+            with self._stage('center_image'):
+                self._add_center_image(ax, center_image, center_image_size)
 
         # Add legend
-        self._add_legend(fig)
+        with self._stage('legend'):
+            legend_ax = self._add_legend(fig)
+
+        if incremental:
+            self._render_state = {
+                'fig': fig,
+                'ax': ax,
+                'ops': dict(self.ops),
+                'track_artists': track_artists,
+                'legend_ax': legend_ax,
+                'legend_groups': self.legend_groups,
+                'center_image': center_image,
+                'center_image_size': center_image_size,
+            }
 
         return fig
 
+    def _draw_op(self, ax, op):
+        """Draw one compiled track in every month it spans and return the artists added to ax."""
+        if op['type'] in STATIC_TRACK_TYPES:
+            return self._add_static_tracks(ax, {op['name']: op})
+        circos = self._new_circos()
+        self._add_tracks(circos, {op['name']: op})
+        before = set(ax.get_children())
+        with self._stage('plotfig'):
+            circos.plotfig(ax=ax)
+        return [artist for artist in ax.get_children() if artist not in before]
+
+    def update_plot(self, config_path=None, track_configs=None, legend_groups=None):
+        """Apply a new config to the figure from create_plot(incremental=True).
+
+        Only the tracks whose compiled draw operation changed are removed and
+        redrawn; unchanged tracks, data plots and the center image are kept.
+        The legend is rebuilt only if its groups or the palette changed. A
+        change to month_ranges redraws the whole figure. Returns a summary dict
+        with the added, removed and changed track names and the figure.
+        """
+        state = getattr(self, '_render_state', None)
+        if state is None:
+            raise ValueError("update_plot() needs a figure created with create_plot(incremental=True).")
+
+        old_palette = self.palette
+        old_month_ranges = self.month_ranges
+        if config_path is not None:
+            self.config_path = config_path
+            compiled = self._load_compiled(config_path)
+        else:
+            compiled = self.compiled
+        if track_configs is not None or legend_groups is not None:
+            config = dict(compiled.config)
+            if track_configs is not None:
+                config['track_configs'] = track_configs
+            if legend_groups is not None:
+                config['legend_groups'] = legend_groups
+            compiled = compile_config(config, source=compiled.source)
+        self._apply_config(compiled)
+        self._refresh_sources()
+
+        if self.month_ranges != old_month_ranges:
+            # Sector geometry changed, nothing on the figure can be reused
+            pyplot().close(state['fig'])
+            fig = self.create_plot(state['center_image'], state['center_image_size'], incremental=True)
+            names = list(self.ops)
+            return {'fig': fig, 'added': names, 'removed': [], 'changed': [], 'legend': True, 'full': True}
+
+        old_ops, new_ops = state['ops'], self.ops
+        removed = [name for name in old_ops if name not in new_ops]
+        added = [name for name in new_ops if name not in old_ops]
+        changed = [name for name in new_ops if name in old_ops and new_ops[name] != old_ops[name]]
+
+        for name in removed + changed:
+            for artist in state['track_artists'].pop(name):
+                artist.remove()
+        for name in changed + added:
+            state['track_artists'][name] = self._draw_op(state['ax'], new_ops[name])
+        state['ops'] = dict(new_ops)
+
+        rebuild_legend = self.legend_groups != state['legend_groups'] or self.palette is not old_palette
+        if rebuild_legend:
+            state['legend_ax'].remove()
+            with self._stage('legend'):
+                state['legend_ax'] = self._add_legend(state['fig'])
+            state['legend_groups'] = self.legend_groups
+
+        return {'fig': state['fig'], 'added': added, 'removed': removed, 'changed': changed,
+                'legend': rebuild_legend, 'full': False}
+
+    def _add_center_image(self, ax, center_image, size):
+        """Draw the center image once, centered on the polar axes."""
+        image = load_center_image(center_image)
+        bounds = (0.5 - size / 2, 0.5 - size / 2, size, size)
+        ax_image = ax.inset_axes(bounds, transform=ax.transAxes)
+        ax_image.axis('off')
+        ax_image.imshow(image)
+
     def _add_legend(self, fig):
         """Add a vertical legend to the right side of the figure."""
+        from matplotlib.lines import Line2D
+        from matplotlib.patches import Patch
+
         legend_groups = self.legend_groups
         all_handles = []
         all_labels = []
@@ -289,9 +719,9 @@ class DecisionCalendar:
                     all_labels.append(' ')
                     continue
 
+                element = self.palette.resolve_config(element)
                 elem_type = element['type']
-                color_key = element['color'] if 'color' in element else None
-                color = self._get_color(color_key) if color_key else 'black'
+                color = element.get('color') or 'black'
                 label = element['label']
 
                 if elem_type == 'patch':
@@ -359,18 +789,111 @@ class DecisionCalendar:
                 text.set_fontweight('bold')
 
         fig.subplots_adjust(right=0.75)  # Adjust main plot to accommodate legend on the right
-
-    def save_plot(self, fig, filename, dpi=1000, bbox_inches='tight', pad_inches=0.1):
-        fig.savefig(filename, dpi=dpi, bbox_inches=bbox_inches, pad_inches=pad_inches)
+        return ax_legend
+
+    def save_plot(self, fig, filename, dpi=1000, bbox_inches='tight', pad_inches=0.1,
+                  max_memory_mb=None, fallback=None):
+        """Save the figure, keeping the raster buffer under max_memory_mb.
+
+        max_memory_mb and fallback default to plot_settings.export in the
+        config. Above the ceiling, PNGs are rendered in strips and streamed to
+        disk ('tiles'), or written as vector output ('pdf'/'svg'). Returns the
+        path written.
+        """
+        export_settings = self.plot_settings.get('export', {})
+        if max_memory_mb is None:
+            max_memory_mb = export_settings.get('max_memory_mb')
+        if fallback is None:
+            fallback = export_settings.get('fallback', 'tiles')
+        with self._stage('save'):
+            return save_figure(fig, filename, dpi=dpi, bbox_inches=bbox_inches, pad_inches=pad_inches,
+                               max_memory_mb=max_memory_mb, fallback=fallback)
+
+    def render_file(self, filename, center_image=None, center_image_size=0.15, dpi=1000, manifest=None,
+                    force=False, bbox_inches='tight', pad_inches=0.1, max_memory_mb=None, fallback=None):
+        """Create and save the plot unless an output of the same inputs already exists.
+
+        The inputs (compiled config, data and image contents, renderer
+        version and output options) are fingerprinted and looked up in
+        manifest, by default render_manifest.json next to filename. On a
+        match nothing is drawn: the existing output is kept, or copied when
+        it was written under another name. force=True always renders.
+        Returns the manifest entry, with 'cached' True if nothing was rendered.
+        """
+        from output_cache import OutputManifest, render_fingerprint
+
+        if manifest is None:
+            manifest = OutputManifest.for_output(filename)
+        elif not isinstance(manifest, OutputManifest):
+            manifest = OutputManifest(manifest)
+        export_settings = self.plot_settings.get('export', {})
+        options = {
+            'format': os.path.splitext(filename)[1].lstrip('.').lower(),
+            'dpi': dpi,
+            'bbox_inches': bbox_inches,
+            'pad_inches': pad_inches,
+            'max_memory_mb': export_settings.get('max_memory_mb') if max_memory_mb is None else max_memory_mb,
+            'fallback': export_settings.get('fallback', 'tiles') if fallback is None else fallback,
+        }
+        fingerprint, inputs = render_fingerprint(self, center_image, center_image_size, options,
+                                                 file_hash=manifest.file_hash)
+
+        entry = None if force else manifest.lookup(fingerprint, filename)
+        if entry is not None:
+            entry = manifest.reuse(filename, entry)
+            manifest.save()
+            return dict(entry, cached=True)
+
+        timings = {}
+        start = time.perf_counter()
+        fig = self.create_plot(center_image=center_image, center_image_size=center_image_size)
+        timings['plot'] = time.perf_counter() - start
+        start = time.perf_counter()
+        try:
+            path = self.save_plot(fig, filename, dpi=dpi, bbox_inches=bbox_inches, pad_inches=pad_inches,
+                                  max_memory_mb=options['max_memory_mb'], fallback=options['fallback'])
+        finally:
+            pyplot().close(fig)
+        timings['save'] = time.perf_counter() - start
+        entry = manifest.record(filename, fingerprint, path, inputs, timings)
+        manifest.save()
+        return dict(entry, cached=False)
+
+    def save_resolutions(self, fig, basename, resolutions=None, max_memory_mb=None):
+        """Save one drawn figure at several dpis, e.g. {'thumbnail': 50, 'web': 150, 'print': 600}.
+
+        Returns {name: path}; files are named '<basename>_<name>.png'.
+        """
+        export_settings = self.plot_settings.get('export', {})
+        if resolutions is None:
+            resolutions = export_settings.get('resolutions')
+        if max_memory_mb is None:
+            max_memory_mb = export_settings.get('max_memory_mb')
+        with self._stage('save'):
+            return export_resolutions(fig, basename, resolutions, max_memory_mb=max_memory_mb,
+                                      fallback=export_settings.get('fallback', 'tiles'))
 
 
 # Example usage
 if __name__ == "__main__":
-    calendar = DecisionCalendar(config_path='../config/chena.yaml', 
-                                streamflow_csv='../data/Chena_Near_Two_Rivers_streamflow.csv', 
-                                swe_csv='../data/Chena_Monument_Creek.csv')
-    center_image = ('../images/alaska_outline.png')
+    import argparse
+
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description="Render a single decision calendar. Use batch.py for many basins.")
+    parser.add_argument('--config', default=os.path.join(repo_dir, 'config', 'chena.yaml'))
+    parser.add_argument('--streamflow-csv', default=None)
+    parser.add_argument('--swe-csv', default=os.path.join(repo_dir, 'data', 'Chena_Monument_Creek.csv'))
+    parser.add_argument('--center-image', default=os.path.join(repo_dir, 'images', 'alaska_outline.png'))
+    parser.add_argument('--output', default=os.path.join(repo_dir, 'output', 'chena_decision_calendars.png'))
+    parser.add_argument('--dpi', type=int, default=1000)
+    args = parser.parse_args()
+
+    calendar = DecisionCalendar(config_path=args.config,
+                                streamflow_csv=args.streamflow_csv or None,
+                                swe_csv=args.swe_csv or None)
 
     # Create and save the decision calendar plot
-    fig = calendar.create_plot(center_image=center_image)
-    calendar.save_plot(fig,'../output/chena_decision_calendars.png')
\ No newline at end of file
+    fig = calendar.create_plot(center_image=args.center_image or None)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    calendar.save_plot(fig, args.output, dpi=args.dpi)
@@ -0,0 +1,179 @@
+"""Memory-bounded export of large decision calendar figures.
+
+A PNG export of a 30 x 16 inch figure at 1000 dpi is a 30000 x 16000 pixel
+RGBA raster (about 1.9 GB) held in memory at once. save_figure() keeps peak
+memory under a ceiling by rendering the figure in horizontal strips and
+streaming them into the PNG file, or by falling back to vector output.
+"""
+import io
+import os
+import struct
+import zlib
+
+import numpy as np
+
+# Formats matplotlib writes as vectors, whose size does not grow with dpi
+VECTOR_FORMATS = ('pdf', 'svg', 'eps', 'ps')
+
+# Named output resolutions for export_resolutions()
+DEFAULT_RESOLUTIONS = {'thumbnail': 50, 'web': 150, 'print': 600}
+
+BYTES_PER_PIXEL = 4
+
+
+def _output_format(filename, format=None):
+    return (format or os.path.splitext(filename)[1].lstrip('.') or 'png').lower()
+
+
+def _pixels(inches, dpi):
+    """Whole pixels of a canvas inches long, truncated as matplotlib's get_width_height() does."""
+    return int(inches * dpi + 1e-8)
+
+
+def _export_bbox(fig, dpi, bbox_inches, pad_inches, bbox_extra_artists=None):
+    """Return the region of the figure to export, in inches, as savefig computes it."""
+    if bbox_inches == 'tight':
+        from matplotlib import rcParams
+
+        # savefig draws the figure at the output dpi before measuring it; text
+        # extents and artists placed at draw time change the box
+        original_dpi = fig.dpi
+        fig.dpi = dpi
+        try:
+            fig.draw_without_rendering()
+            bbox = fig.get_tightbbox(fig.canvas.get_renderer(), bbox_extra_artists=bbox_extra_artists)
+        finally:
+            fig.dpi = original_dpi
+        if pad_inches in (None, 'layout'):
+            pad_inches = rcParams['savefig.pad_inches']
+        return bbox.padded(pad_inches)
+    if bbox_inches is None:
+        return fig.bbox_inches
+    return bbox_inches
+
+
+def estimate_raster_bytes(fig, dpi, bbox_inches='tight', pad_inches=0.1, bbox_extra_artists=None):
+    """Estimate the size of the RGBA buffer needed to rasterize fig at dpi."""
+    bbox = _export_bbox(fig, dpi, bbox_inches, pad_inches, bbox_extra_artists)
+    return _pixels(bbox.width, dpi) * _pixels(bbox.height, dpi) * BYTES_PER_PIXEL
+
+
+def _png_chunk(tag, data):
+    chunk = tag + data
+    return struct.pack('>I', len(data)) + chunk + struct.pack('>I', zlib.crc32(chunk) & 0xffffffff)
+
+
+class _StreamingPNGWriter:
+    """Write an RGBA PNG row block by row block without holding the full image."""
+
+    def __init__(self, file, width, height, dpi):
+        self.file = file
+        self.width = width
+        self.rows_left = height
+        self.compressor = zlib.compressobj(6)
+        file.write(b'\x89PNG\r\n\x1a\n')
+        file.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+        pixels_per_meter = int(round(dpi / 0.0254))
+        file.write(_png_chunk(b'pHYs', struct.pack('>IIB', pixels_per_meter, pixels_per_meter, 1)))
+
+    def write_rows(self, rows):
+        """Append a (n, width, 4) uint8 block of rows."""
+        rows = rows[:self.rows_left]
+        # Every PNG scanline starts with its filter type (0 = none)
+        filtered = np.zeros((rows.shape[0], self.width * BYTES_PER_PIXEL + 1), dtype=np.uint8)
+        filtered[:, 1:] = rows.reshape(rows.shape[0], -1)
+        data = self.compressor.compress(filtered.tobytes())
+        if data:
+            self.file.write(_png_chunk(b'IDAT', data))
+        self.rows_left -= rows.shape[0]
+
+    def close(self):
+        data = self.compressor.flush()
+        if data:
+            self.file.write(_png_chunk(b'IDAT', data))
+        self.file.write(_png_chunk(b'IEND', b''))
+
+
+def save_tiled_png(fig, filename, dpi, bbox_inches='tight', pad_inches=0.1, max_memory_mb=512,
+                   bbox_extra_artists=None):
+    """Rasterize fig in horizontal strips and stream them into a PNG file.
+
+    Each strip is rendered separately, so the largest buffer in memory is one
+    strip of at most max_memory_mb (plus the figure itself). The image has the
+    size and placement savefig gives it; strokes crossing a strip edge may
+    differ in antialiasing and dash phase, as Agg clips them to each strip.
+    """
+    from matplotlib.transforms import Bbox
+
+    bbox = _export_bbox(fig, dpi, bbox_inches, pad_inches, bbox_extra_artists)
+    width = _pixels(bbox.width, dpi)
+    height = _pixels(bbox.height, dpi)
+
+    row_bytes = width * BYTES_PER_PIXEL
+    strip_rows = max(1, min(height, int(max_memory_mb * 1024 * 1024) // (2 * row_bytes)))
+
+    with open(filename, 'wb') as file:
+        writer = _StreamingPNGWriter(file, width, height, dpi)
+        # PNG rows run top to bottom, figure coordinates bottom to top; pixel
+        # rows are anchored at the bottom of the box, where savefig puts them
+        for top in range(0, height, strip_rows):
+            rows = min(strip_rows, height - top)
+            y0 = bbox.y0 + (height - top - rows) / dpi
+            # Half a pixel of slack keeps the canvas from being truncated to rows - 1
+            strip = Bbox.from_extents(bbox.x0, y0, bbox.x0 + (width + 0.5) / dpi, y0 + (rows + 0.5) / dpi)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format='rgba', dpi=dpi, bbox_inches=strip)
+            pixels = np.frombuffer(buffer.getbuffer(), dtype=np.uint8)
+            strip_height = pixels.size // row_bytes
+            pixels = pixels[:strip_height * row_bytes].reshape(strip_height, width, BYTES_PER_PIXEL)
+            writer.write_rows(pixels[:rows])
+            del buffer, pixels
+        writer.close()
+
+
+def save_figure(fig, filename, dpi=1000, bbox_inches='tight', pad_inches=0.1,
+                max_memory_mb=None, fallback='tiles', format=None, bbox_extra_artists=None):
+    """Save fig, keeping the raster buffer under max_memory_mb.
+
+    When the full raster would exceed the ceiling, fallback selects how to
+    export instead: 'tiles' streams a PNG in strips, 'pdf' or 'svg' writes a
+    vector file next to filename. Returns the path that was written.
+    """
+    fmt = _output_format(filename, format)
+    if max_memory_mb is None or fmt in VECTOR_FORMATS:
+        fig.savefig(filename, dpi=dpi, bbox_inches=bbox_inches, pad_inches=pad_inches, format=format,
+                    bbox_extra_artists=bbox_extra_artists)
+        return filename
+
+    if estimate_raster_bytes(fig, dpi, bbox_inches, pad_inches, bbox_extra_artists) <= max_memory_mb * 1024 * 1024:
+        fig.savefig(filename, dpi=dpi, bbox_inches=bbox_inches, pad_inches=pad_inches, format=format,
+                    bbox_extra_artists=bbox_extra_artists)
+        return filename
+
+    if fallback == 'tiles':
+        if fmt != 'png':
+            raise ValueError(f"Tiled export only supports PNG, not '{fmt}'.")
+        save_tiled_png(fig, filename, dpi, bbox_inches, pad_inches, max_memory_mb, bbox_extra_artists)
+        return filename
+    if fallback in VECTOR_FORMATS:
+        vector_filename = f"{os.path.splitext(filename)[0]}.{fallback}"
+        fig.savefig(vector_filename, bbox_inches=bbox_inches, pad_inches=pad_inches,
+                    bbox_extra_artists=bbox_extra_artists)
+        return vector_filename
+    raise ValueError(f"Unknown export fallback '{fallback}'.")
+
+
+def export_resolutions(fig, basename, resolutions=None, max_memory_mb=None, fallback='tiles', **kwargs):
+    """Save one drawn figure at several resolutions.
+
+    resolutions maps a name to a dpi, e.g. {'thumbnail': 50, 'web': 150,
+    'print': 600}; each output is written to '<basename>_<name>.png'.
+    Returns {name: path}.
+    """
+    resolutions = resolutions or DEFAULT_RESOLUTIONS
+    outputs = {}
+    for name, dpi in resolutions.items():
+        filename = f"{basename}_{name}.png"
+        outputs[name] = save_figure(fig, filename, dpi=dpi, max_memory_mb=max_memory_mb,
+                                    fallback=fallback, **kwargs)
+    return outputs
@@ -0,0 +1,225 @@
+"""Compile track configurations into per-month lists of draw operations.
+
+The compiled layout resolves colors, fills in defaults and validates every
+track once, so rendering a sector only visits the operations for its month.
+"""
+from calendar_index import parse_day
+from climatology import DAILY_AGGREGATIONS, DEFAULT_MISSING, MISSING_MODES
+
+STATIC_TRACK_TYPES = ("infill", "arrow", "line", "marker")
+TRACK_TYPES = STATIC_TRACK_TYPES + ("data_plot",)
+
+# Track types drawn as one arc per contiguous span rather than once per month
+ARC_TRACK_TYPES = ("infill", "arrow", "line")
+
+# Colors of overlay years in a data_plot without year_colors
+YEAR_COLORS = ('#d62728', '#2ca02c', '#9467bd', '#ff7f0e', '#8c564b', '#e377c2', '#7f7f7f', '#17becf')
+
+# Linestyles understood by matplotlib
+LINESTYLES = {'-', '--', ':', '-.', 'solid', 'dashed', 'dotted', 'dashdot', 'None', 'none', ' ', ''}
+
+
+def iter_track_configs(track_configs):
+    """Yield (name, config) for every track, expanding list-valued entries.
+
+    Entries of a list-valued track are named 'name[0]', 'name[1]', ... so
+    every yielded name is unique.
+    """
+    for name, track_config in track_configs.items():
+        if isinstance(track_config, list):
+            for i, cfg in enumerate(track_config):
+                yield f"{name}[{i}]", cfg
+        else:
+            yield name, track_config
+
+
+def merge_intervals(intervals, n_slots):
+    """Merge [start, end] slot intervals into the sorted, disjoint runs they cover.
+
+    An interval whose start is after its end wraps across the end of the
+    calendar (e.g. Dec 1 - Jan 15). Runs touching both ends of the calendar
+    are joined into one wrapping interval, so they are drawn as one arc.
+    """
+    split = []
+    for start, end in intervals:
+        if start <= end:
+            split.append((start, end))
+        else:
+            split.extend([(start, n_slots), (1, end)])
+    merged = []
+    for start, end in sorted(split):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    if len(merged) > 1 and merged[0][0] == 1 and merged[-1][1] == n_slots:
+        merged[-1][1] = merged.pop(0)[1]
+    return merged
+
+
+def interval_slots(intervals, n_slots):
+    """The set of slots covered by merged intervals."""
+    slots = set()
+    for start, end in intervals:
+        slots.update(range(start, end + 1) if start <= end else
+                     list(range(start, n_slots + 1)) + list(range(1, end + 1)))
+    return slots
+
+
+def _compile_intervals(name, track_config, months, month_ranges, errors):
+    """Build the interval index of a track from its months and its day-precise spans."""
+    intervals = [month_ranges[month] for month in months]
+    for span in track_config.get('spans') or []:
+        if not (isinstance(span, (list, tuple)) and len(span) == 2):
+            errors.append(f"{name}: spans must be [start, end] pairs, not {span!r}")
+            continue
+        try:
+            (start_month, start_day), (end_month, end_day) = parse_day(span[0]), parse_day(span[1])
+        except ValueError as exc:
+            errors.append(f"{name}: spans: {exc}")
+            continue
+        if start_month not in month_ranges or end_month not in month_ranges:
+            errors.append(f"{name}: span {span} is not in month_ranges")
+            continue
+        intervals.append((month_ranges[start_month][0] + start_day - 1, month_ranges[end_month][0] + end_day - 1))
+    return merge_intervals(intervals, max(end for _, end in month_ranges.values()))
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _compile_track(name, track_config, month_ranges, palette, errors):
+    """Resolve one track config into a draw operation (None if it is invalid)."""
+    track_errors = []
+    track_config = palette.resolve_config(track_config, track_errors)
+    errors.extend(f"{name}: {error}" for error in track_errors)
+
+    ttype = track_config.get('type')
+    if ttype not in TRACK_TYPES:
+        errors.append(f"{name}: unknown track type '{ttype}'")
+        return None
+
+    months = track_config.get('months', [])
+    unknown_months = [m for m in months if m not in month_ranges]
+    if unknown_months:
+        errors.append(f"{name}: months {unknown_months} are not in month_ranges")
+
+    def color(key):
+        if key not in track_config:
+            errors.append(f"{name}: missing '{key}'")
+        return track_config.get(key)
+
+    op = {'name': name, 'type': ttype, 'months': [m for m in dict.fromkeys(months) if m in month_ranges]}
+
+    if ttype in ARC_TRACK_TYPES:
+        op['intervals'] = _compile_intervals(name, track_config, op['months'], month_ranges, errors)
+        if track_config.get('spans'):
+            # Every month a span reaches, so the track shows in the month index and overlap checks
+            slots = interval_slots(op['intervals'], max(end for _, end in month_ranges.values()))
+            op['months'] = [month for month, (start, end) in month_ranges.items()
+                            if not slots.isdisjoint(range(start, end + 1))]
+
+    if ttype == "marker":
+        r_points = track_config.get('r_points', {})
+        missing = [m for m in op['months'] if not _is_number(r_points.get(m))]
+        if missing:
+            errors.append(f"{name}: r_points missing for months {missing}")
+        op.update({
+            'r_points': r_points,
+            'position': track_config.get('position', 0),
+            's': track_config.get('s', 200),
+            'color': color('color'),
+            'marker': track_config.get('marker', 'o'),
+            'linewidth': track_config.get('linewidth', 1),
+        })
+        return op
+
+    r_start = track_config.get('r_start')
+    r_end = track_config.get('r_end')
+    if not (_is_number(r_start) and _is_number(r_end)):
+        errors.append(f"{name}: r_start and r_end must be numbers")
+    elif r_start > r_end:
+        errors.append(f"{name}: r_start ({r_start}) is greater than r_end ({r_end})")
+    op.update({'r_start': r_start, 'r_end': r_end})
+
+    if ttype == "data_plot":
+        if track_config.get('missing', DEFAULT_MISSING) not in MISSING_MODES:
+            errors.append(f"{name}: unknown missing-data mode '{track_config['missing']}'")
+        if not track_config.get('source', track_config.get('data_type')):
+            errors.append(f"{name}: data_plot needs a 'source' or 'data_type'")
+        if track_config.get('daily', 'mean') not in DAILY_AGGREGATIONS:
+            errors.append(f"{name}: unknown daily aggregation '{track_config['daily']}'")
+        min_completeness = track_config.get('min_completeness', 0)
+        if not (_is_number(min_completeness) and 0 <= min_completeness <= 1):
+            errors.append(f"{name}: min_completeness must be between 0 and 1")
+        years = track_config.get('years') or []
+        invalid_years = [year for year in years if year != 'current' and not (_is_number(year) and year == int(year))]
+        if invalid_years:
+            errors.append(f"{name}: years must be integers or 'current', not {invalid_years}")
+        year_colors = []
+        for key in track_config.get('year_colors') or []:
+            try:
+                year_colors.append(palette.color(key))
+            except ValueError as exc:
+                errors.append(f"{name}: year_colors: {exc}")
+        op.update({
+            'data_type': track_config.get('data_type'),
+            'source': track_config.get('source', track_config.get('data_type')),
+            'date_col': track_config.get('date_col'),
+            'value_col': track_config.get('value_col'),
+            'daily': track_config.get('daily'),
+            'min_completeness': track_config.get('min_completeness'),
+            'color_mean': color('color_mean'),
+            'color_envelope': color('color_envelope'),
+            'envelope': track_config.get('envelope', [10, 90]),
+            'missing': track_config.get('missing', DEFAULT_MISSING),
+            'years': list(years),
+            'year_colors': year_colors or list(YEAR_COLORS),
+            'year_linewidth': track_config.get('year_linewidth', 1.5),
+        })
+        return op
+
+    linestyle = track_config.get('linestyle', '-')
+    if isinstance(linestyle, str) and linestyle not in LINESTYLES:
+        errors.append(f"{name}: unknown linestyle '{linestyle}'")
+    op.update({
+        'color': color('color'),
+        'alpha': 0.7 if ttype == "arrow" else track_config.get('alpha', 1.0),
+        'linestyle': linestyle,
+        'linewidth': track_config.get('linewidth', 1),
+    })
+    return op
+
+
+def compile_ops(track_configs, month_ranges, palette):
+    """Compile track configs into {track name: draw operation} in config order.
+
+    Each track's named style is merged in and its colors are resolved through
+    the palette. All problems are collected and reported together in a single
+    ValueError.
+    """
+    errors = []
+    ops = {}
+    for name, track_config in iter_track_configs(track_configs):
+        op = _compile_track(name, track_config, month_ranges, palette, errors)
+        if op is not None:
+            ops[name] = op
+
+    if errors:
+        raise ValueError("Invalid track configuration:\n  " + "\n  ".join(errors))
+    return ops
+
+
+def index_by_month(ops, month_ranges):
+    """Group compiled operations into {month: [draw operation, ...]}, keeping config order."""
+    layout = {month: [] for month in month_ranges}
+    for op in ops.values():
+        for month in op['months']:
+            layout[month].append(op)
+    return layout
+
+
+def compile_layout(track_configs, month_ranges, palette):
+    """Compile track configs into {month: [draw operation, ...]} in config order."""
+    return index_by_month(compile_ops(track_configs, month_ranges, palette), month_ranges)
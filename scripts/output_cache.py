@@ -0,0 +1,231 @@
+"""Skip renders whose inputs have not changed since the output was written.
+
+A render is identified by a fingerprint of everything that determines its
+output: the compiled config, the contents of every data file and of the
+center image, the renderer version and the output options. A manifest
+(render_manifest.json next to the outputs) records which output was
+produced from which inputs, so a render with a known fingerprint is
+answered by the existing file, or a copy of it, instead of being drawn
+again.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from importlib import metadata
+
+import numpy as np
+
+MANIFEST_NAME = 'render_manifest.json'
+MANIFEST_VERSION = 1
+
+# Bump when a change to the drawing code changes the rendered output
+RENDERER_VERSION = 4
+RENDERER_PACKAGES = ('matplotlib', 'pycirclize', 'numpy', 'pandas')
+
+
+def renderer_version():
+    """The drawing code version and the versions of the packages that render it."""
+    versions = {'decision_calendar': RENDERER_VERSION}
+    for package in RENDERER_PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def _hash_json(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _image_hash(image, file_hash):
+    """Hash a center image given as a path, a PIL image or an array."""
+    if image is None:
+        return None
+    if isinstance(image, (str, os.PathLike)):
+        return file_hash(image)
+    if not isinstance(image, np.ndarray):
+        image = np.asarray(image.convert('RGBA'))
+    digest = hashlib.sha256(f"{image.shape}{image.dtype}".encode())
+    digest.update(np.ascontiguousarray(image).tobytes())
+    return digest.hexdigest()
+
+
+def render_fingerprint(calendar, center_image=None, center_image_size=0.15, options=None, file_hash=None):
+    """Return (fingerprint, inputs) of a calendar render.
+
+    The fingerprint depends on file contents, not paths, so identical
+    inputs at another location match. inputs lists the files that were
+    hashed, for the manifest.
+    """
+    file_hash = file_hash or OutputManifest.hash_file
+    files = {}
+
+    def hash_path(path):
+        path = os.path.abspath(path)
+        files[path] = file_hash(path) if os.path.exists(path) else None
+        return files[path]
+
+    sources = {}
+    for name, spec in calendar.sources.sources.items():
+        spec = dict(spec)
+        spec['file'] = hash_path(spec['file'])
+        sources[name] = spec
+    image = hash_path(center_image) if isinstance(center_image, (str, os.PathLike)) else \
+        _image_hash(center_image, file_hash)
+
+    payload = {
+        'renderer': renderer_version(),
+        'config': _hash_json(calendar.config),
+        'year_start': calendar.calendar_index.start_month,
+        'quantiles': list(calendar.quantiles),
+        'histogram_bins': calendar.histogram_bins,
+        'chunksize': calendar.chunksize,
+        'sources': sources,
+        'center_image': image,
+        'center_image_size': center_image_size,
+        'output': options or {},
+    }
+    inputs = {
+        'config': calendar.compiled.source.get('path'),
+        'sources': {name: spec['file'] for name, spec in calendar.sources.sources.items()},
+        'center_image': os.path.abspath(center_image) if isinstance(center_image, (str, os.PathLike)) else None,
+        'output': options or {},
+        'renderer': payload['renderer'],
+        'files': files,
+    }
+    return _hash_json(payload), inputs
+
+
+class OutputManifest:
+    """JSON record of rendered outputs and the fingerprint of the inputs each was made from.
+
+    Output paths are stored relative to the manifest. The content hashes of
+    input files are remembered with their size and mtime, so unchanged
+    files are not hashed again. A read_only manifest records in memory but
+    is never written (batch workers hand their entries to the parent).
+    """
+
+    def __init__(self, path, read_only=False):
+        self.path = os.path.abspath(path)
+        self.read_only = read_only
+        self.artifacts = {}
+        self.files = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as file:
+                data = json.load(file)
+            if data.get('version') == MANIFEST_VERSION:
+                self.artifacts = data.get('artifacts', {})
+                self.files = data.get('files', {})
+
+    @classmethod
+    def for_output(cls, filename, **kwargs):
+        """The manifest in the directory of an output file."""
+        return cls(os.path.join(os.path.dirname(os.path.abspath(filename)), MANIFEST_NAME), **kwargs)
+
+    @staticmethod
+    def hash_file(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def file_hash(self, path):
+        """Content hash of a file, reusing the stored hash while its size and mtime are unchanged."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        known = self.files.get(path)
+        if known and (known['size'], known['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+            return known['sha256']
+        digest = self.hash_file(path)
+        self.files[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+        return digest
+
+    def _key(self, filename):
+        return os.path.relpath(os.path.abspath(filename), os.path.dirname(self.path))
+
+    def _abspath(self, relpath):
+        return os.path.normpath(os.path.join(os.path.dirname(self.path), relpath))
+
+    def _intact(self, entry):
+        """True if the file an entry describes still holds what was written."""
+        path = self._abspath(entry['path'])
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+        if stat.st_size != entry['size']:
+            return False
+        return stat.st_mtime_ns == entry['mtime_ns'] or self.hash_file(path) == entry['sha256']
+
+    def lookup(self, fingerprint, filename):
+        """Return the entry of an intact output made from these inputs, or None.
+
+        The entry for filename is preferred; otherwise any output with the
+        same fingerprint (e.g. the same calendar under another name) matches.
+        """
+        own = self.artifacts.get(self._key(filename))
+        candidates = [own] if own else []
+        candidates.extend(entry for entry in self.artifacts.values() if entry is not own)
+        for entry in candidates:
+            if entry['fingerprint'] == fingerprint and self._intact(entry):
+                return entry
+        return None
+
+    def path_of(self, entry):
+        """Absolute path of the file an entry describes."""
+        return self._abspath(entry['path'])
+
+    def record(self, filename, fingerprint, path, inputs, timings=None):
+        """Add the output written to path (for the requested filename) and return its entry."""
+        stat = os.stat(path)
+        entry = {
+            'fingerprint': fingerprint,
+            'path': self._key(path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': self.hash_file(path),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'inputs': inputs,
+            'timings': timings or {},
+        }
+        self.artifacts[self._key(filename)] = entry
+        return entry
+
+    def reuse(self, filename, entry):
+        """Copy an existing output to filename if needed and return the entry for filename.
+
+        An output written under another extension (a vector fallback) keeps
+        its extension.
+        """
+        source = self.path_of(entry)
+        target = os.path.splitext(os.path.abspath(filename))[0] + os.path.splitext(source)[1]
+        if source == target:
+            return entry
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(source, target)
+        return self.record(filename, entry['fingerprint'], target, entry['inputs'], entry['timings'])
+
+    def input_hashes(self, entry):
+        """The stored hashes of the input files of an entry, to pass to another manifest's add()."""
+        return {path: self.files[path] for path in entry['inputs'].get('files', {}) if path in self.files}
+
+    def add(self, filename, entry, files=None):
+        """Add an entry recorded by another process (e.g. a batch worker) with its input_hashes()."""
+        self.artifacts[self._key(filename)] = entry
+        self.files.update(files or {})
+
+    def save(self):
+        """Write the manifest atomically (a no-op when read_only)."""
+        if self.read_only:
+            return None
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = {'version': MANIFEST_VERSION, 'artifacts': self.artifacts, 'files': self.files}
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(data, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        return self.path
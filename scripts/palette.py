@@ -0,0 +1,146 @@
+"""Flat lookup tables for the `colors` and `styles` sections of a config."""
+import json
+from collections import OrderedDict
+
+# Style properties whose values may reference a color key
+COLOR_PROPERTIES = ('color', 'facecolor', 'edgecolor', 'markerfacecolor', 'markeredgecolor')
+
+# Track and legend properties that always hold a color key
+COLOR_KEY_PROPERTIES = ('color', 'color_mean', 'color_envelope', 'markerfacecolor', 'markeredgecolor')
+
+# Palettes kept in memory, keyed on the content of their colors/styles
+# sections; least recently used evicted first
+PALETTE_CACHE_SIZE = 32
+_PALETTES = OrderedDict()
+
+
+def _flatten(tree, prefix=''):
+    """Flatten a nested dict into {'a.b.c': leaf}."""
+    flat = {}
+    for key, value in tree.items():
+        full_key = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{full_key}."))
+        else:
+            flat[full_key] = value
+    return flat
+
+
+def _is_color_reference(value, colors):
+    """True if a style value names a color key rather than being a literal color.
+
+    Keys of the palette always resolve. Other dotted strings are references
+    unless matplotlib reads them as a color, like the grayscale '0.5'.
+    """
+    if not isinstance(value, str):
+        return False
+    if value in colors:
+        return True
+    if '.' not in value or value.startswith('#'):
+        return False
+    from matplotlib.colors import is_color_like
+    return not is_color_like(value)
+
+
+class Palette:
+    """Colors and styles resolved once into flat lookup tables.
+
+    colors maps dotted keys such as 'hydrological_forecasting.forecast' to
+    color strings. styles maps style names to property dicts in which color
+    references have been replaced by the colors they point to.
+    """
+
+    def __init__(self, colors_config, styles_config=None):
+        flat = _flatten(colors_config or {})
+        self.colors = {key: value for key, value in flat.items() if isinstance(value, str)}
+        self._invalid = {key for key in flat if key not in self.colors}
+        self._groups = {key.rsplit('.', i)[0] for key in flat for i in range(1, key.count('.') + 1)}
+
+        errors = [f"color '{key}' is not a color string" for key in sorted(self._invalid)]
+        self.styles = {}
+        for name, style in (styles_config or {}).items():
+            resolved = dict(style)
+            for prop in COLOR_PROPERTIES:
+                value = resolved.get(prop)
+                if _is_color_reference(value, self.colors):
+                    if value in self.colors:
+                        resolved[prop] = self.colors[value]
+                    else:
+                        errors.append(f"style '{name}': {prop} '{value}' not found in colors")
+            self.styles[name] = resolved
+
+        if errors:
+            raise ValueError("Invalid colors/styles configuration:\n  " + "\n  ".join(errors))
+
+    def color(self, color_key):
+        """Return the color string for a dotted key."""
+        try:
+            return self.colors[color_key]
+        except KeyError:
+            if color_key in self._invalid or color_key in self._groups:
+                raise ValueError(f"Color key '{color_key}' does not resolve to a color string.") from None
+            raise ValueError(f"Color key '{color_key}' not found in configuration.") from None
+
+    def style(self, name):
+        """Return the resolved properties of a named style."""
+        try:
+            return self.styles[name]
+        except KeyError:
+            raise ValueError(f"Style '{name}' not found in configuration.") from None
+
+    def resolve_config(self, config, errors=None):
+        """Return a copy of a track or legend config with its style merged in and colors resolved.
+
+        Properties set on the config override those of its named style. Color
+        keys are replaced by color strings. Problems are appended to errors if
+        given, otherwise the first one is raised as a ValueError.
+        """
+        resolved = {}
+        if 'style' in config:
+            try:
+                resolved.update(self.style(config['style']))
+            except ValueError as exc:
+                if errors is None:
+                    raise
+                errors.append(str(exc))
+        resolved.update(config)
+        for prop in COLOR_KEY_PROPERTIES:
+            if prop in config:
+                try:
+                    resolved[prop] = self.color(config[prop])
+                except ValueError as exc:
+                    if errors is None:
+                        raise
+                    errors.append(str(exc))
+                    resolved[prop] = None
+        return resolved
+
+    def check(self, color_keys=(), style_names=()):
+        """Raise a single ValueError listing every key that does not resolve."""
+        errors = []
+        for key in dict.fromkeys(color_keys):
+            try:
+                self.color(key)
+            except ValueError as exc:
+                errors.append(str(exc))
+        for name in dict.fromkeys(style_names):
+            if name not in self.styles:
+                errors.append(f"Style '{name}' not found in configuration.")
+        if errors:
+            raise ValueError("Unresolved color/style keys:\n  " + "\n  ".join(errors))
+
+
+def load_palette(colors_config, styles_config=None):
+    """Return a Palette for these sections, reusing one built for identical content.
+
+    The last PALETTE_CACHE_SIZE palettes are shared, so a long-running server
+    seeing many edited configs does not grow without bound.
+    """
+    key = json.dumps([colors_config, styles_config], sort_keys=True, default=str)
+    if key in _PALETTES:
+        _PALETTES.move_to_end(key)
+        return _PALETTES[key]
+    palette = _PALETTES[key] = Palette(colors_config, styles_config)
+    while len(_PALETTES) > PALETTE_CACHE_SIZE:
+        _PALETTES.popitem(last=False)
+    return palette
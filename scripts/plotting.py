@@ -0,0 +1,42 @@
+"""Lazy access to the plotting stack (matplotlib and pycirclize).
+
+The config, compile and aggregation layers never import matplotlib, so
+batch workers and services that only aggregate data start without it. The
+plotting stack is imported on first render. In a headless process (no
+display and no backend chosen through MPLBACKEND) the non-interactive Agg
+backend is selected before pyplot is imported.
+"""
+import os
+import sys
+
+# Set DECISION_CALENDAR_HEADLESS=1 to force Agg, or 0 to leave the backend to matplotlib
+HEADLESS_ENV = 'DECISION_CALENDAR_HEADLESS'
+
+
+def is_headless():
+    """Return True if figures can only be rendered to files in this process."""
+    forced = os.environ.get(HEADLESS_ENV)
+    if forced is not None:
+        return forced.strip().lower() not in ('', '0', 'false', 'no')
+    if os.environ.get('MPLBACKEND') or 'ipykernel' in sys.modules:
+        # An explicit backend or a notebook kernel (inline figures) takes precedence
+        return False
+    if sys.platform.startswith('linux'):
+        return not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+    return False
+
+
+def pyplot():
+    """Import and return matplotlib.pyplot, selecting Agg first when headless."""
+    if 'matplotlib.pyplot' not in sys.modules and is_headless():
+        import matplotlib
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def circos_class():
+    """Return pycirclize's Circos class (pycirclize imports pyplot, so the backend is set first)."""
+    pyplot()
+    from pycirclize import Circos
+    return Circos
@@ -0,0 +1,422 @@
+"""Export a calendar as a geometry scene (JSON) or a light SVG, without matplotlib.
+
+The scene is computed from the same compiled draw operations and processed
+series as create_plot(). Angles are degrees clockwise from north, with
+the first calendar day at 0 and day s of n starting at 360 * (s - 1) / n.
+Radii are the r_start/r_end units of the config (sectors span 0-100).
+Bands are annular sectors and lines are arcs. data_plot tracks carry
+their daily mean and envelope as fractions of the track height. Every
+element has a tooltip, and the legend groups are included with their
+resolved colors. scene_svg() draws a scene with native SVG arcs and
+<title> tooltips. Nothing here imports matplotlib, so a scene renders in
+milliseconds once the data is loaded:
+
+    python scene.py ../config/chena.yaml --swe-csv ../data/Chena_Monument_Creek.csv --output chena.svg
+
+The center image is not part of the scene.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import warnings
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+from climatology import scale_factor
+from layout import STATIC_TRACK_TYPES, merge_intervals
+
+SCENE_VERSION = 1
+
+# Radial limit of create_plot()'s polar axes (pycirclize's 100 plus its margin)
+PLOT_RADIUS = 105
+# Fraction of the figure's shorter side the polar axes spans
+AXES_FILL = 0.98
+
+# Styles create_plot() draws with
+SECTOR_OPACITY = 0.5
+SECTOR_LABEL = {'radius': 20, 'size': 15}
+OUTLINE_WIDTH = 0.5
+ARROW_SHAFT_RATIO = 0.3
+ENVELOPE_OPACITY = 0.6
+MEAN_LINEWIDTH = 2
+LEGEND_PATCH_OPACITY = 0.5
+
+# Dash patterns of matplotlib's linestyles, in multiples of the line width
+DASH_PATTERNS = {'--': (3.7, 1.6), ':': (1, 1.65), '-.': (6.4, 1.6, 1, 1.6)}
+
+# Marker outlines as (x, y) on a unit square, y pointing down; 'o' and unknown markers are circles
+MARKER_SHAPES = {
+    's': [(-1, -1), (1, -1), (1, 1), (-1, 1)],
+    'D': [(0, -1), (1, 0), (0, 1), (-1, 0)],
+    '^': [(0, -1), (1, 1), (-1, 1)],
+    'v': [(0, 1), (-1, -1), (1, -1)],
+    '<': [(-1, 0), (1, -1), (1, 1)],
+    '>': [(1, 0), (-1, 1), (-1, -1)],
+    'P': [(-1 / 3, -1), (1 / 3, -1), (1 / 3, -1 / 3), (1, -1 / 3), (1, 1 / 3), (1 / 3, 1 / 3), (1 / 3, 1),
+          (-1 / 3, 1), (-1 / 3, 1 / 3), (-1, 1 / 3), (-1, -1 / 3), (-1 / 3, -1 / 3)],
+    '*': [(math.sin(math.pi * i / 5) * (1 if i % 2 == 0 else 0.38),
+           -math.cos(math.pi * i / 5) * (1 if i % 2 == 0 else 0.38)) for i in range(10)],
+}
+
+
+def slot_angle(slot, n_slots):
+    """Angle (degrees clockwise from north) at which a calendar slot starts."""
+    return 360 * (slot - 1) / n_slots
+
+
+def interval_angles(intervals, n_slots):
+    """Angle range of each [start, end] slot interval; wrapping intervals start below 0."""
+    return [(slot_angle(start, n_slots) - (360 if start > end else 0), 360 * end / n_slots)
+            for start, end in intervals]
+
+
+def slot_label(slot, month_ranges):
+    """'Apr 15' for the calendar slot of April 15."""
+    for month, (start, end) in month_ranges.items():
+        if start <= slot <= end:
+            return f"{month} {slot - start + 1}"
+    raise ValueError(f"Slot {slot} is not in month_ranges.")
+
+
+def _title(name):
+    return name.replace('_', ' ')
+
+
+def _span_tooltip(name, intervals, month_ranges):
+    spans = ', '.join(f"{slot_label(start, month_ranges)} - {slot_label(end, month_ranges)}"
+                      for start, end in intervals)
+    return f"{_title(name)}: {spans}"
+
+
+def _rounded(values, digits):
+    return [None if value is None or not np.isfinite(value) else round(float(value), digits) for value in values]
+
+
+def _track_element(op, month_ranges, n_slots):
+    """Scene element of an infill, arrow, line or marker op."""
+    element = {'name': op['name'], 'type': op['type'], 'color': op['color']}
+    if op['type'] == 'marker':
+        slots = [month_ranges[month][0] + op['position'] for month in op['months']]
+        element.update({
+            'marker': op['marker'], 'size': op['s'], 'linewidth': op['linewidth'],
+            'points': [{'angle': round(slot_angle(slot, n_slots), 3), 'radius': op['r_points'][month],
+                        'tooltip': f"{_title(op['name'])}: {slot_label(int(slot), month_ranges)}"}
+                       for month, slot in zip(op['months'], slots)],
+        })
+        return element
+    angles = [[round(a, 3) for a in pair] for pair in interval_angles(op['intervals'], n_slots)]
+    element.update({'linestyle': op['linestyle'], 'linewidth': op['linewidth'], 'angles': angles,
+                    'tooltip': _span_tooltip(op['name'], op['intervals'], month_ranges)})
+    if op['type'] == 'line':
+        element['radius'] = op['r_start']
+        return element
+    r_start, r_end = op['r_start'], op['r_end']
+    if op['type'] == 'arrow':
+        inset = (r_end - r_start) * (1 - ARROW_SHAFT_RATIO) / 2
+        r_start, r_end = r_start + inset, r_end - inset
+    element.update({'radii': [r_start, r_end], 'opacity': op['alpha']})
+    return element
+
+
+def _data_plot_element(calendar, op, month_ranges, n_slots):
+    """Scene element of a data_plot op, or None if its source has no data."""
+    data = calendar._get_series(op)
+    if data is None:
+        warnings.warn(f"No data available for {op['source']}, track '{op['name']}' is not drawn.")
+        return None
+    mean, low, high, missing = calendar._get_daily_arrays(data, op)
+    scale, years = calendar._get_year_arrays(op, data) if op.get('years') else (1.0, [])
+    hidden = missing[1:] if op['missing'] == 'gap' else np.zeros(n_slots, dtype=bool)
+
+    def fractions(values):
+        values = np.where(hidden, np.nan, values[1:] / scale)
+        return _rounded(values, 4)
+
+    low_q, high_q = op['envelope']
+    intervals = merge_intervals([month_ranges[month] for month in op['months']], n_slots)
+    return {
+        'name': op['name'], 'type': 'data_plot', 'source': op['source'],
+        'radii': [op['r_start'], op['r_end']],
+        'intervals': intervals,
+        'outlines': [[round(a, 3) for a in pair]
+                     for pair in interval_angles([month_ranges[month] for month in op['months']], n_slots)],
+        'color_mean': op['color_mean'], 'color_envelope': op['color_envelope'],
+        'envelope': [low_q, high_q],
+        # Multiply a fraction by value_scale for the value in the units of the data
+        'value_scale': float(scale_factor(data, calendar.quantiles) * scale),
+        'mean': fractions(mean), 'low': fractions(low), 'high': fractions(high),
+        'years': [{'year': int(year), 'color': color, 'linewidth': op['year_linewidth'],
+                   'values': _rounded(values[1:] / scale, 4)} for year, color, values in years],
+        'tooltip': f"{_title(op['name'])}: daily mean and p{low_q}-p{high_q} of {op['source']}",
+    }
+
+
+def _legend(calendar):
+    groups = []
+    for name, group in calendar.legend_groups.items():
+        elements = []
+        for element in group.get('elements') or []:
+            if element.get('type') == 'space':
+                elements.append({'type': 'space'})
+                continue
+            element = calendar.palette.resolve_config(element)
+            entry = {'type': element['type'], 'label': element['label'], 'color': element.get('color') or 'black'}
+            for key in ('linestyle', 'linewidth', 'marker', 'markersize'):
+                if key in element:
+                    entry[key] = element[key]
+            elements.append(entry)
+        groups.append({'name': name, 'title': _title(name), 'description': group.get('description'),
+                       'color': calendar._get_color(group['color']) if 'color' in group else None,
+                       'elements': elements})
+    return groups
+
+
+def calendar_scene(calendar):
+    """Compute the scene of a calendar as a JSON-serializable dict."""
+    with calendar._stage('scene'):
+        month_ranges = calendar.month_ranges
+        n_slots = max(end for _, end in month_ranges.values())
+        figsize = calendar.plot_settings['figsize']['plot']
+        tracks = []
+        for op in calendar.ops.values():
+            if op['type'] in STATIC_TRACK_TYPES:
+                tracks.append(_track_element(op, month_ranges, n_slots))
+            else:
+                element = _data_plot_element(calendar, op, month_ranges, n_slots)
+                if element is not None:
+                    tracks.append(element)
+        return {
+            'version': SCENE_VERSION,
+            'title': (calendar.plot_settings.get('titles') or {}).get('plot'),
+            'days': n_slots,
+            'radius': max([PLOT_RADIUS] + [track['radii'][1] for track in tracks if 'radii' in track]),
+            # Line widths, marker and font sizes are in points; this converts them to radius units
+            'points_per_unit': 72 * min(figsize) * AXES_FILL / 2 / PLOT_RADIUS,
+            'sectors': [{'name': month, 'days': [start, end],
+                         'angles': [round(slot_angle(start, n_slots), 3), round(360 * end / n_slots, 3)]}
+                        for month, (start, end) in month_ranges.items()],
+            'tracks': tracks,
+            'legend': _legend(calendar),
+            'legend_style': {key: calendar.plot_settings['legend'][key]
+                             for key in ('fontsize', 'title_fontsize', 'facecolor', 'edgecolor')},
+        }
+
+
+# SVG rendering of a scene
+
+def _point(radius, angle):
+    theta = math.radians(angle)
+    return f"{radius * math.sin(theta):.2f},{-radius * math.cos(theta):.2f}"
+
+
+def _arc(radius, start, end, reverse=False):
+    """SVG arc commands from the current point along a circle, split so no arc reaches 360 degrees."""
+    steps = max(1, math.ceil((end - start) / 180))
+    angles = np.linspace(start, end, steps + 1)
+    if reverse:
+        angles = angles[::-1]
+    sweep = 0 if reverse else 1
+    return ''.join(f"A{radius:.2f},{radius:.2f} 0 0 {sweep} {_point(radius, angle)}" for angle in angles[1:])
+
+
+def _band_path(r_start, r_end, start, end):
+    path = f"M{_point(r_end, start)}{_arc(r_end, start, end)}"
+    if r_start > 0:
+        return path + f"L{_point(r_start, end)}{_arc(r_start, start, end, reverse=True)}Z"
+    return path + "L0,0Z"
+
+
+def _arc_path(radius, start, end):
+    return f"M{_point(radius, start)}{_arc(radius, start, end)}"
+
+
+def _polyline(points):
+    return 'M' + 'L'.join(_point(radius, angle) for radius, angle in points)
+
+
+def _stroke(color, linewidth, linestyle, unit, opacity=None):
+    """Stroke attributes of a line width and linestyle given in points."""
+    attrs = f'stroke={quoteattr(color)} stroke-width="{linewidth * unit:.3f}"'
+    dashes = DASH_PATTERNS.get(linestyle)
+    if dashes:
+        attrs += f' stroke-dasharray="{",".join(f"{d * linewidth * unit:.3f}" for d in dashes)}"'
+    if opacity is not None and opacity < 1:
+        attrs += f' stroke-opacity="{opacity}"'
+    return attrs
+
+
+def _marker(marker, x, y, size, color, linewidth, unit, tooltip=None):
+    half = math.sqrt(size) / 2 * unit
+    title = f"<title>{escape(tooltip)}</title>" if tooltip else ''
+    style = f'fill={quoteattr(color)} stroke={quoteattr(color)} stroke-width="{linewidth * unit:.3f}"'
+    if marker not in MARKER_SHAPES:
+        return f'<circle cx="{x:.2f}" cy="{y:.2f}" r="{half:.2f}" {style}>{title}</circle>'
+    points = ' '.join(f"{x + px * half:.2f},{y + py * half:.2f}" for px, py in MARKER_SHAPES[marker])
+    return f'<polygon points="{points}" {style}>{title}</polygon>'
+
+
+def _runs(values):
+    """(start, stop) index pairs of the runs of values that are not None."""
+    finite = np.isfinite(np.array(values, dtype=float))
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], finite, [False])).astype(np.int8)))
+    return list(zip(edges[::2], edges[1::2]))
+
+
+def _data_plot_svg(track, n_slots, unit):
+    r_start, r_end = track['radii']
+    parts = [f'<g><title>{escape(track["tooltip"])}</title>']
+    for start, end in track['outlines']:
+        parts.append(f'<path d="{_band_path(r_start, r_end, start, end)}" fill="none" '
+                     f'{_stroke("black", OUTLINE_WIDTH, "-", unit)}/>')
+
+    def radius(fraction):
+        return r_start + min(max(fraction, 0), 1) * (r_end - r_start)
+
+    for a, b in track['intervals']:
+        # Slots of the interval in drawing order, angles kept increasing across the calendar start
+        slots = list(range(a, n_slots + 1)) + list(range(1, b + 1)) if a > b else list(range(a, b + 1))
+        angles = [slot_angle(slot, n_slots) - (360 if a > b and slot >= a else 0) for slot in slots]
+        mean = [track['mean'][slot - 1] for slot in slots]
+        low = [track['low'][slot - 1] for slot in slots]
+        high = [track['high'][slot - 1] for slot in slots]
+        for i, j in _runs(mean):
+            upper = [(radius(high[k]), angles[k]) for k in range(i, j)]
+            lower = [(radius(low[k]), angles[k]) for k in range(j - 1, i - 1, -1)]
+            parts.append(f'<path d="{_polyline(upper + lower)}Z" fill={quoteattr(track["color_envelope"])} '
+                         f'fill-opacity="{ENVELOPE_OPACITY}"/>')
+            parts.append(f'<path d="{_polyline([(radius(mean[k]), angles[k]) for k in range(i, j)])}" '
+                         f'fill="none" {_stroke(track["color_mean"], MEAN_LINEWIDTH, "-", unit)}/>')
+        for year in track['years']:
+            values = [year['values'][slot - 1] for slot in slots]
+            for i, j in _runs(values):
+                parts.append(f'<path d="{_polyline([(radius(values[k]), angles[k]) for k in range(i, j)])}" '
+                             f'fill="none" {_stroke(year["color"], year["linewidth"], "-", unit)}>'
+                             f'<title>{escape(track["name"])} {year["year"]}</title></path>')
+    parts.append('</g>')
+    return ''.join(parts)
+
+
+def _legend_svg(scene, x, y, unit):
+    """Legend groups as rows of swatches and labels from (x, y); returns (svg, width, height)."""
+    style = scene['legend_style']
+    row = style['fontsize'] * 2 * unit
+    size = style['fontsize'] * unit
+    parts = []
+    width = 0
+    top = y
+    y += row
+    for group in scene['legend']:
+        swatch = ''
+        if group['color']:
+            swatch = _marker('s', x + size, y - size / 3, 225, group['color'], 0, unit)
+        parts.append(f'{swatch}<text x="{x + 2.5 * size:.2f}" y="{y:.2f}" font-weight="bold" '
+                     f'font-size="{style["title_fontsize"] * unit:.2f}">{escape(group["title"])}</text>')
+        width = max(width, (3 + 0.6 * len(group['title'])) * size)
+        y += row
+        for element in group['elements']:
+            if element['type'] == 'space':
+                y += row / 2
+                continue
+            cy = y - size / 3
+            if element['type'] == 'patch':
+                parts.append(f'<rect x="{x:.2f}" y="{cy - size / 2:.2f}" width="{2 * size:.2f}" '
+                             f'height="{size:.2f}" fill={quoteattr(element["color"])} '
+                             f'fill-opacity="{LEGEND_PATCH_OPACITY}"/>')
+            elif element['type'] == 'marker':
+                parts.append(_marker(element.get('marker', 'o'), x + size, cy, element.get('markersize', 10) ** 2,
+                                     element['color'], element.get('linewidth', 1), unit))
+            else:
+                stroke = _stroke(element['color'], element.get('linewidth', 1), element.get('linestyle', '-'), unit)
+                parts.append(f'<path d="M{x:.2f},{cy:.2f}h{2 * size:.2f}" fill="none" {stroke}/>')
+            parts.append(f'<text x="{x + 2.5 * size:.2f}" y="{y:.2f}" font-size="{size:.2f}">'
+                         f'{escape(element["label"])}</text>')
+            width = max(width, (3 + 0.55 * len(element['label'])) * size)
+            y += row
+    frame = (f'<rect x="{x - size:.2f}" y="{top:.2f}" width="{width + 2 * size:.2f}" height="{y - top:.2f}" '
+             f'fill={quoteattr(style["facecolor"])} stroke={quoteattr(style["edgecolor"])} '
+             f'stroke-width="{unit:.3f}"/>')
+    return frame + ''.join(parts), width + 2 * size, y - top
+
+
+def scene_svg(scene):
+    """Render a scene from calendar_scene() as an SVG document."""
+    unit = 1 / scene['points_per_unit']
+    n_slots = scene['days']
+    radius = scene['radius']
+    layers = {'sectors': [], 'bands': [], 'lines': [], 'outlines': [], 'data': [], 'markers': [], 'labels': []}
+
+    for sector in scene['sectors']:
+        start, end = sector['angles']
+        layers['sectors'].append(f'<path d="{_band_path(0, 100, start, end)}" fill="none" '
+                                 f'{_stroke("black", OUTLINE_WIDTH, "-", unit, SECTOR_OPACITY)}/>')
+        middle = (start + end) / 2
+        x, y = _point(SECTOR_LABEL['radius'], middle).split(',')
+        layers['labels'].append(f'<text x="{x}" y="{y}" font-size="{SECTOR_LABEL["size"] * unit:.2f}" '
+                                f'text-anchor="middle" dominant-baseline="central">{escape(sector["name"])}</text>')
+
+    for track in scene['tracks']:
+        ttype = track['type']
+        if ttype == 'data_plot':
+            layers['data'].append(_data_plot_svg(track, n_slots, unit))
+        elif ttype == 'marker':
+            for point in track['points']:
+                x, y = (float(v) for v in _point(point['radius'], point['angle']).split(','))
+                layers['markers'].append(_marker(track['marker'], x, y, track['size'], track['color'],
+                                                 track['linewidth'], unit, point['tooltip']))
+        elif ttype == 'line':
+            d = ''.join(_arc_path(track['radius'], start, end) for start, end in track['angles'])
+            stroke = _stroke(track['color'], track['linewidth'], track['linestyle'], unit)
+            layers['lines'].append(f'<path d="{d}" fill="none" {stroke}><title>{escape(track["tooltip"])}</title></path>')
+        else:
+            d = ''.join(_band_path(*track['radii'], start, end) for start, end in track['angles'])
+            title = f'<title>{escape(track["tooltip"])}</title>'
+            fill = f'fill={quoteattr(track["color"])} fill-opacity="{track["opacity"]}"'
+            if ttype == 'arrow':
+                stroke = _stroke(track['color'], track['linewidth'], track['linestyle'], unit, track['opacity'])
+                layers['bands'].append(f'<path d="{d}" {fill} {stroke}>{title}</path>')
+            else:
+                layers['bands'].append(f'<path d="{d}" {fill}>{title}</path>')
+                layers['outlines'].append(f'<path d="{d}" fill="none" {_stroke("black", OUTLINE_WIDTH, "-", unit)}/>')
+
+    legend, legend_width, legend_height = _legend_svg(scene, radius * 1.1, -radius, unit)
+    width = radius * 2.1 + legend_width
+    height = max(2 * radius, legend_height)
+    title = f"<title>{escape(scene['title'])}</title>" if scene.get('title') else ''
+    body = ''.join(f'<g class="{name}">{"".join(parts)}</g>' for name, parts in layers.items())
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="{-radius:.2f} {-radius:.2f} {width:.2f} '
+            f'{height:.2f}" font-family="DejaVu Sans, sans-serif">{title}{body}<g class="legend">{legend}</g></svg>')
+
+
+def write_scene(calendar, path):
+    """Write a calendar's scene as JSON (.json) or SVG (.svg) and return the path."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in ('.json', '.svg'):
+        raise ValueError(f"Unsupported scene format '{extension}'; use .json or .svg.")
+    scene = calendar_scene(calendar)
+    text = json.dumps(scene, separators=(',', ':')) if extension == '.json' else scene_svg(scene)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as file:
+        file.write(text)
+    return path
+
+
+def main(argv=None):
+    from decision_calendars import DecisionCalendar
+
+    parser = argparse.ArgumentParser(description="Export a decision calendar as a JSON scene or SVG.")
+    parser.add_argument('config', help="YAML config or compiled snapshot")
+    parser.add_argument('--streamflow-csv')
+    parser.add_argument('--swe-csv')
+    parser.add_argument('--output', required=True, help="output path ending in .json or .svg")
+    args = parser.parse_args(argv)
+
+    calendar = DecisionCalendar(config_path=args.config, streamflow_csv=args.streamflow_csv, swe_csv=args.swe_csv)
+    print(write_scene(calendar, args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
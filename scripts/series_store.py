@@ -0,0 +1,362 @@
+"""Read station time series from CSV files or from a columnar binary store.
+
+Parsing timestamps dominates loading long CSV records, in particular
+non-ISO stamps like '2011-01-01 1:00' whose format pandas has to infer.
+Sources can give an explicit date_format (strptime codes) or an
+epoch_unit ('s', 'ms', ...) for numeric timestamps, and a CSV can be
+converted once into a store next to it:
+
+    python series_store.py ../data/Ross_streamflow.csv --date-format '%Y-%m-%d %H:%M'
+
+writes Ross_streamflow.series, one file holding the timestamps as
+datetime64 and every numeric column as a float64 array. Stores are memory
+mapped, so a load parses nothing and reads only the columns and date
+range it uses. With pyarrow installed, --format parquet writes
+Ross_streamflow.parquet instead.
+
+Loading a CSV uses the store next to it as long as the store was converted
+from the CSV's current contents; a stale store is ignored with a warning.
+Re-running the command refreshes stale stores with the options they were
+converted with.
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from cache import file_fingerprint
+
+STORE_VERSION = 1
+STORE_SUFFIXES = {'series': '.series', 'parquet': '.parquet'}
+
+# .series layout: MAGIC, column arrays aligned to ALIGN bytes, JSON footer,
+# footer length (little-endian uint64), MAGIC
+MAGIC = b'DCSERIES'
+ALIGN = 64
+FOOTER = struct.Struct('<Q')
+
+# Key of the store metadata in a Parquet schema
+PARQUET_METADATA_KEY = b'decision_calendar'
+
+
+def parse_timestamps(values, date_format=None, epoch_unit=None):
+    """Parse a column of timestamps with an explicit format, as epoch numbers, or inferred."""
+    if date_format is not None and epoch_unit is not None:
+        raise ValueError("Give either date_format or epoch_unit, not both.")
+    if epoch_unit is not None:
+        return pd.to_datetime(values, unit=epoch_unit)
+    return pd.to_datetime(values, format=date_format)
+
+
+def store_path(csv_file, store_format='series'):
+    """Path of the store converted from a CSV: Ross_streamflow.csv -> Ross_streamflow.series."""
+    if store_format not in STORE_SUFFIXES:
+        raise ValueError(f"Unknown store format '{store_format}'; use one of {list(STORE_SUFFIXES)}.")
+    return os.path.splitext(os.fspath(csv_file))[0] + STORE_SUFFIXES[store_format]
+
+
+def is_store(path):
+    return os.path.splitext(os.fspath(path))[1] in STORE_SUFFIXES.values()
+
+
+def _source_fingerprint(path):
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'sha256': file_fingerprint(path, content_hash=True)}
+
+
+def _read_csv(csv_file, date_col, columns, date_format=None, epoch_unit=None, chunksize=None):
+    """Read date_col and columns of a CSV (or an iterator of chunks), timestamps parsed."""
+    reader = pd.read_csv(csv_file, usecols=[date_col, *columns], dtype={col: 'float64' for col in columns},
+                         chunksize=chunksize)
+
+    def parse(frame):
+        frame[date_col] = parse_timestamps(frame[date_col], date_format, epoch_unit)
+        return frame
+
+    if chunksize is None:
+        return parse(reader)
+    return (parse(chunk) for chunk in reader)
+
+
+class SeriesStore:
+    """A .series file, its columns memory mapped on read.
+
+    Rows are sorted by time. meta holds the row count, the date column,
+    each column's dtype and offset, the options the source CSV was parsed
+    with and its fingerprint.
+    """
+
+    def __init__(self, path, meta=None):
+        self.path = os.path.abspath(path)
+        self.meta = meta if meta is not None else self._read_meta()
+
+    def _read_meta(self):
+        with open(self.path, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"'{self.path}' is not a series store.")
+            file.seek(-(FOOTER.size + len(MAGIC)), os.SEEK_END)
+            (length,) = FOOTER.unpack(file.read(FOOTER.size))
+            file.seek(-(length + FOOTER.size + len(MAGIC)), os.SEEK_END)
+            meta = json.loads(file.read(length))
+        if meta.get('version') != STORE_VERSION:
+            raise ValueError(f"'{self.path}' is not a version {STORE_VERSION} series store; convert it again.")
+        return meta
+
+    @staticmethod
+    def write(frame, path, meta):
+        """Write the columns of a DataFrame as a .series file (atomically)."""
+        meta = dict(meta, rows=len(frame), columns={})
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(MAGIC)
+            for name in frame.columns:
+                array = np.ascontiguousarray(frame[name].to_numpy())
+                file.write(b'\0' * (-file.tell() % ALIGN))
+                meta['columns'][name] = {'dtype': array.dtype.str, 'offset': file.tell()}
+                file.write(array.tobytes())
+            footer = json.dumps(meta, sort_keys=True).encode()
+            file.write(footer + FOOTER.pack(len(footer)) + MAGIC)
+        os.replace(tmp_path, path)
+        return SeriesStore(path, meta)
+
+    @property
+    def date_col(self):
+        return self.meta['date_col']
+
+    @property
+    def columns(self):
+        """Value columns held by the store."""
+        return [name for name in self.meta['columns'] if name != self.date_col]
+
+    def array(self, name):
+        """Memory-mapped array of a column."""
+        info = self.meta['columns'][name]
+        if not self.meta['rows']:
+            return np.empty(0, dtype=info['dtype'])
+        return np.memmap(self.path, dtype=info['dtype'], mode='r', offset=info['offset'],
+                         shape=(self.meta['rows'],))
+
+    def _row_range(self, start=None, end=None):
+        if start is None and end is None:
+            return 0, self.meta['rows']
+        dates = self.array(self.date_col)
+        lo = 0 if start is None else np.searchsorted(dates, pd.Timestamp(start).to_datetime64(), 'left')
+        hi = len(dates) if end is None else np.searchsorted(dates, pd.Timestamp(end).to_datetime64(), 'left')
+        return lo, hi
+
+    def read(self, columns, start=None, end=None):
+        """DataFrame of the date column and columns, optionally only rows with start <= date < end."""
+        lo, hi = self._row_range(start, end)
+        return pd.DataFrame({name: self.array(name)[lo:hi] for name in [self.date_col, *columns]})
+
+    def iter_chunks(self, columns, chunksize):
+        """Yield DataFrames of at most chunksize rows."""
+        arrays = {name: self.array(name) for name in [self.date_col, *columns]}
+        for lo in range(0, self.meta['rows'], chunksize):
+            yield pd.DataFrame({name: array[lo:lo + chunksize] for name, array in arrays.items()})
+
+
+class ParquetStore(SeriesStore):
+    """A .parquet store written with pyarrow; columns and date ranges are read selectively."""
+
+    def _read_meta(self):
+        import pyarrow.parquet as pq
+        metadata = pq.read_schema(self.path).metadata or {}
+        if PARQUET_METADATA_KEY not in metadata:
+            raise ValueError(f"'{self.path}' was not written by series_store.py.")
+        meta = json.loads(metadata[PARQUET_METADATA_KEY])
+        if meta.get('version') != STORE_VERSION:
+            raise ValueError(f"'{self.path}' is not a version {STORE_VERSION} series store; convert it again.")
+        return meta
+
+    @staticmethod
+    def write(frame, path, meta):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        meta = dict(meta, rows=len(frame), columns={name: {'dtype': frame[name].dtype.str} for name in frame})
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[PARQUET_METADATA_KEY] = json.dumps(meta, sort_keys=True).encode()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+        os.replace(tmp_path, path)
+        return ParquetStore(path, meta)
+
+    def read(self, columns, start=None, end=None):
+        import pyarrow.parquet as pq
+        filters = []
+        if start is not None:
+            filters.append((self.date_col, '>=', pd.Timestamp(start)))
+        if end is not None:
+            filters.append((self.date_col, '<', pd.Timestamp(end)))
+        table = pq.read_table(self.path, columns=[self.date_col, *columns], filters=filters or None)
+        return table.to_pandas()
+
+    def iter_chunks(self, columns, chunksize):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(self.path).iter_batches(chunksize, columns=[self.date_col, *columns]):
+            yield batch.to_pandas()
+
+
+STORE_CLASSES = {'.series': SeriesStore, '.parquet': ParquetStore}
+
+
+def open_store(path):
+    """Open a .series or .parquet store."""
+    return STORE_CLASSES[os.path.splitext(os.fspath(path))[1]](path)
+
+
+def is_stale(store):
+    """True if the CSV a store was converted from has changed since."""
+    source = store.meta['source']
+    if not os.path.exists(source['path']):
+        return False
+    stat = os.stat(source['path'])
+    if (stat.st_mtime_ns, stat.st_size) == (source['mtime_ns'], source['size']):
+        return False
+    return file_fingerprint(source['path'], content_hash=True) != source['sha256']
+
+
+def _usable_store(path, date_col, columns):
+    """The store to read path from: path itself if it is a store, else a fresh store next to the CSV."""
+    if is_store(path):
+        store = open_store(path)
+        if is_stale(store):
+            warnings.warn(f"Series store '{path}' is older than {store.meta['source']['path']}; "
+                          f"reading the CSV.")
+            return None
+        return store
+    for store_format in STORE_SUFFIXES:
+        candidate = store_path(path, store_format)
+        if not os.path.exists(candidate):
+            continue
+        try:
+            store = open_store(candidate)
+        except (ImportError, ValueError) as exc:
+            warnings.warn(f"Cannot read series store '{candidate}' ({exc}); reading the CSV.")
+            continue
+        if is_stale(store):
+            warnings.warn(f"Series store '{candidate}' is older than {path}; reading the CSV. "
+                          f"Run series_store.py to refresh it.")
+        elif store.date_col == date_col and set(columns) <= set(store.columns):
+            return store
+    return None
+
+
+def _csv_source(path, date_format, epoch_unit):
+    """CSV file and parse options to read path from when no store can be used."""
+    if not is_store(path):
+        return path, date_format, epoch_unit
+    meta = open_store(path).meta
+    return meta['source']['path'], meta['date_format'], meta['epoch_unit']
+
+
+def read_series(path, date_col, columns, date_format=None, epoch_unit=None, start=None, end=None):
+    """Return a DataFrame of date_col (parsed) and the float columns of a CSV or store.
+
+    A store is used when path is one, or when a fresh store sits next to
+    the CSV. start and end select rows with start <= date < end.
+    """
+    store = _usable_store(path, date_col, columns)
+    if store is not None:
+        return store.read(columns, start, end)
+    csv_file, date_format, epoch_unit = _csv_source(path, date_format, epoch_unit)
+    frame = _read_csv(csv_file, date_col, columns, date_format, epoch_unit)
+    if start is not None:
+        frame = frame[frame[date_col] >= pd.Timestamp(start)]
+    if end is not None:
+        frame = frame[frame[date_col] < pd.Timestamp(end)]
+    return frame
+
+
+def iter_series(path, date_col, columns, chunksize, date_format=None, epoch_unit=None):
+    """Like read_series, but yield DataFrames of at most chunksize rows."""
+    store = _usable_store(path, date_col, columns)
+    if store is not None:
+        return store.iter_chunks(columns, chunksize)
+    csv_file, date_format, epoch_unit = _csv_source(path, date_format, epoch_unit)
+    return _read_csv(csv_file, date_col, columns, date_format, epoch_unit, chunksize)
+
+
+def convert(csv_file, store_format='series', date_col='datetime', columns=None, date_format=None,
+            epoch_unit=None):
+    """Convert a CSV into a store next to it and return the store.
+
+    columns defaults to every numeric column. Rows are sorted by time so
+    the store can be sliced by date.
+    """
+    if columns is None:
+        header = pd.read_csv(csv_file, nrows=100)
+        if date_col not in header:
+            raise ValueError(f"'{csv_file}' has no column '{date_col}'.")
+        columns = [col for col in header.select_dtypes('number').columns if col != date_col]
+    frame = _read_csv(csv_file, date_col, columns, date_format, epoch_unit)
+    dates = frame[date_col]
+    if dates.isna().any():
+        raise ValueError(f"'{csv_file}' has {int(dates.isna().sum())} empty timestamps in '{date_col}'.")
+    if not dates.is_monotonic_increasing:
+        frame = frame.sort_values(date_col, kind='stable')
+    meta = {
+        'version': STORE_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'source': _source_fingerprint(csv_file),
+        'date_col': date_col,
+        'date_format': date_format,
+        'epoch_unit': epoch_unit,
+    }
+    path = store_path(csv_file, store_format)
+    return STORE_CLASSES[os.path.splitext(path)[1]].write(frame.reset_index(drop=True), path, meta)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert time series CSVs into columnar binary stores.")
+    parser.add_argument('csv_files', nargs='+', help="CSV files to convert")
+    parser.add_argument('--format', choices=list(STORE_SUFFIXES), default='series',
+                        help="store format (parquet needs pyarrow)")
+    parser.add_argument('--date-col', help="timestamp column (default: datetime)")
+    parser.add_argument('--columns', nargs='+', help="value columns to keep (default: every numeric column)")
+    parser.add_argument('--date-format', help="strptime format of the timestamps, e.g. '%%Y-%%m-%%d %%H:%%M'")
+    parser.add_argument('--epoch-unit', help="timestamps are numbers since 1970 in this unit (s, ms, us, ns)")
+    parser.add_argument('--force', action='store_true', help="convert even if the store is up to date")
+    parser.add_argument('--check', action='store_true', help="only report stores that are missing or stale")
+    args = parser.parse_args(argv)
+
+    outdated = 0
+    for csv_file in args.csv_files:
+        path = store_path(csv_file, args.format)
+        previous = open_store(path) if os.path.exists(path) else None
+        if previous is not None and not args.force and not is_stale(previous):
+            print(f"{csv_file}: {path} is up to date")
+            continue
+        if args.check:
+            print(f"{csv_file}: {path} is {'stale' if previous else 'missing'}")
+            outdated += 1
+            continue
+        # Options not given again are those the store was converted with
+        options = previous.meta if previous is not None else {}
+        columns = args.columns or (previous.columns if previous is not None else None)
+        if args.date_format or args.epoch_unit:
+            date_format, epoch_unit = args.date_format, args.epoch_unit
+        else:
+            date_format, epoch_unit = options.get('date_format'), options.get('epoch_unit')
+        try:
+            store = convert(csv_file, args.format, date_col=args.date_col or options.get('date_col', 'datetime'),
+                            columns=columns, date_format=date_format, epoch_unit=epoch_unit)
+        except (OSError, ValueError, ImportError) as exc:
+            print(f"{csv_file}: {exc}")
+            outdated += 1
+            continue
+        print(f"{csv_file}: wrote {path} ({store.meta['rows']} rows, {', '.join(store.columns)})")
+    return 1 if outdated else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,436 @@
+"""Local HTTP render service with a pool of warm render workers.
+
+Each worker process loads the basins of a manifest once (compiled config,
+climatologies, fonts) and then renders requests from memory. Requests are
+queued for the next free worker, at most `queue` requests wait at a time,
+and rendered outputs are kept in an LRU keyed on the config, data files and
+render options, so repeated requests are answered without rendering.
+
+Usage:
+    python server.py ../config/manifest.yaml --port 8765 --workers 2
+
+    GET  /render?basin=chena&format=png&dpi=150
+    GET  /render?basin=chena&format=scene.svg      (drawn by scene.py, without matplotlib)
+    POST /render  {"basin": "chena", "format": "svg", "overrides": {"plot_settings": {...}}}
+    GET  /stats   GET /health
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Largest raster buffer a worker may hold; larger PNGs are rendered in strips (see export.py)
+DEFAULT_MAX_MEMORY_MB = 1024
+
+CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml', 'pdf': 'application/pdf',
+                 'scene.json': 'application/json', 'scene.svg': 'image/svg+xml'}
+MAX_DPI = 1200
+
+
+class RenderError(Exception):
+    """A request that could not be rendered; carries the HTTP status to answer with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class OutputCache:
+    """Thread-safe LRU of rendered outputs, bounded by total size in bytes."""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._stats['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._bytes)
+
+
+def _render_worker(conn, jobs, state_keys, cache_dir, warm, max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+    """Worker process: keep one calendar per basin in memory and render requests from conn.
+
+    A basin's calendar is rebuilt when the state key of a request (the
+    fingerprint of its config and data files) differs from the one it was
+    loaded with. Figures are saved through save_plot(), so a PNG whose raster
+    would exceed max_memory_mb is streamed in strips instead of held at once.
+    """
+    import warnings
+    warnings.filterwarnings('ignore')
+    from plotting import pyplot
+    plt = pyplot()
+    from decision_calendars import DecisionCalendar
+    from scene import calendar_scene, scene_svg
+
+    cache = None
+    if cache_dir is not None:
+        from cache import ClimatologyCache
+        cache = ClimatologyCache(cache_dir)
+
+    calendars = {}
+
+    def calendar_for(job, state_key):
+        entry = calendars.get(job['basin'])
+        if entry is None or entry[0] != state_key:
+            # New basin, or its config or data changed on disk since it was loaded
+            calendar = DecisionCalendar(config_path=job['config'], streamflow_csv=job['streamflow_csv'],
+                                        swe_csv=job['swe_csv'], cache=cache)
+            entry = calendars[job['basin']] = (state_key, calendar)
+        return entry[1]
+
+    def render(request):
+        job = jobs[request['basin']]
+        calendar = calendar_for(job, request['state_key'])
+        if request.get('overrides'):
+            try:
+                calendar = calendar.with_config(request['overrides'])
+            except ValueError as exc:
+                raise RenderError(400, f"invalid overrides: {exc}") from None
+        if request['format'] == 'scene.json':
+            return json.dumps(calendar_scene(calendar), separators=(',', ':')).encode()
+        if request['format'] == 'scene.svg':
+            return scene_svg(calendar_scene(calendar)).encode()
+        fig = calendar.create_plot(center_image=job['center_image'])
+        try:
+            with tempfile.TemporaryDirectory(prefix='calendar_render_') as tmp_dir:
+                path = os.path.join(tmp_dir, f"render.{request['format']}")
+                calendar.save_plot(fig, path, dpi=request['dpi'], max_memory_mb=max_memory_mb, fallback='tiles')
+                with open(path, 'rb') as file:
+                    return file.read()
+        finally:
+            plt.close(fig)
+
+    if warm:
+        # Load every basin's config and data, and matplotlib's fonts, before taking requests
+        for basin in jobs:
+            try:
+                render({'basin': basin, 'state_key': state_keys[basin], 'format': 'png', 'dpi': 10})
+            except Exception:
+                traceback.print_exc()
+    conn.send({'ready': True})
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        try:
+            conn.send({'status': 'ok', 'data': render(request)})
+        except RenderError as exc:
+            conn.send({'status': 'failed', 'error': str(exc), 'http_status': exc.status})
+        except Exception as exc:
+            conn.send({'status': 'failed', 'error': f"{type(exc).__name__}: {exc}"})
+
+
+class _Worker:
+    def __init__(self, context, args):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_render_worker, args=(child_conn,) + args, daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self, timeout):
+        if not self.conn.poll(timeout):
+            raise RuntimeError("render worker did not start in time")
+        self.conn.recv()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+
+
+class RenderService:
+    """Queue render requests onto a pool of warm worker processes.
+
+    At most `workers` renders run at once and at most `queue` requests wait
+    for a worker; further requests are rejected (HTTP 503). A render that
+    runs past `timeout` seconds kills its worker, which is replaced.
+    """
+
+    def __init__(self, jobs, workers=2, queue_size=16, timeout=300, cache_bytes=256 * 1024 * 1024,
+                 cache_dir=None, warm=True, max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+        from batch import compile_snapshots
+        from compiled_config import read_snapshot
+
+        self._snapshot_dir = tempfile.TemporaryDirectory(prefix='calendar_server_')
+        self._yaml = {job['basin']: job['config'] for job in jobs}
+        runnable, invalid = compile_snapshots(jobs, self._snapshot_dir.name)
+        for report in invalid:
+            print(f"Skipping basin {report['basin']}: {report['error']}", file=sys.stderr)
+        self.jobs = {job['basin']: job for job in runnable}
+        self._compiled = {basin: read_snapshot(job['config']) for basin, job in self.jobs.items()}
+        # Request threads check a basin's YAML one at a time, so an edit is recompiled once
+        self._basin_locks = {basin: threading.Lock() for basin in self.jobs}
+
+        self.timeout = timeout
+        self.cache = OutputCache(cache_bytes)
+        self._context = multiprocessing.get_context('spawn')
+        self._worker_args = (self.jobs, {basin: self.state_key(basin) for basin in self.jobs}, cache_dir, warm,
+                             max_memory_mb)
+        self._idle = queue.Queue()
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'rendered': 0, 'failed': 0, 'rejected': 0, 'timeouts': 0,
+                       'render_seconds': 0.0}
+        self._workers = [_Worker(self._context, self._worker_args) for _ in range(workers)]
+        for worker in self._workers:
+            worker.wait_ready(timeout)
+            self._idle.put(worker)
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def state_key(self, basin):
+        """Fingerprint of everything a basin's render reads from disk: YAML, data files and image.
+
+        A YAML that was deleted or no longer compiles raises a RenderError;
+        the last valid compiled config and its snapshot are kept, so the
+        basin renders again as soon as the YAML is fixed.
+        """
+        import yaml
+
+        from cache import file_fingerprint
+        from compiled_config import compile_file, write_snapshot
+        from sources import normalize_source
+
+        job = self.jobs[basin]
+        with self._basin_locks[basin]:
+            compiled = self._compiled[basin]
+            try:
+                if file_fingerprint(self._yaml[basin], content_hash=True) != compiled.source['sha256']:
+                    # The YAML was edited: recompile it once and let the workers load the new snapshot
+                    edited = compile_file(self._yaml[basin])
+                    write_snapshot(edited, job['config'])
+                    compiled = self._compiled[basin] = edited
+            except (ValueError, yaml.YAMLError) as exc:
+                raise RenderError(400, f"config of basin '{basin}' is invalid: {exc}") from None
+            except OSError as exc:
+                raise RenderError(500, f"config of basin '{basin}' could not be read: {exc}") from None
+        files = [self._yaml[basin], job['streamflow_csv'], job['swe_csv'], job['center_image']]
+        for name, source in (compiled.config.get('data_sources') or {}).items():
+            files.append(normalize_source(name, source, compiled.config_dir)['file'])
+        try:
+            fingerprints = [(path, file_fingerprint(path)) for path in files if path and os.path.exists(path)]
+        except OSError as exc:
+            raise RenderError(500, f"inputs of basin '{basin}' could not be read: {exc}") from None
+        return hashlib.sha256(json.dumps(fingerprints).encode()).hexdigest()
+
+    def render(self, basin, format='png', dpi=150, overrides=None):
+        """Return (bytes, content type, cache hit) for a render request."""
+        self._count('requests')
+        if basin not in self.jobs:
+            raise RenderError(404, f"unknown basin '{basin}'")
+        if format not in CONTENT_TYPES:
+            raise RenderError(400, f"unsupported format '{format}', expected one of {sorted(CONTENT_TYPES)}")
+        try:
+            dpi = int(dpi)
+        except (TypeError, ValueError):
+            raise RenderError(400, f"invalid dpi '{dpi}'") from None
+        if not 1 <= dpi <= MAX_DPI:
+            raise RenderError(400, f"dpi must be between 1 and {MAX_DPI}")
+        if overrides is not None and not isinstance(overrides, dict):
+            raise RenderError(400, "overrides must be an object of config sections")
+
+        request = {'basin': basin, 'format': format, 'dpi': dpi, 'overrides': overrides or None,
+                   'state_key': self.state_key(basin)}
+        key = hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+        data = self.cache.get(key)
+        if data is not None:
+            return data, CONTENT_TYPES[format], True
+
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise RenderError(503, "render queue is full, try again later")
+        try:
+            try:
+                worker = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                self._count('timeouts')
+                raise RenderError(504, f"no render worker free after {self.timeout} s") from None
+            started = time.perf_counter()
+            try:
+                result = self._run(worker, request)
+            finally:
+                self._count('render_seconds', time.perf_counter() - started)
+        finally:
+            self._slots.release()
+
+        if result['status'] != 'ok':
+            self._count('failed')
+            raise RenderError(result.get('http_status', 500), result['error'])
+        self._count('rendered')
+        self.cache.put(key, result['data'])
+        return result['data'], CONTENT_TYPES[format], False
+
+    def _run(self, worker, request):
+        """Send a request to a worker and wait for its reply, replacing the worker if it hangs or dies."""
+        try:
+            worker.conn.send(request)
+            if worker.conn.poll(self.timeout):
+                result = worker.conn.recv()
+                self._idle.put(worker)
+                return result
+            self._count('timeouts')
+            error = RenderError(504, f"render timed out after {self.timeout} s")
+        except (EOFError, OSError) as exc:
+            error = RenderError(500, f"render worker died: {exc}")
+        worker.process.kill()
+        self._replace(worker)
+        raise error
+
+    def _replace(self, worker):
+        def start():
+            new_worker = _Worker(self._context, self._worker_args)
+            new_worker.wait_ready(self.timeout)
+            with self._lock:
+                self._workers[self._workers.index(worker)] = new_worker
+            self._idle.put(new_worker)
+        threading.Thread(target=start, daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, render_seconds=round(self._stats['render_seconds'], 3))
+        stats.update({'workers': len(self._workers), 'idle_workers': self._idle.qsize(),
+                      'basins': sorted(self.jobs), 'output_cache': self.cache.stats()})
+        return stats
+
+    def close(self):
+        for worker in self._workers:
+            worker.stop()
+        self._snapshot_dir.cleanup()
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload).encode())
+
+    def _render(self, params):
+        try:
+            data, content_type, hit = self.service.render(params.get('basin'), params.get('format', 'png'),
+                                                          params.get('dpi', 150), params.get('overrides'))
+        except RenderError as exc:
+            self._send_json(exc.status, {'error': str(exc)})
+            return
+        self._send(200, data, content_type, {'X-Cache': 'hit' if hit else 'miss'})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/render':
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            self._render(params)
+        elif url.path == '/stats':
+            self._send_json(200, self.service.stats())
+        elif url.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': f"unknown path {url.path}"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/render':
+            self._send_json(404, {'error': f"unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            params = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': "request body must be JSON"})
+            return
+        if not isinstance(params, dict):
+            self._send_json(400, {'error': "request body must be a JSON object"})
+            return
+        self._render(params)
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"{self.address_string()} - {format % args}\n")
+
+
+def main(argv=None):
+    from batch import load_manifest
+
+    parser = argparse.ArgumentParser(description="Serve decision calendar renders over HTTP.")
+    parser.add_argument('manifest', help="YAML manifest of the basins to serve (see batch.py)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=2, help="render worker processes")
+    parser.add_argument('--queue', type=int, default=16, help="requests allowed to wait for a worker")
+    parser.add_argument('--timeout', type=float, default=300, help="per-render timeout in seconds")
+    parser.add_argument('--cache-mb', type=int, default=256, help="size of the rendered output LRU")
+    parser.add_argument('--cache-dir', default=None, help="on-disk climatology cache shared by the workers")
+    parser.add_argument('--max-memory-mb', type=int, default=DEFAULT_MAX_MEMORY_MB,
+                        help="largest raster a worker holds; larger PNGs are rendered in strips")
+    parser.add_argument('--no-warm', action='store_true', help="start workers without pre-rendering each basin")
+    args = parser.parse_args(argv)
+
+    service = RenderService(load_manifest(args.manifest), workers=args.workers, queue_size=args.queue,
+                            timeout=args.timeout, cache_bytes=args.cache_mb * 1024 * 1024,
+                            cache_dir=args.cache_dir, warm=not args.no_warm, max_memory_mb=args.max_memory_mb)
+    RenderHandler.service = service
+    server = ThreadingHTTPServer((args.host, args.port), RenderHandler)
+    print(f"Serving {', '.join(sorted(service.jobs))} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
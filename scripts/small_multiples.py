@@ -0,0 +1,120 @@
+"""Draw several decision calendars as small multiples on one figure.
+
+The geometry of the month skeleton (sector outlines and labels) is computed
+once and drawn onto every panel with plain matplotlib artists, and the
+legend is drawn once. Each panel builds its own pycirclize Circos for its
+calendar's tracks and data layers, and the whole grid is written with a
+single savefig, e.g.
+
+    fig = create_small_multiples([chena, ross], titles=['Chena', 'Ross'])
+    chena.save_plot(fig, 'basins.png', dpi=300)
+"""
+import math
+
+from plotting import pyplot
+
+# Fraction of the figure width left of the legend (see DecisionCalendar._add_legend)
+PANELS_WIDTH = 0.75
+
+# Sector outlines and labels as DecisionCalendar draws them through pycirclize's
+# sector.axis(fc="none", alpha=0.5) and sector.text(r=20)
+SECTOR_R_LIM = (0, 100)
+SECTOR_OUTLINE = {'facecolors': 'none', 'edgecolors': 'black', 'linewidths': 0.5, 'alpha': 0.5, 'zorder': 1.01}
+SECTOR_LABEL_R = 20
+
+
+def label_params(rad):
+    """Alignment and rotation of a horizontal sector label at angle rad, as pycirclize's sector.text() sets them."""
+    deg = math.degrees(rad)
+    lower = -270 <= deg < -90 or 90 <= deg < 270
+    return {'ha': 'center', 'va': 'top' if lower else 'bottom',
+            'rotation': 180 - deg if lower else -deg, 'rotation_mode': 'anchor'}
+
+
+def build_skeleton(calendar, label_size=15):
+    """Compute the sector outlines and month labels of a calendar once.
+
+    Returns the outline vertices and the label positions and text settings,
+    which draw_skeleton() turns into artists on any number of polar axes.
+    """
+    from track_artists import band_vertices, interval_radians
+
+    month_ranges = calendar.month_ranges
+    n_slots = max(end for _, end in month_ranges.values())
+    outlines, labels = [], []
+    for name, rad_lim in zip(month_ranges, interval_radians(month_ranges.values(), n_slots)):
+        outlines.append(band_vertices(rad_lim, SECTOR_R_LIM))
+        rad = (rad_lim[0] + rad_lim[1]) / 2
+        labels.append((rad, name, {'size': label_size, **label_params(rad)}))
+    return outlines, labels
+
+
+def draw_skeleton(ax, skeleton):
+    """Add the skeleton's outlines and labels to a polar axes."""
+    from matplotlib.collections import PolyCollection
+
+    outlines, labels = skeleton
+    # An artist belongs to a single axes, so every panel gets its own
+    collection = PolyCollection(outlines, closed=True, clip_on=False, **SECTOR_OUTLINE)
+    # The radial limits are fixed, so skip the data limit update
+    ax.add_collection(collection, autolim=False)
+    for rad, name, text_kwargs in labels:
+        ax.text(rad, SECTOR_LABEL_R, name, zorder=6, **text_kwargs)
+
+
+def draw_panel(calendar, ax):
+    """Draw a calendar's tracks and data layers onto a polar axes."""
+    circos = calendar._new_circos()
+    calendar._add_tracks(circos)
+    with calendar._stage('plotfig'):
+        circos.plotfig(ax=ax)
+    calendar._add_static_tracks(ax)
+
+
+def create_small_multiples(calendars, ncols=3, titles=None, panel_size=8, label_size=10,
+                           center_image=None, center_image_size=0.15, legend=True):
+    """Draw calendars into a grid of polar axes on one figure.
+
+    All calendars must share the same month sectors. The skeleton and the
+    legend are taken from the first calendar, so panels should use the same
+    tracks and legend groups (e.g. one basin over several years, see
+    DecisionCalendar.with_data(), or basins sharing a config template).
+    center_image may be a single image drawn in every panel or a list with
+    one entry per panel. Returns the figure.
+    """
+    calendars = list(calendars)
+    if not calendars:
+        raise ValueError("create_small_multiples() needs at least one calendar.")
+    first = calendars[0]
+    for calendar in calendars[1:]:
+        if calendar.month_ranges != first.month_ranges:
+            raise ValueError(f"Calendar '{calendar.config_path}' has different month sectors "
+                             f"than '{first.config_path}'.")
+    if titles is not None and len(titles) != len(calendars):
+        raise ValueError(f"Got {len(titles)} titles for {len(calendars)} calendars.")
+    if isinstance(center_image, (list, tuple)):
+        if len(center_image) != len(calendars):
+            raise ValueError(f"Got {len(center_image)} center images for {len(calendars)} calendars.")
+        center_images = center_image
+    else:
+        center_images = [center_image] * len(calendars)
+
+    ncols = min(ncols, len(calendars))
+    nrows = math.ceil(len(calendars) / ncols)
+    width = ncols * panel_size / PANELS_WIDTH if legend else ncols * panel_size
+    fig = pyplot().figure(figsize=(width, nrows * panel_size))
+
+    skeleton = build_skeleton(first, label_size)
+    for i, calendar in enumerate(calendars):
+        ax = fig.add_subplot(nrows, ncols, i + 1, projection='polar')
+        draw_panel(calendar, ax)
+        draw_skeleton(ax, skeleton)
+        if center_images[i] is not None:
+            calendar._add_center_image(ax, center_images[i], center_image_size)
+        if titles is not None:
+            ax.set_title(titles[i], fontsize=label_size * 1.5)
+
+    if legend:
+        with first._stage('legend'):
+            first._add_legend(fig)
+    return fig
@@ -0,0 +1,107 @@
+"""Registry of named time series used by data_plot tracks.
+
+Each data source names a CSV file and its default date/value columns. Tracks
+refer to a source by name (`source:`, falling back to `data_type:`) and may
+override the columns. A source may also say how its timestamps are parsed
+(`date_format` or `epoch_unit`, see series_store.py) and how sub-daily
+observations are reduced to daily values (`daily`, `min_completeness`, see
+climatology.DailyResampler); tracks may override the latter. Every unique
+(file, columns, options) spec is loaded once, on first use, and shared by
+all tracks that use it.
+"""
+import os
+
+from climatology import DAILY_AGGREGATIONS, DEFAULT_COMPLETENESS
+
+# Column names of the CSVs passed through streamflow_csv / swe_csv
+DEFAULT_COLUMNS = {
+    'streamflow': {'date_col': 'datetime', 'value_col': 'discharge'},
+    'swe': {'date_col': 'datetime', 'value_col': 'swe'},
+}
+
+SPEC_KEYS = ('file', 'date_col', 'value_col')
+
+# Options passed through to series_store.read_series() and the daily resample stage
+LOAD_KEYS = ('date_format', 'epoch_unit', 'daily', 'min_completeness')
+
+# Daily resample stage of sources that do not configure it
+DAILY_DEFAULTS = {'daily': 'mean', 'min_completeness': DEFAULT_COMPLETENESS}
+
+
+def normalize_source(name, source, base_dir=None):
+    """Turn a path or spec dict into a full spec dict with an absolute file path."""
+    spec = {'file': source} if isinstance(source, (str, os.PathLike)) else dict(source)
+    if 'file' not in spec:
+        raise ValueError(f"Data source '{name}' has no file.")
+    if spec.get('date_format') is not None and spec.get('epoch_unit') is not None:
+        raise ValueError(f"Data source '{name}' gives both date_format and epoch_unit.")
+    for key, value in DEFAULT_COLUMNS.get(name, {'date_col': 'datetime'}).items():
+        spec.setdefault(key, value)
+    for key, value in DAILY_DEFAULTS.items():
+        spec.setdefault(key, value)
+    if spec['daily'] not in DAILY_AGGREGATIONS:
+        raise ValueError(f"Data source '{name}' has unknown daily aggregation '{spec['daily']}'.")
+    if not 0 <= spec['min_completeness'] <= 1:
+        raise ValueError(f"Data source '{name}' has min_completeness outside 0-1.")
+    file = os.fspath(spec['file'])
+    if base_dir is not None and not os.path.isabs(file):
+        file = os.path.join(base_dir, file)
+    spec['file'] = os.path.abspath(file)
+    return spec
+
+
+def load_options(spec):
+    """The parse and daily resample options of a spec, as keyword arguments."""
+    return {key: spec[key] for key in LOAD_KEYS if spec.get(key) is not None}
+
+
+class DataSourceRegistry:
+    """Lazily load and share processed series for named data sources.
+
+    load is called as load(file, value_col, date_col, **options), options
+    being the other keys of the spec (see load_options()), and its result
+    is kept for the life of the registry.
+    """
+
+    def __init__(self, load, sources=None):
+        self._load = load
+        self.sources = dict(sources or {})
+        self._series = {}
+        self._specs = {}
+
+    def register(self, name, source, base_dir=None):
+        """Add or replace a named data source (a path or a spec dict)."""
+        self.sources[name] = normalize_source(name, source, base_dir)
+
+    def resolve(self, name, **overrides):
+        """Return the spec for a source with track overrides applied, or None if unknown."""
+        if name not in self.sources:
+            return None
+        spec = dict(self.sources[name])
+        spec.update({key: value for key, value in overrides.items() if value is not None})
+        if 'value_col' not in spec:
+            raise ValueError(f"Data source '{name}' has no value_col.")
+        return spec
+
+    @staticmethod
+    def spec_key(spec):
+        """Hashable identity of a spec: file, columns and parse options."""
+        return tuple(sorted((key, repr(value)) for key, value in spec.items()))
+
+    def get(self, spec):
+        """Return the processed series for a spec, loading it on first use."""
+        key = self.spec_key(spec)
+        if key not in self._series:
+            options = {k: v for k, v in spec.items() if k not in SPEC_KEYS}
+            self._series[key] = self._load(spec['file'], spec['value_col'], spec['date_col'], **options)
+            self._specs[key] = spec
+        return self._series[key]
+
+    def adopt(self, other):
+        """Reuse the series another registry has already loaded."""
+        self._series.update(other._series)
+        self._specs.update(other._specs)
+
+    def loaded_specs(self):
+        """Specs that have been loaded so far."""
+        return list(self._specs.values())
@@ -0,0 +1,114 @@
+"""Draw static tracks as a handful of matplotlib collections.
+
+Drawing each infill, arrow, line and marker track through pycirclize makes
+one or more artists per track and span, each with its own draw overhead.
+Here all bands (infills and arrow shafts) become one PolyCollection with
+per-item colors and alphas, their outlines one more, all lines one
+LineCollection and all markers one scatter per marker shape. Arcs are
+sampled every ARC_RADIAN_STEP radians like pycirclize's ArcRectangle and
+ArcLine, so the output looks the same.
+"""
+import math
+
+import numpy as np
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import to_rgba
+
+# Angular resolution of arcs, as in pycirclize
+ARC_RADIAN_STEP = 0.01
+
+# Fraction of an arrow track covered by its (headless) shaft
+ARROW_SHAFT_RATIO = 0.3
+
+# Outline drawn around infill spans, as pycirclize's Track.axis() draws it
+OUTLINE = {'edgecolor': 'black', 'linewidth': 0.5}
+
+
+def _arc(rad_start, rad_end):
+    return np.append(np.arange(rad_start, rad_end, ARC_RADIAN_STEP), rad_end)
+
+
+def band_vertices(rad_lim, r_lim):
+    """(theta, r) outline of the band between two radii over an angle range (closed by the collection)."""
+    arc = _arc(*rad_lim)
+    lower = np.column_stack((arc, np.full(len(arc), r_lim[0])))
+    upper = np.column_stack((arc[::-1], np.full(len(arc), r_lim[1])))
+    return np.concatenate((lower, upper))
+
+
+def line_vertices(rad_lim, r):
+    """(theta, r) vertices of an arc at radius r."""
+    arc = _arc(*rad_lim)
+    return np.column_stack((arc, np.full(len(arc), r)))
+
+
+def interval_radians(intervals, n_slots):
+    """Angle range of each [start, end] slot interval; wrapping intervals start below zero."""
+    for start, end in intervals:
+        rad_start = 2 * math.pi * (start - 1) / n_slots - (2 * math.pi if start > end else 0)
+        yield rad_start, 2 * math.pi * end / n_slots
+
+
+def add_static_tracks(ax, ops, month_ranges):
+    """Draw the infill, arrow, line and marker ops onto a calendar's polar axes.
+
+    Items keep config order within each collection. Returns the artists
+    added.
+    """
+    n_slots = max(end for _, end in month_ranges.values())
+    bands = {'verts': [], 'facecolors': [], 'edgecolors': [], 'linewidths': [], 'linestyles': []}
+    lines = {'segments': [], 'colors': [], 'linewidths': [], 'linestyles': []}
+    outlines = []
+    markers = {}
+
+    for op in ops:
+        ttype = op['type']
+        if ttype == 'marker':
+            group = markers.setdefault(op['marker'], {'x': [], 'y': [], 's': [], 'c': [], 'linewidths': []})
+            for month in op['months']:
+                start, _ = month_ranges[month]
+                group['x'].append(2 * math.pi * (start - 1 + op['position']) / n_slots)
+                group['y'].append(op['r_points'][month])
+                group['s'].append(op['s'])
+                group['c'].append(op['color'])
+                group['linewidths'].append(op['linewidth'])
+            continue
+
+        for rad_lim in interval_radians(op['intervals'], n_slots):
+            if ttype == 'line':
+                lines['segments'].append(line_vertices(rad_lim, op['r_start']))
+                lines['colors'].append(op['color'])
+                lines['linewidths'].append(op['linewidth'])
+                lines['linestyles'].append(op['linestyle'])
+                continue
+            r_lim = (op['r_start'], op['r_end'])
+            if ttype == 'arrow':
+                inset = (op['r_end'] - op['r_start']) * (1 - ARROW_SHAFT_RATIO) / 2
+                r_lim = (op['r_start'] + inset, op['r_end'] - inset)
+            verts = band_vertices(rad_lim, r_lim)
+            bands['verts'].append(verts)
+            bands['facecolors'].append(to_rgba(op['color'], op['alpha']))
+            if ttype == 'arrow':
+                bands['edgecolors'].append(to_rgba(op['color'], op['alpha']))
+                bands['linewidths'].append(op['linewidth'])
+                bands['linestyles'].append(op['linestyle'])
+            else:
+                bands['edgecolors'].append('none')
+                bands['linewidths'].append(0)
+                bands['linestyles'].append('-')
+                outlines.append(verts)
+
+    collections = []
+    if bands['verts']:
+        collections.append(PolyCollection(bands.pop('verts'), closed=True, zorder=1, **bands))
+    if lines['segments']:
+        collections.append(LineCollection(lines.pop('segments'), zorder=1, **lines))
+    if outlines:
+        collections.append(PolyCollection(outlines, closed=True, facecolors='none', zorder=1.01, **OUTLINE))
+    added = []
+    for collection in collections:
+        collection.set_clip_on(False)
+        added.append(ax.add_collection(collection, autolim=False))
+    for marker, group in markers.items():
+        added.append(ax.scatter(marker=marker, zorder=5, clip_on=False, **group))
+    return added
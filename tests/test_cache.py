@@ -0,0 +1,95 @@
+"""On-disk climatology cache."""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import cache  # noqa: E402
+from cache import ClimatologyCache  # noqa: E402
+
+
+def _frame(value=1.0):
+    index = pd.RangeIndex(1, 367, name='day_of_year')
+    return pd.DataFrame({'count': np.arange(366), 'mean': np.full(366, value)}, index=index)
+
+
+def _source(tmp_path, text='datetime,flow\n2020-01-01,1\n'):
+    path = tmp_path / 'flow.csv'
+    path.write_text(text)
+    return str(path)
+
+
+def test_miss_then_hit(tmp_path):
+    store = ClimatologyCache(str(tmp_path / 'cache'))
+    key = store.make_key(_source(tmp_path), column='flow', quantiles=(10, 90))
+    assert store.get(key) is None
+
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return _frame()
+
+    first = store.get_or_compute(key, compute)
+    second = store.get_or_compute(key, compute)
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(second, first)
+    stats = store.stats()
+    assert (stats['hits'], stats['misses'], stats['stores'], stats['entries']) == (1, 2, 1, 1)
+
+
+def test_key_changes_with_source_and_parameters(tmp_path, monkeypatch):
+    store = ClimatologyCache(str(tmp_path / 'cache'))
+    csv_file = _source(tmp_path)
+    key = store.make_key(csv_file, column='flow', quantiles=(10, 90))
+    assert store.make_key(csv_file, column='flow', quantiles=(10, 90)) == key
+    assert store.make_key(csv_file, column='flow', quantiles=(25, 75)) != key
+
+    _source(tmp_path, 'datetime,flow\n2020-01-01,2\n2020-01-02,3\n')
+    edited = store.make_key(csv_file, column='flow', quantiles=(10, 90))
+    assert edited != key
+
+    monkeypatch.setattr(cache, 'CACHE_VERSION', cache.CACHE_VERSION + 1)
+    assert store.make_key(csv_file, column='flow', quantiles=(10, 90)) != edited
+
+
+def test_content_hash_ignores_touch(tmp_path):
+    store = ClimatologyCache(str(tmp_path / 'cache'), content_hash=True)
+    csv_file = _source(tmp_path)
+    key = store.make_key(csv_file, column='flow')
+    os.utime(csv_file, ns=(0, 0))
+    assert store.make_key(csv_file, column='flow') == key
+
+
+def test_expired_entries_miss(tmp_path):
+    store = ClimatologyCache(str(tmp_path / 'cache'), max_age=60)
+    store.put('a', _frame())
+    assert store.get('a') is not None
+    old = time.time() - 120
+    os.utime(os.path.join(store.cache_dir, 'a.npz'), (old, old))
+    assert store.get('a') is None
+
+
+def test_prune_evicts_least_recently_used(tmp_path):
+    store = ClimatologyCache(str(tmp_path / 'cache'))
+    for i, key in enumerate('abc'):
+        store.put(key, _frame(i))
+        stamp = time.time() - 100 + i
+        os.utime(os.path.join(store.cache_dir, f'{key}.npz'), (stamp, stamp))
+    store.get('a')
+    store.max_bytes = sum(os.path.getsize(os.path.join(store.cache_dir, f'{key}.npz')) for key in 'ac')
+    store.prune()
+    assert store.get('b') is None
+    assert store.get('a') is not None and store.get('c') is not None
+
+
+def test_corrupt_entry_is_recomputed(tmp_path):
+    store = ClimatologyCache(str(tmp_path / 'cache'))
+    with open(os.path.join(store.cache_dir, 'a.npz'), 'wb') as file:
+        file.write(b'not an archive')
+    assert store.get('a') is None
+    assert not os.path.exists(os.path.join(store.cache_dir, 'a.npz'))
@@ -0,0 +1,56 @@
+"""Calendar slots and years of timestamps."""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from calendar_index import CalendarIndex  # noqa: E402
+
+
+def _dates(*stamps):
+    return pd.Series(pd.to_datetime(list(stamps)))
+
+
+@pytest.mark.parametrize('year_start, leap_slot', [('Jan', 60), ('Oct', 152), ('10-01', 152)])
+def test_leap_slot(year_start, leap_slot):
+    index = CalendarIndex(year_start)
+    assert index.leap_slot == leap_slot
+    assert index.slots(_dates('2024-02-29'))[0] == leap_slot
+
+
+def test_slots_keep_feb_29_reserved():
+    index = CalendarIndex('Jan')
+    # Mar 1 has the same slot in leap and common years
+    slots = index.slots(_dates('2023-01-01', '2023-02-28', '2023-03-01', '2024-03-01', '2023-12-31'))
+    np.testing.assert_array_equal(slots, [1, 59, 61, 61, 366])
+
+
+def test_water_year_slots_and_years():
+    index = CalendarIndex('Oct')
+    dates = _dates('2023-09-30', '2023-10-01', '2023-12-31', '2024-01-01', '2024-09-30')
+    np.testing.assert_array_equal(index.slots(dates), [366, 1, 92, 93, 366])
+    # Oct 2023 to Sep 2024 is water year 2024
+    np.testing.assert_array_equal(index.years(dates), [2023, 2024, 2024, 2024, 2024])
+    assert list(index.month_ranges)[:2] == ['Oct', 'Nov']
+
+
+def test_calendar_years_start_in_january():
+    index = CalendarIndex('Jan')
+    np.testing.assert_array_equal(index.years(_dates('2023-12-31', '2024-01-01')), [2023, 2024])
+
+
+def test_missing_timestamps_get_slot_and_year_zero():
+    index = CalendarIndex('Oct')
+    dates = pd.Series(pd.to_datetime(['2024-02-29', None, '2024-10-15']))
+    np.testing.assert_array_equal(index.slots(dates), [152, 0, 15])
+    np.testing.assert_array_equal(index.years(dates), [2024, 0, 2025])
+
+
+def test_from_config_override():
+    assert CalendarIndex.from_config({'year_start': 'Oct'}).leap_slot == 152
+    assert CalendarIndex.from_config({'year_start': 'Oct'}, year_start='Jan').leap_slot == 60
+    assert CalendarIndex.from_config(None).leap_slot == 60
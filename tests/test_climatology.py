@@ -0,0 +1,95 @@
+"""Daily climatology statistics against pandas."""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from climatology import N_DAYS, DailyAccumulator, compute_daily_climatology, quantile_column  # noqa: E402
+
+QUANTILES = (2.5, 10, 50, 90)
+
+
+def _observations(seed=0, n=20000):
+    """Skewed values on random days, a few NaNs and days 200-210 left empty."""
+    rng = np.random.default_rng(seed)
+    days = rng.integers(1, N_DAYS + 1, n)
+    days = days[(days < 200) | (days > 210)]
+    values = rng.lognormal(3, 1, len(days))
+    values[::97] = np.nan
+    return days, values
+
+
+def _groupby_stats(days, values, quantiles):
+    frame = pd.DataFrame({'day': days, 'value': values}).dropna()
+    grouped = frame.groupby('day')['value']
+    expected = pd.DataFrame({'mean': grouped.mean()})
+    for q in quantiles:
+        expected[quantile_column(q)] = grouped.quantile(q / 100.0)
+    return expected.reindex(range(1, N_DAYS + 1))
+
+
+def test_quantiles_match_groupby():
+    days, values = _observations()
+    stats = compute_daily_climatology(days, values, QUANTILES)
+    expected = _groupby_stats(days, values, QUANTILES)
+    for col in expected.columns:
+        np.testing.assert_allclose(stats[col].to_numpy(), expected[col].to_numpy(), rtol=1e-12)
+    assert stats.loc[200:210, 'count'].eq(0).all()
+    assert stats.loc[200:210, 'mean'].isna().all()
+
+
+def test_missing_timestamps_are_skipped():
+    days, values = _observations(seed=1, n=2000)
+    # Slot 0 is a NaT timestamp and must not land on any day
+    with_nat = compute_daily_climatology(np.concatenate((days, [0, 0])), np.concatenate((values, [1e6, 1e6])),
+                                         QUANTILES)
+    pd.testing.assert_frame_equal(with_nat, compute_daily_climatology(days, values, QUANTILES))
+
+
+@pytest.mark.parametrize('n', [1, 2, 5])
+def test_short_days_interpolate_like_numpy(n):
+    values = np.arange(n, dtype=float) ** 2
+    stats = compute_daily_climatology(np.full(n, 7), values, QUANTILES)
+    for q in QUANTILES:
+        assert stats.loc[7, quantile_column(q)] == pytest.approx(np.percentile(values, q))
+
+
+@pytest.mark.parametrize('chunks', [1, 7])
+def test_accumulator_within_one_bin_width(chunks):
+    days, values = _observations(seed=2)
+    exact = compute_daily_climatology(days, values, QUANTILES)
+    accumulator = DailyAccumulator(bins=512)
+    # Ascending chunks make the histogram range double several times
+    order = np.argsort(values)
+    for part in np.array_split(order, chunks):
+        accumulator.add(days[part], values[part])
+    result = accumulator.result(QUANTILES)
+
+    np.testing.assert_array_equal(result['count'].to_numpy(), exact['count'].to_numpy())
+    np.testing.assert_allclose(result['mean'].to_numpy(), exact['mean'].to_numpy(), rtol=1e-9)
+    for q in QUANTILES:
+        col = quantile_column(q)
+        error = np.abs(result[col] - exact[col]).to_numpy()
+        assert np.nanmax(error) <= accumulator.width
+        np.testing.assert_array_equal(np.isnan(result[col]), np.isnan(exact[col]))
+
+
+def test_merged_accumulators_within_one_bin_width():
+    days, values = _observations(seed=3)
+    exact = compute_daily_climatology(days, values, QUANTILES)
+    merged = DailyAccumulator(bins=512)
+    for part in np.array_split(np.arange(len(days)), 3):
+        other = DailyAccumulator(bins=512)
+        other.add(days[part], values[part])
+        merged.merge(other)
+    result = merged.result(QUANTILES)
+
+    np.testing.assert_array_equal(result['count'].to_numpy(), exact['count'].to_numpy())
+    for q in QUANTILES:
+        col = quantile_column(q)
+        # Re-binning at bin centres adds at most one more width
+        assert np.nanmax(np.abs(result[col] - exact[col]).to_numpy()) <= 2 * merged.width
@@ -0,0 +1,79 @@
+"""Config validation and binary snapshots."""
+import os
+import pickle
+import shutil
+import sys
+
+import pytest
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from compiled_config import (compile_config, compile_file, load_compiled, read_snapshot,  # noqa: E402
+                             snapshot_path, write_snapshot)
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'chena.yaml')
+
+
+def _config():
+    with open(CONFIG, 'r') as file:
+        return yaml.safe_load(file)
+
+
+def test_errors_are_reported_together():
+    config = _config()
+    del config['colors']
+    config['plot_settings']['figsize']['plot'] = [12]
+    with pytest.raises(ValueError) as excinfo:
+        compile_config(config)
+    message = str(excinfo.value)
+    assert "missing 'colors' section" in message
+    assert 'plot_settings.figsize.plot' in message
+
+
+def test_track_and_legend_errors_are_reported_together():
+    config = _config()
+    group = next(iter(config['legend_groups']))
+    config['legend_groups'][group]['elements'].append({'type': 'circle', 'label': 'x'})
+    config['track_configs']['bogus'] = 'not a mapping'
+    with pytest.raises(ValueError) as excinfo:
+        compile_config(config)
+    message = str(excinfo.value)
+    assert "unknown type 'circle'" in message
+    assert "track 'bogus' must be a mapping" in message
+
+
+def test_snapshot_round_trip(tmp_path):
+    compiled = compile_file(CONFIG)
+    path = write_snapshot(compiled, str(tmp_path / 'chena.calendar.pkl'))
+    loaded = read_snapshot(path)
+    assert loaded.ops == compiled.ops
+    assert loaded.month_ranges == compiled.month_ranges
+    assert loaded.config == compiled.config
+    assert loaded.source == compiled.source
+
+
+def test_snapshot_version_mismatch(tmp_path):
+    path = write_snapshot(compile_file(CONFIG), str(tmp_path / 'chena.calendar.pkl'))
+    with open(path, 'rb') as file:
+        payload = pickle.load(file)
+    payload['version'] -= 1
+    with open(path, 'wb') as file:
+        pickle.dump(payload, file)
+    with pytest.raises(ValueError, match='recompile'):
+        read_snapshot(path)
+
+
+def test_stale_snapshot_is_recompiled(tmp_path):
+    config_path = str(tmp_path / 'chena.yaml')
+    shutil.copyfile(CONFIG, config_path)
+    path = write_snapshot(compile_file(config_path), snapshot_path(config_path))
+    assert load_compiled(path).source['path'] == os.path.abspath(config_path)
+
+    config = _config()
+    config['track_configs']['annual_activities']['alpha'] = 0.25
+    with open(config_path, 'w') as file:
+        yaml.safe_dump(config, file)
+    with pytest.warns(UserWarning, match='recompiling'):
+        compiled = load_compiled(path)
+    assert compiled.ops['annual_activities']['alpha'] == 0.25
@@ -0,0 +1,80 @@
+"""Tiled PNG export against matplotlib's own savefig."""
+import os
+import sys
+
+import matplotlib
+import numpy as np
+import pytest
+
+matplotlib.use('Agg')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import matplotlib.pyplot as plt  # noqa: E402
+from matplotlib.patches import Rectangle, Wedge  # noqa: E402
+
+from export import save_figure, save_tiled_png  # noqa: E402
+
+DPI = 60
+
+
+def _figure():
+    """Filled shapes, text and a legend axes outside the plot, without strokes crossing strips."""
+    fig = plt.figure(figsize=(8, 5))
+    ax = fig.add_axes([0.05, 0.05, 0.6, 0.9])
+    ax.set_axis_off()
+    ax.set_xlim(0, 1)
+    ax.set_ylim(0, 1)
+    ax.add_patch(Wedge((0.5, 0.5), 0.45, 10, 250, width=0.15, facecolor='tab:blue', alpha=0.6))
+    ax.add_patch(Rectangle((0.1, 0.1), 0.3, 0.2, facecolor='tab:green'))
+    ax.text(0.5, 0.5, 'Chena River', ha='center', fontsize=18)
+    ax_legend = fig.add_axes([0.7, 0.1, 0.25, 0.8])
+    ax_legend.set_axis_off()
+    for i in range(8):
+        ax_legend.add_patch(Rectangle((0, i / 8), 0.1, 0.08, facecolor=f'C{i}'))
+        ax_legend.text(0.15, i / 8, f'Legend entry {i}', fontsize=9)
+    # Text beyond the figure edge, which only the tight box includes
+    ax_legend.text(1.1, 0.5, 'outside', fontsize=12)
+    return fig
+
+
+def _read(path):
+    return np.asarray(plt.imread(path))
+
+
+# One strip, and strips of a dozen rows and of two rows
+@pytest.mark.parametrize('max_memory_mb', [512, 0.05, 0.01])
+def test_tiled_png_matches_savefig(tmp_path, max_memory_mb):
+    fig = _figure()
+    expected = tmp_path / 'savefig.png'
+    tiled = tmp_path / 'tiled.png'
+    fig.savefig(expected, dpi=DPI, bbox_inches='tight', pad_inches=0.1)
+    save_tiled_png(fig, str(tiled), DPI, max_memory_mb=max_memory_mb)
+    plt.close(fig)
+    np.testing.assert_array_equal(_read(tiled), _read(expected))
+
+
+def test_save_figure_falls_back_to_tiles(tmp_path):
+    fig = _figure()
+    expected = tmp_path / 'savefig.png'
+    tiled = tmp_path / 'tiled.png'
+    fig.savefig(expected, dpi=DPI, bbox_inches='tight', pad_inches=0.1)
+    assert save_figure(fig, str(tiled), dpi=DPI, max_memory_mb=0.05) == str(tiled)
+    plt.close(fig)
+    np.testing.assert_array_equal(_read(tiled), _read(expected))
+
+
+def test_tiled_calendar_has_savefig_size(tmp_path):
+    from decision_calendars import DecisionCalendar
+
+    config = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'chena.yaml')
+    fig = DecisionCalendar(config).create_plot()
+    expected = tmp_path / 'savefig.png'
+    fig.savefig(expected, dpi=DPI, bbox_inches='tight', pad_inches=0.1)
+    save_tiled_png(fig, str(tmp_path / 'one.png'), DPI)
+    save_tiled_png(fig, str(tmp_path / 'strips.png'), DPI, max_memory_mb=1)
+    plt.close(fig)
+    # One strip is the same image; strips keep its size and placement, only
+    # strokes crossing strip edges are antialiased differently
+    np.testing.assert_array_equal(_read(tmp_path / 'one.png'), _read(expected))
+    assert _read(tmp_path / 'strips.png').shape == _read(expected).shape
@@ -0,0 +1,75 @@
+"""Incremental re-rendering with update_plot()."""
+import copy
+import os
+import sys
+
+import matplotlib
+import pytest
+
+matplotlib.use('Agg')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import matplotlib.pyplot as plt  # noqa: E402
+
+from decision_calendars import DecisionCalendar  # noqa: E402
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'chena.yaml')
+
+
+@pytest.fixture
+def calendar():
+    calendar = DecisionCalendar(CONFIG)
+    fig = calendar.create_plot(incremental=True)
+    yield calendar
+    plt.close(fig)
+
+
+def _artists(calendar):
+    return {name: list(artists) for name, artists in calendar._render_state['track_artists'].items()}
+
+
+def test_only_changed_track_is_redrawn(calendar):
+    before = _artists(calendar)
+    assert before['annual_activities']
+    ax = calendar._render_state['ax']
+    track_configs = copy.deepcopy(calendar.compiled.config['track_configs'])
+    track_configs['annual_activities']['alpha'] = 0.2
+
+    summary = calendar.update_plot(track_configs=track_configs)
+    assert summary['changed'] == ['annual_activities']
+    assert (summary['added'], summary['removed'], summary['legend'], summary['full']) == ([], [], False, False)
+
+    after = _artists(calendar)
+    for name, artists in before.items():
+        if name == 'annual_activities':
+            assert all(artist.axes is None for artist in artists)
+            assert all(artist.axes is ax for artist in after[name])
+        else:
+            assert all(a is b for a, b in zip(after[name], artists, strict=True))
+
+
+def test_unchanged_config_redraws_nothing(calendar):
+    before = _artists(calendar)
+    legend_ax = calendar._render_state['legend_ax']
+    summary = calendar.update_plot(track_configs=copy.deepcopy(calendar.compiled.config['track_configs']))
+    assert (summary['added'], summary['removed'], summary['changed']) == ([], [], [])
+    assert calendar._render_state['legend_ax'] is legend_ax
+    assert all(a is b for name in before for a, b in zip(_artists(calendar)[name], before[name], strict=True))
+
+
+def test_removed_track_leaves_the_figure(calendar):
+    removed = calendar._render_state['track_artists']['annual_activities']
+    track_configs = copy.deepcopy(calendar.compiled.config['track_configs'])
+    del track_configs['annual_activities']
+
+    summary = calendar.update_plot(track_configs=track_configs)
+    assert summary['removed'] == ['annual_activities']
+    assert 'annual_activities' not in calendar._render_state['track_artists']
+    assert all(artist.axes is None for artist in removed)
+
+
+def test_needs_incremental_figure():
+    calendar = DecisionCalendar(CONFIG)
+    with pytest.raises(ValueError, match='incremental=True'):
+        calendar.update_plot()
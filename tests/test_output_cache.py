@@ -0,0 +1,95 @@
+"""Skipping renders whose inputs have not changed."""
+import os
+import shutil
+import sys
+
+import matplotlib
+import pytest
+import yaml
+
+matplotlib.use('Agg')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from decision_calendars import DecisionCalendar  # noqa: E402
+from output_cache import MANIFEST_NAME, OutputManifest  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG = os.path.join(REPO_DIR, 'config', 'chena.yaml')
+SWE_CSV = os.path.join(REPO_DIR, 'data', 'Chena_Monument_Creek.csv')
+DPI = 20
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / 'chena.yaml'
+    shutil.copyfile(CONFIG, path)
+    shutil.copyfile(SWE_CSV, tmp_path / 'swe.csv')
+    return str(path)
+
+
+def _render(config_path, filename, **kwargs):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    swe_csv = os.path.join(os.path.dirname(config_path), 'swe.csv')
+    return DecisionCalendar(config_path, swe_csv=swe_csv).render_file(str(filename), dpi=DPI, **kwargs)
+
+
+def test_unchanged_render_is_skipped(tmp_path, config_path):
+    output = tmp_path / 'out' / 'chena.png'
+    first = _render(config_path, output)
+    assert not first['cached']
+    mtime = os.stat(output).st_mtime_ns
+
+    second = _render(config_path, output)
+    assert second['cached']
+    assert second['sha256'] == first['sha256']
+    assert os.stat(output).st_mtime_ns == mtime
+    assert os.path.exists(tmp_path / 'out' / MANIFEST_NAME)
+
+
+def test_changed_inputs_render_again(tmp_path, config_path):
+    output = tmp_path / 'chena.png'
+    first = _render(config_path, output)
+    assert not _render(config_path, output, pad_inches=0.2)['cached']
+
+    with open(config_path, 'r') as file:
+        config = yaml.safe_load(file)
+    config['track_configs']['annual_activities']['alpha'] = 0.25
+    with open(config_path, 'w') as file:
+        yaml.safe_dump(config, file)
+    changed = _render(config_path, output)
+    assert not changed['cached']
+    assert changed['fingerprint'] != first['fingerprint']
+
+
+def test_edited_data_renders_again(tmp_path, config_path):
+    output = tmp_path / 'chena.png'
+    _render(config_path, output)
+    with open(tmp_path / 'swe.csv', 'r') as file:
+        lines = file.readlines()
+    with open(tmp_path / 'swe.csv', 'w') as file:
+        file.writelines(lines[:len(lines) // 2])
+    assert not _render(config_path, output)['cached']
+
+
+def test_edited_output_is_rendered_again(tmp_path, config_path):
+    output = tmp_path / 'chena.png'
+    _render(config_path, output)
+    with open(output, 'ab') as file:
+        file.write(b'\0')
+    assert not _render(config_path, output)['cached']
+
+
+def test_same_inputs_under_another_name_are_copied(tmp_path, config_path):
+    first = _render(config_path, tmp_path / 'chena.png')
+    copy = _render(config_path, tmp_path / 'copy.png')
+    assert copy['cached']
+    assert copy['sha256'] == first['sha256']
+    manifest = OutputManifest(str(tmp_path / MANIFEST_NAME))
+    assert sorted(manifest.artifacts) == ['chena.png', 'copy.png']
+
+
+def test_force_renders(tmp_path, config_path):
+    output = tmp_path / 'chena.png'
+    _render(config_path, output)
+    assert not _render(config_path, output, force=True)['cached']
@@ -0,0 +1,92 @@
+"""Columnar series stores against the CSVs they were converted from."""
+import os
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from series_store import convert, is_stale, open_store, read_series, store_path  # noqa: E402
+
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+
+
+def _write_csv(path, hours=500, offset=0.0):
+    """Hourly flow and stage with non-ISO stamps like '2024-01-01 1:00' and one blank value."""
+    dates = pd.date_range('2023-12-30', periods=hours, freq='h')
+    flow = np.arange(hours, dtype=float) + offset
+    flow[10] = np.nan
+    stamps = [f"{d:%Y-%m-%d} {d.hour}:{d:%M}" for d in dates]
+    pd.DataFrame({'datetime': stamps, 'flow': flow, 'stage': flow / 10}).to_csv(path, index=False)
+    return pd.DataFrame({'datetime': dates, 'flow': flow, 'stage': flow / 10})
+
+
+@pytest.fixture(params=['series', 'parquet'])
+def store_format(request):
+    if request.param == 'parquet':
+        pytest.importorskip('pyarrow')
+    return request.param
+
+
+def test_round_trip(tmp_path, store_format):
+    csv_file = tmp_path / 'Ross_streamflow.csv'
+    expected = _write_csv(csv_file)
+    store = convert(str(csv_file), store_format, date_format=DATE_FORMAT)
+    assert store.path == store_path(str(csv_file), store_format)
+    assert sorted(store.columns) == ['flow', 'stage']
+
+    frame = read_series(store.path, 'datetime', ['flow', 'stage'])
+    pd.testing.assert_frame_equal(frame.reset_index(drop=True), expected, check_dtype=False)
+    # The CSV path reads the fresh store next to it
+    from_csv = read_series(str(csv_file), 'datetime', ['flow'])
+    pd.testing.assert_frame_equal(from_csv.reset_index(drop=True), expected[['datetime', 'flow']],
+                                  check_dtype=False)
+
+
+def test_date_range(tmp_path, store_format):
+    csv_file = tmp_path / 'flow.csv'
+    expected = _write_csv(csv_file)
+    store = convert(str(csv_file), store_format, date_format=DATE_FORMAT)
+    frame = read_series(store.path, 'datetime', ['flow'], start='2024-01-01', end='2024-01-02')
+    selected = expected[(expected['datetime'] >= '2024-01-01') & (expected['datetime'] < '2024-01-02')]
+    assert len(frame) == 24
+    np.testing.assert_array_equal(frame['flow'].to_numpy(), selected['flow'].to_numpy())
+
+
+def test_stale_store_falls_back_to_csv(tmp_path, store_format):
+    csv_file = tmp_path / 'flow.csv'
+    _write_csv(csv_file)
+    store = convert(str(csv_file), store_format, date_format=DATE_FORMAT)
+    assert not is_stale(open_store(store.path))
+
+    edited = _write_csv(csv_file, hours=600, offset=1000.0)
+    assert is_stale(open_store(store.path))
+    with pytest.warns(UserWarning, match='older than'):
+        frame = read_series(str(csv_file), 'datetime', ['flow'], date_format=DATE_FORMAT)
+    np.testing.assert_array_equal(frame['flow'].to_numpy(), edited['flow'].to_numpy())
+    # Reading the stale store itself re-reads its CSV with the options it was converted with
+    with pytest.warns(UserWarning, match='older than'):
+        frame = read_series(store.path, 'datetime', ['flow'])
+    assert len(frame) == 600
+
+
+def test_touched_csv_is_not_stale(tmp_path):
+    csv_file = tmp_path / 'flow.csv'
+    _write_csv(csv_file)
+    store = convert(str(csv_file), date_format=DATE_FORMAT)
+    os.utime(csv_file, ns=(0, 0))
+    assert not is_stale(open_store(store.path))
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        read_series(str(csv_file), 'datetime', ['flow'])
+
+
+def test_store_missing_a_column_is_not_used(tmp_path):
+    csv_file = tmp_path / 'flow.csv'
+    _write_csv(csv_file)
+    convert(str(csv_file), columns=['flow'], date_format=DATE_FORMAT)
+    frame = read_series(str(csv_file), 'datetime', ['flow', 'stage'], date_format=DATE_FORMAT)
+    assert list(frame.columns) == ['datetime', 'flow', 'stage']